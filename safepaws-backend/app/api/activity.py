@@ -1,40 +1,68 @@
 from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from app.db.session import get_db
-from app.db.models import ActivityLog, Cat, AdoptionListing, User, CatLocation
+from app.db.models import ActivityLog
 from app.db.auth import get_current_user_id
 from app.db.schemas import ActivityLogOut, ActivityLogCreate
+from app.core.rate_limit import rate_limit
+from app.core.invalidation import publish, CACHE
+from app.core.responses import FastJSONResponse
+from app.core.singleflight import coalesce
+from app.db import activity_buffer, stats
+from app.db.uow import unit_of_work, after_commit, in_unit_of_work
+from app.db.statements import (
+    ACTIVITY_FOR_USER, ACTIVITY_FOR_CAT_NEWEST, ACTIVITY_FOR_CAT_OLDEST,
+    CAT_EXISTS, CONTRIBUTION_TARGET, LISTING_UPLOADER_FOR_CAT,
+)
 
 router = APIRouter(prefix="/activity", tags=["Activity"])
 
 
+def activity_entry(log) -> dict:
+    """Public timeline entry for an ACTIVITY_COLUMNS row, typed from its description."""
+    # Detect activity type from description
+    activity_type = "contribution"
+    if log.activity_description:
+        desc_upper = log.activity_description.upper()
+        if "CONDITION CHANGED TO URGENT" in desc_upper:
+            activity_type = "condition_change_urgent"
+        elif "CONDITION CHANGED TO AT VET" in desc_upper:
+            activity_type = "condition_change_at_vet"
+        elif "MARKED AS ADOPTED" in desc_upper or "MARKED AS PASSED" in desc_upper:
+            activity_type = "condition_change"
+
+    return {
+        "log_id": log.log_id,
+        "activity_time": log.activity_time.isoformat() if log.activity_time else "",
+        "activity_description": log.activity_description,
+        "cat_id": log.cat_id,
+        "user_id": log.user_id,
+        "username": log.username,
+        "activity_type": activity_type,
+    }
+
+
 # ------------------------------
 # 1) LIST MY OWN ACTIVITY
 # ------------------------------
 @router.get("/my", response_model=list[ActivityLogOut])
 def list_my_activity(db: Session = Depends(get_db), current_user: int = Depends(get_current_user_id)):
-    logs = (
-        db.query(ActivityLog, User)
-        .outerjoin(User, ActivityLog.user_id == User.user_id)
-        .filter(ActivityLog.user_id == current_user)
-        .order_by(ActivityLog.activity_time.desc())
-        .all()
-    )
+    logs = db.execute(ACTIVITY_FOR_USER, {"user_id": current_user}).all()
 
     result = []
-    for log, user in logs:
+    for log in logs:
         log_dict = {
             "log_id": log.log_id,
             "activity_time": log.activity_time.isoformat() if log.activity_time else "",
             "activity_description": log.activity_description,
             "cat_id": log.cat_id,
             "user_id": log.user_id,
-            "username": user.username if user else None,
+            "username": log.username,
             "activity_type": "contribution",
         }
         result.append(log_dict)
 
-    return result
+    return FastJSONResponse(result)
 
 # ------------------------------
 # 2) LIST ACTIVITY BY CAT
@@ -46,122 +74,101 @@ def list_cat_activity(
     current_user: int = Depends(get_current_user_id)
 ):
     # Check if cat exists
-    cat = db.query(Cat).filter(Cat.cat_id == cat_id).first()
-    if not cat:
+    if db.execute(CAT_EXISTS, {"cat_id": cat_id}).scalar() is None:
         raise HTTPException(status_code=404, detail="Cat not found")
 
     # Check if cat has active listing (meaning currently for adoption)
-    active_listing = (
-        db.query(AdoptionListing)
-        .filter(AdoptionListing.cat_id == cat_id)
-        .first()
-    )
+    listing_uploader = db.execute(LISTING_UPLOADER_FOR_CAT, {"cat_id": cat_id}).scalar()
 
     # If currently listed for adoption → only the owner can view activity
-    if active_listing and active_listing.uploader_id != current_user:
+    if listing_uploader is not None and listing_uploader != current_user:
         raise HTTPException(
             status_code=403,
             detail="Not allowed to view this activity while cat is listed for adoption"
         )
 
-    # Otherwise: return the activity
-    logs = (
-        db.query(ActivityLog, User)
-        .outerjoin(User, ActivityLog.user_id == User.user_id)
-        .filter(ActivityLog.cat_id == cat_id)
-        .order_by(ActivityLog.activity_time.desc())
-        .all()
-    )
+    # Otherwise: return the activity, newest first, with contributions still in the write-behind buffer
+    logs = db.execute(ACTIVITY_FOR_CAT_NEWEST, {"cat_id": cat_id}).all()
+    logs = [*reversed(activity_buffer.pending_for_cat(cat_id)), *logs]
 
     result = []
-    for log, user in logs:
+    for log in logs:
         log_dict = {
             "log_id": log.log_id,
             "activity_time": log.activity_time.isoformat() if log.activity_time else "",
             "activity_description": log.activity_description,
             "cat_id": log.cat_id,
             "user_id": log.user_id,
-            "username": user.username if user else None,
+            "username": log.username,
             "activity_type": "contribution",  # Default to contribution
         }
         result.append(log_dict)
 
-    return result
+    return FastJSONResponse(result)
 
 # ------------------------------
 # 3) LIST ACTIVITY BY CAT (PUBLIC - for map pins)
 # ------------------------------
-@router.get("/cat/{cat_id}/public", response_model=list[ActivityLogOut])
+@router.get(
+    "/cat/{cat_id}/public",
+    response_model=list[ActivityLogOut],
+    dependencies=[Depends(rate_limit("public_read"))],
+)
+@coalesce("cat_activity")
 def list_cat_activity_public(
     cat_id: int,
     db: Session = Depends(get_db)
 ):
     # Check if cat exists
-    cat = db.query(Cat).filter(Cat.cat_id == cat_id).first()
-    if not cat:
+    if db.execute(CAT_EXISTS, {"cat_id": cat_id}).scalar() is None:
         raise HTTPException(status_code=404, detail="Cat not found")
 
-    # Return activity logs with usernames (no auth required for map pins)
-    logs = (
-        db.query(ActivityLog, User)
-        .outerjoin(User, ActivityLog.user_id == User.user_id)
-        .filter(ActivityLog.cat_id == cat_id)
-        .order_by(ActivityLog.activity_time.asc())  # Ascending for timeline
-        .all()
-    )
+    # Return activity logs with usernames (no auth required for map pins), ascending for timeline
+    logs = db.execute(ACTIVITY_FOR_CAT_OLDEST, {"cat_id": cat_id}).all()
+    logs += activity_buffer.pending_for_cat(cat_id)
 
-    result = []
-    for log, user in logs:
-        # Detect activity type from description
-        activity_type = "contribution"
-        if log.activity_description:
-            desc_upper = log.activity_description.upper()
-            if "CONDITION CHANGED TO URGENT" in desc_upper:
-                activity_type = "condition_change_urgent"
-            elif "CONDITION CHANGED TO AT VET" in desc_upper:
-                activity_type = "condition_change_at_vet"
-            elif "MARKED AS ADOPTED" in desc_upper or "MARKED AS PASSED" in desc_upper:
-                activity_type = "condition_change"
-        
-        log_dict = {
-            "log_id": log.log_id,
-            "activity_time": log.activity_time.isoformat() if log.activity_time else "",
-            "activity_description": log.activity_description,
-            "cat_id": log.cat_id,
-            "user_id": log.user_id,
-            "username": user.username if user else None,
-            "activity_type": activity_type,
-        }
-        result.append(log_dict)
+    result = [activity_entry(log) for log in logs]
 
-    return result
+    return FastJSONResponse(result)
 
 # ------------------------------
 # 4) CREATE ACTIVITY LOG ENTRY
 # ------------------------------
-@router.post("/", response_model=ActivityLogOut, status_code=201)
+@router.post("/", response_model=ActivityLogOut, status_code=201, dependencies=[Depends(rate_limit("write", per="user"))])
 def create_activity_log(
     payload: ActivityLogCreate,
     current_user_id: int = Depends(get_current_user_id),
     db: Session = Depends(get_db)
 ):
+    # Cat, its pin's condition and the contributor's username in one read
+    target = db.execute(CONTRIBUTION_TARGET, {"cat_id": payload.cat_id, "user_id": current_user_id}).first()
+
     # Check if cat exists
-    cat = db.query(Cat).filter(Cat.cat_id == payload.cat_id).first()
-    if not cat:
+    if target is None:
         raise HTTPException(status_code=404, detail="Cat not found")
 
     # Check if cat has a location (is on the map)
-    cat_location = db.query(CatLocation).filter(CatLocation.cat_id == payload.cat_id).first()
-    if not cat_location:
+    condition = target.condition
+    if condition is None:
         raise HTTPException(status_code=404, detail="Cat location not found")
 
     # Check if cat is AT VET, ADOPTED, or PASSED - cannot add contributions
-    if cat_location.condition in ["AT VET", "ADOPTED", "PASSED"]:
+    if condition in ["AT VET", "ADOPTED", "PASSED"]:
         raise HTTPException(
             status_code=403,
-            detail=f"Cannot add contributions while cat is {cat_location.condition.lower()}"
+            detail=f"Cannot add contributions while cat is {condition.lower()}"
         )
 
+    # Write-behind (app/db/activity_buffer.py): queued and journaled, inserted by the flusher.
+    # Not inside a bigger unit of work (POST /sync), whose rollback would have to undo it
+    if not in_unit_of_work(db):
+        queued = activity_buffer.buffer.add(
+            payload.cat_id, current_user_id, payload.activity_description, target.username
+        )
+        if queued is not None:
+            publish(CACHE, f"activity:cat:{payload.cat_id}")
+            return {**activity_entry(queued), "activity_type": "contribution"}
+
     # Create activity log entry
     new_log = ActivityLog(
         cat_id=payload.cat_id,
@@ -169,12 +176,12 @@ def create_activity_log(
         activity_description=payload.activity_description,
     )
 
-    db.add(new_log)
-    db.commit()
-    db.refresh(new_log)
-
-    # Get username
-    user = db.query(User).filter(User.user_id == current_user_id).first()
+    with unit_of_work(db):
+        db.add(new_log)
+        stats.activity_added(db, current_user_id, payload.activity_description)
+        db.flush()
+        after_commit(db, publish, CACHE, f"activity:cat:{payload.cat_id}")
+    db.refresh(new_log)  # activity_time
 
     return {
         "log_id": new_log.log_id,
@@ -182,7 +189,7 @@ def create_activity_log(
         "activity_description": new_log.activity_description,
         "cat_id": new_log.cat_id,
         "user_id": new_log.user_id,
-        "username": user.username if user else None,
+        "username": target.username,
         "activity_type": "contribution",
     }
 
@@ -5,6 +5,12 @@ from pydantic import BaseModel
 from app.db.session import get_db
 from app.db.auth import get_current_user_id
 from app.db.models import AdoptionListing, Cat, CatLocation
+from app.db.statements import ADOPTIONS_WITH_CAT
+from app.core.rate_limit import rate_limit
+from app.core.responses import FastJSONResponse, trusted_rows
+from app.core.singleflight import coalesce
+from app.core.invalidation import publish, CACHE
+from app.db import stats
 
 
 router = APIRouter(prefix="/adoptions", tags=["adoptions"])
@@ -51,6 +57,7 @@ class AdoptionListingWithCatOut(BaseModel):
     gender: str | None = None
     age: int | None = None
     image_url: str | None = None
+    thumbnail_url: str | None = None  # Uploaded images only, see POST /cats/{cat_id}/image
     cat_notes: str | None = None  # Notes from cats table
 
     class Config:
@@ -104,44 +111,20 @@ def create_adoption_listing(
     )
 
     db.add(listing)
+    stats.listing_changed(db, False, True)  # listings start active
     db.commit()
+    # Listed cats drop out of /cats/cats
+    publish(CACHE, "adoptions", "cats")
     db.refresh(listing)
     return listing
 # ===================== LIST ALL =====================
 
-@router.get("/", response_model=list[AdoptionListingWithCatOut])
+@router.get("/", response_model=list[AdoptionListingWithCatOut], dependencies=[Depends(rate_limit("public_read"))])
+@coalesce("adoptions")
 def list_adoptions(db: Session = Depends(get_db)):
-    # Query adoption listings with cat data using join
-    results = db.query(
-        AdoptionListing,
-        Cat
-    ).join(
-        Cat, AdoptionListing.cat_id == Cat.cat_id
-    ).order_by(
-        AdoptionListing.listing_id.desc()
-    ).all()
-    
-    # Build response with cat data
-    result = []
-    for listing, cat in results:
-        listing_dict = {
-            "listing_id": listing.listing_id,
-            "cat_id": listing.cat_id,
-            "vaccinated": listing.vaccinated,
-            "sterilized": listing.sterilized,
-            "is_active": listing.is_active,
-            "notes": listing.notes,  # Notes from adoption_listings table
-            "created_at": listing.created_at,
-            "uploader_id": listing.uploader_id,
-            "name": cat.name if cat else None,
-            "gender": cat.gender if cat else None,
-            "age": cat.age if cat else None,
-            "image_url": cat.image_url if cat else None,
-            "cat_notes": cat.notes if cat else None,  # Notes from cats table
-        }
-        result.append(listing_dict)
-    
-    return result
+    # Adoption listings with cat data, one precompiled join.
+    # Row keys already match AdoptionListingWithCatOut (cat notes come back as cat_notes)
+    return FastJSONResponse(trusted_rows(AdoptionListingWithCatOut, db.execute(ADOPTIONS_WITH_CAT)))
 
 
 # ===================== UPDATE =====================
@@ -168,9 +151,11 @@ def update_adoption_listing(
     if payload.notes is not None:
         listing.notes = payload.notes
     if payload.is_active is not None:
+        stats.listing_changed(db, bool(listing.is_active), payload.is_active)
         listing.is_active = payload.is_active
 
     db.commit()
+    publish(CACHE, "adoptions")
     db.refresh(listing)
     return listing
 
@@ -191,7 +176,9 @@ def delete_adoption_listing(
     if listing.uploader_id != current_user_id:
         raise HTTPException(status_code=403, detail="Not allowed to delete this listing")
 
+    stats.listing_changed(db, bool(listing.is_active), False)
     db.delete(listing)
     db.commit()
+    publish(CACHE, "adoptions", "cats")
     
 
@@ -1,80 +1,81 @@
+from datetime import datetime
 from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy import update
 from sqlalchemy.orm import Session
-from app.db.models import AdoptionRequest, AdoptionListing, Cat, Notification, User
+from app.db.models import AdoptionRequest, Notification
 from app.db.session import get_db
+from app.db.statements import (
+    SENT_REQUESTS, SENT_ACCEPTED_WITH_CONTACT, INCOMING_PENDING, INCOMING_ALL,
+    ADOPTION_REQUEST_CONTEXT, REQUEST_ACTION_CONTEXT,
+)
+from app.db.uow import unit_of_work
 from app.db.auth import get_current_user_id
+from app.core.rate_limit import rate_limit
+from app.core.responses import FastJSONResponse, trusted_rows
 from app.db.schemas import AdoptionRequestCreate, AdoptionRequestOut, StatusEnum, AcceptedRequestWithContact
 
 
 router = APIRouter(prefix="/adoption-requests", tags=["adoption requests"])
 
 
-@router.post("/", response_model=AdoptionRequestOut, status_code=201)
+@router.post(
+    "/",
+    response_model=AdoptionRequestOut,
+    status_code=201,
+    dependencies=[Depends(rate_limit("write", per="user"))],
+)
 def create_adoption_request(
     payload: AdoptionRequestCreate,
     db: Session = Depends(get_db),
     current_user_id: int = Depends(get_current_user_id)
 ):
-    # listing exists?
-    listing = db.query(AdoptionListing).filter(
-        AdoptionListing.listing_id == payload.listing_id,
-        AdoptionListing.is_active == True
+    # Listing, cat, sender name and duplicate check in one query
+    context = db.execute(
+        ADOPTION_REQUEST_CONTEXT, {"listing_id": payload.listing_id, "sender_id": current_user_id}
     ).first()
 
-    if not listing:
+    if not context:
         raise HTTPException(status_code=404, detail="Listing not found or inactive")
 
     # trying to adopt own cat?
-    cat = db.query(Cat).filter(Cat.cat_id == listing.cat_id).first()
-    if cat.adding_user == current_user_id:
+    if context.adding_user == current_user_id:
         raise HTTPException(status_code=400, detail="You cannot adopt your own cat")
 
     # duplicate request?
-    duplicate = db.query(AdoptionRequest).filter(
-        AdoptionRequest.listing_id == payload.listing_id,
-        AdoptionRequest.sender_id == current_user_id
-    ).first()
-    if duplicate:
+    if context.duplicate:
         raise HTTPException(status_code=400, detail="Request already exists")
 
-    # create request
-    new_req = AdoptionRequest(
-        listing_id=payload.listing_id,
-        sender_id=current_user_id,
-        receiver_id=listing.uploader_id,
-        city=payload.city,
-        age=payload.age,
-        full_name=payload.full_name,
-        reason_for_adoption=payload.reason_for_adoption,
-        living_situation=payload.living_situation,
-        experience_level=payload.experience_level.value,
-        has_other_pets=payload.has_other_pets,
-        status="Pending"
-    )
-
-    db.add(new_req)
-    db.commit()
-    db.refresh(new_req)
-
-    # Get sender and cat info for notifications
-    sender = db.query(User).filter(User.user_id == current_user_id).first()
-    receiver = db.query(User).filter(User.user_id == listing.uploader_id).first()
-    
-    # Create notification for sender
-    sender_notification = Notification(
-        user_id=current_user_id,
-        message=f"Your adoption request for {cat.name} has been submitted"
-    )
-    db.add(sender_notification)
-    
-    # Create notification for receiver (include request_id for parsing)
-    receiver_notification = Notification(
-        user_id=listing.uploader_id,
-        message=f"New adoption request for {cat.name} from {sender.full_name or sender.username} [REQUEST_ID:{new_req.request_id}]"
-    )
-    db.add(receiver_notification)
-    
-    db.commit()
+    with unit_of_work(db):
+        # create request
+        new_req = AdoptionRequest(
+            listing_id=payload.listing_id,
+            sender_id=current_user_id,
+            receiver_id=context.uploader_id,
+            city=payload.city,
+            age=payload.age,
+            full_name=payload.full_name,
+            reason_for_adoption=payload.reason_for_adoption,
+            living_situation=payload.living_situation,
+            experience_level=payload.experience_level.value,
+            has_other_pets=payload.has_other_pets,
+            status="Pending",
+            # Set here rather than by the server default so the response needs no refresh
+            submitted_at=datetime.now().replace(microsecond=0),
+        )
+        db.add(new_req)
+        db.flush()  # request_id for the receiver's notification
+
+        # Create notification for sender
+        db.add(Notification(
+            user_id=current_user_id,
+            message=f"Your adoption request for {context.cat_name} has been submitted"
+        ))
+
+        # Create notification for receiver (include request_id for parsing)
+        db.add(Notification(
+            user_id=context.uploader_id,
+            message=f"New adoption request for {context.cat_name} from {context.sender_name} [REQUEST_ID:{new_req.request_id}]"
+        ))
 
     return new_req
 # =============== LIST SENT ===================
@@ -82,9 +83,8 @@ def create_adoption_request(
 def list_sent_requests(current_user_id: int = Depends(get_current_user_id),
                        db: Session = Depends(get_db)):
 
-    return db.query(AdoptionRequest).filter(
-        AdoptionRequest.sender_id == current_user_id
-    ).all()
+    rows = db.execute(SENT_REQUESTS, {"user_id": current_user_id})
+    return FastJSONResponse(trusted_rows(AdoptionRequestOut, rows))
 
 
 # =============== LIST ACCEPTED OUTGOING WITH CONTACT INFO ===============
@@ -95,36 +95,9 @@ def list_accepted_sent_requests(current_user_id: int = Depends(get_current_user_
     Get all accepted adoption requests sent by the current user.
     Includes contact information (email, phone) of the receiver (listing uploader).
     """
-    requests = db.query(AdoptionRequest).filter(
-        AdoptionRequest.sender_id == current_user_id,
-        AdoptionRequest.status == "Accepted"
-    ).order_by(AdoptionRequest.submitted_at.desc()).all()
-    
-    result = []
-    for req in requests:
-        # Get receiver (listing uploader) information
-        receiver = db.query(User).filter(User.user_id == req.receiver_id).first()
-        
-        # Get cat name from listing
-        listing = db.query(AdoptionListing).filter(AdoptionListing.listing_id == req.listing_id).first()
-        cat_name = None
-        if listing:
-            cat = db.query(Cat).filter(Cat.cat_id == listing.cat_id).first()
-            cat_name = cat.name if cat else None
-        
-        req_dict = {
-            "request_id": req.request_id,
-            "listing_id": req.listing_id,
-            "cat_name": cat_name,
-            "receiver_id": req.receiver_id,
-            "receiver_name": (receiver.full_name or receiver.username) if receiver else None,
-            "receiver_email": receiver.email if receiver else None,
-            "receiver_phone": receiver.phone if receiver else None,
-            "submitted_at": req.submitted_at
-        }
-        result.append(req_dict)
-    
-    return result
+    # Receiver contact and cat name are joined in, no per-request lookups
+    requests = db.execute(SENT_ACCEPTED_WITH_CONTACT, {"user_id": current_user_id})
+    return FastJSONResponse(trusted_rows(AcceptedRequestWithContact, requests))
 
 
 # =============== LIST INCOMING ===============
@@ -132,67 +105,20 @@ def list_accepted_sent_requests(current_user_id: int = Depends(get_current_user_
 def list_incoming_requests(current_user_id: int = Depends(get_current_user_id),
                            db: Session = Depends(get_db)):
 
-    requests = db.query(AdoptionRequest).filter(
-        AdoptionRequest.receiver_id == current_user_id,
-        AdoptionRequest.status == "Pending"
-    ).all()
-    
-    # Add sender_name from User model for matching with notifications
-    result = []
-    for req in requests:
-        sender = db.query(User).filter(User.user_id == req.sender_id).first()
-        req_dict = {
-            "request_id": req.request_id,
-            "listing_id": req.listing_id,
-            "sender_id": req.sender_id,
-            "receiver_id": req.receiver_id,
-            "city": req.city,
-            "age": req.age,
-            "full_name": req.full_name,
-            "reason_for_adoption": req.reason_for_adoption,
-            "living_situation": req.living_situation,
-            "experience_level": req.experience_level,
-            "has_other_pets": req.has_other_pets,
-            "status": req.status,
-            "sender_name": (sender.full_name or sender.username) if sender else None,
-            "submitted_at": req.submitted_at.isoformat() if req.submitted_at else None
-        }
-        result.append(req_dict)
+    requests = db.execute(INCOMING_PENDING, {"user_id": current_user_id})
     
-    return result
+    # sender_name (full_name or username) comes from the join, used for matching with notifications
+    return FastJSONResponse(trusted_rows(AdoptionRequestOut, requests))
 
 # =============== LIST ALL INCOMING (INCLUDING PROCESSED) ===============
 @router.get("/incoming/all", response_model=list[AdoptionRequestOut])
 def list_all_incoming_requests(current_user_id: int = Depends(get_current_user_id),
                                db: Session = Depends(get_db)):
 
-    requests = db.query(AdoptionRequest).filter(
-        AdoptionRequest.receiver_id == current_user_id
-    ).order_by(AdoptionRequest.submitted_at.desc()).all()
+    requests = db.execute(INCOMING_ALL, {"user_id": current_user_id})
     
-    # Add sender_name from User model for matching with notifications
-    result = []
-    for req in requests:
-        sender = db.query(User).filter(User.user_id == req.sender_id).first()
-        req_dict = {
-            "request_id": req.request_id,
-            "listing_id": req.listing_id,
-            "sender_id": req.sender_id,
-            "receiver_id": req.receiver_id,
-            "city": req.city,
-            "age": req.age,
-            "full_name": req.full_name,
-            "reason_for_adoption": req.reason_for_adoption,
-            "living_situation": req.living_situation,
-            "experience_level": req.experience_level,
-            "has_other_pets": req.has_other_pets,
-            "status": req.status,
-            "sender_name": (sender.full_name or sender.username) if sender else None,
-            "submitted_at": req.submitted_at.isoformat() if req.submitted_at else None
-        }
-        result.append(req_dict)
-    
-    return result
+    # sender_name (full_name or username) comes from the join, used for matching with notifications
+    return FastJSONResponse(trusted_rows(AdoptionRequestOut, requests))
 
 # =============== GET SINGLE REQUEST ===============
 @router.get("/{request_id}", response_model=AdoptionRequestOut)
@@ -221,56 +147,44 @@ def handle_request_action(request_id: int, action: StatusEnum,
                           current_user_id: int = Depends(get_current_user_id),
                           db: Session = Depends(get_db)):
 
-    request = db.query(AdoptionRequest).filter(
-        AdoptionRequest.request_id == request_id,
-        AdoptionRequest.receiver_id == current_user_id
+    context = db.execute(
+        REQUEST_ACTION_CONTEXT, {"request_id": request_id, "receiver_id": current_user_id}
     ).first()
 
-    if not request:
+    if not context:
         raise HTTPException(status_code=404, detail="Request not found")
 
-    old_status = request.status
-    request.status = action.value  # update status
-    db.commit()
-    
-    # Create notifications for status change
-    if old_status == "Pending":
-        # Get cat and user info
-        listing = db.query(AdoptionListing).filter(AdoptionListing.listing_id == request.listing_id).first()
-        cat = db.query(Cat).filter(Cat.cat_id == listing.cat_id).first()
-        sender = db.query(User).filter(User.user_id == request.sender_id).first()
-        receiver = db.query(User).filter(User.user_id == current_user_id).first()
-        
-        if action.value == "Accepted":
-            # Notification for sender
-            sender_notification = Notification(
-                user_id=request.sender_id,
-                message=f"Your adoption request for {cat.name} has been accepted!"
-            )
-            db.add(sender_notification)
-            
-            # Notification for receiver
-            receiver_notification = Notification(
-                user_id=current_user_id,
-                message=f"You accepted the adoption request from {sender.full_name or sender.username} for {cat.name}"
-            )
-            db.add(receiver_notification)
-        elif action.value == "Rejected":
-            # Notification for sender
-            sender_notification = Notification(
-                user_id=request.sender_id,
-                message=f"Your adoption request for {cat.name} was rejected"
-            )
-            db.add(sender_notification)
-            
-            # Notification for receiver
-            receiver_notification = Notification(
-                user_id=current_user_id,
-                message=f"You rejected the adoption request from {sender.full_name or sender.username} for {cat.name}"
-            )
-            db.add(receiver_notification)
-        
-        db.commit()
+    with unit_of_work(db):
+        db.execute(
+            update(AdoptionRequest)
+            .where(AdoptionRequest.request_id == request_id)
+            .values(status=action.value)
+        )
+
+        # Create notifications for status change
+        if context.status == "Pending":
+            if action.value == "Accepted":
+                # Notification for sender
+                db.add(Notification(
+                    user_id=context.sender_id,
+                    message=f"Your adoption request for {context.cat_name} has been accepted!"
+                ))
+                # Notification for receiver
+                db.add(Notification(
+                    user_id=current_user_id,
+                    message=f"You accepted the adoption request from {context.sender_name} for {context.cat_name}"
+                ))
+            elif action.value == "Rejected":
+                # Notification for sender
+                db.add(Notification(
+                    user_id=context.sender_id,
+                    message=f"Your adoption request for {context.cat_name} was rejected"
+                ))
+                # Notification for receiver
+                db.add(Notification(
+                    user_id=current_user_id,
+                    message=f"You rejected the adoption request from {context.sender_name} for {context.cat_name}"
+                ))
 
     return {"detail": f"Request updated to {action.value}"}
 # =============== DELETE REQUEST ===================
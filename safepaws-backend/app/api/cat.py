@@ -1,11 +1,29 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from concurrent.futures.process import BrokenProcessPool
+from starlette.datastructures import FormData, UploadFile
+from starlette.formparsers import MultiPartException, MultiPartParser
 from pydantic import BaseModel
 from typing import List, Optional
 from sqlalchemy.orm import Session
 from sqlalchemy import select, desc
 from app.db.session import get_db
 from app.db.models import AdoptionListing, Cat
-from app.db.auth import get_current_user_id 
+from app.db.auth import get_current_user_id, get_optional_user_id
+from app.db.schemas import ActivityLogOut
+from app.db.statements import (
+    CATS_NOT_LISTED, CATS_BY_USER, CAT_DETAIL, ACTIVITY_FOR_CAT_LATEST, PIN_STATE_FOR_CAT, CATS_WITH_IMAGES,
+)
+from app.api.activity import activity_entry
+from app.core.rate_limit import rate_limit
+from app.db import activity_buffer, stats, image_hashes
+from app.db.uow import unit_of_work, after_commit
+from app.core.invalidation import publish, CACHE
+from app.core.responses import FastJSONResponse, trusted_rows
+from app.core.singleflight import coalesce
+from app.core import geo, media
+from app.core.perceptual import DECODE_ERRORS, MAX_RADIUS
+from app.core.process_pool import PoolSaturated
 
 router = APIRouter(prefix="/cats", tags=["cats"])
 
@@ -27,6 +45,55 @@ class CatOut(BaseModel):
     notes: Optional[str] | None = None
     image_url: Optional[str] | None = None
     adding_user: int | None = None
+    thumbnail_url: str | None = None  # Uploaded images only, see POST /cats/{cat_id}/image
+
+class CatPinOut(BaseModel):
+    location_id: int
+    latitude: float
+    longitude: float
+    created_at: str | None = None
+    condition: str
+    region: str | None = None
+
+
+class CatListingOut(BaseModel):
+    listing_id: int
+    is_active: bool
+    vaccinated: bool | None = None
+    sterilized: bool | None = None
+    uploader_id: int
+
+
+class MyRequestOut(BaseModel):
+    request_id: int
+    status: str
+
+
+class CatDetailOut(CatOut):
+    adding_user_username: str | None = None
+    pin: CatPinOut | None = None
+    listing: CatListingOut | None = None
+    my_request: MyRequestOut | None = None  # Only for a logged in caller who asked to adopt this cat
+    activity: List[ActivityLogOut] = []
+
+class CatImageOut(BaseModel):
+    cat_id: int
+    image_key: str
+    image_url: str
+    thumbnail_url: str
+    thumbnails: dict[int, dict[str, str]]  # width -> format (webp, jpg) -> URL
+
+class SimilarCatOut(BaseModel):
+    cat_id: int
+    name: str | None = None
+    image_url: str | None = None
+    thumbnail_url: str | None = None
+    hamming_distance: int  # bits that differ between the two photos' hashes, 0 = same picture
+    location_id: int | None = None
+    latitude: float | None = None
+    longitude: float | None = None
+    condition: str | None = None
+    distance_m: float | None = None  # from the given location, when one was given
 
 class CatUpdate(BaseModel):
     name: str | None = None
@@ -46,33 +113,82 @@ def create_cat(payload: CatIn, db: Session = Depends(get_db), user_id: int = Dep
         image_url=payload.image_url,
         adding_user=user_id
     )
-    db.add(new_cat)
-    db.commit()
-    db.refresh(new_cat)
+    with unit_of_work(db):
+        db.add(new_cat)
+        db.flush()  # cat_id
+        after_commit(db, publish, CACHE, "cats")
     return new_cat
 
 
 # ---------- LIST CATS ----------
 @router.get("/cats", response_model=List[CatOut])
+@coalesce("cats")
 def list_cats(db: Session = Depends(get_db)):
-    adoption_subquery = db.query(AdoptionListing.cat_id)
-    cats = (
-        db.query(Cat)
-        .filter(Cat.cat_id.not_in(adoption_subquery))
-        .order_by(Cat.cat_id.desc())
-        .all()
-    )
-    return cats
+    return FastJSONResponse(trusted_rows(CatOut, db.execute(CATS_NOT_LISTED)))
 
-# ---------- UPDATE CAT ----------
-@router.put("/cat/{cat_id}", response_model=CatOut)
-def update_cat(
+# ---------- CAT DETAIL (map popup) ----------
+@router.get(
+    "/{cat_id}/detail",
+    response_model=CatDetailOut,
+    dependencies=[Depends(rate_limit("public_read"))],
+)
+@coalesce("cat_detail")
+def get_cat_detail(
     cat_id: int,
-    payload: CatUpdate,
-    current_user_id: int = Depends(get_current_user_id),
+    activity_limit: int = Query(10, alias="activity", ge=0, le=100),
+    current_user_id: int | None = Depends(get_optional_user_id),
     db: Session = Depends(get_db),
 ):
+    """
+    Everything the map popup shows in one call, from two queries: the cat with
+    its pin, listing, adding user and the caller's own request, then the latest
+    activity entries (returned oldest first, like the public timeline).
+    """
+    row = db.execute(CAT_DETAIL, {"cat_id": cat_id, "user_id": current_user_id}).first()
+    if not row:
+        raise HTTPException(status_code=404, detail="Cat not found")
+
+    activity = []
+    if activity_limit:
+        logs = db.execute(ACTIVITY_FOR_CAT_LATEST, {"cat_id": cat_id, "limit": activity_limit}).all()
+        # Contributions still in the write-behind buffer are the newest
+        logs = [*reversed(activity_buffer.pending_for_cat(cat_id)), *logs][:activity_limit]
+        activity = [activity_entry(log) for log in reversed(logs)]
+
+    return FastJSONResponse({
+        "cat_id": row.cat_id,
+        "name": row.name,
+        "gender": row.gender,
+        "age": row.age,
+        "notes": row.notes,
+        "image_url": row.image_url,
+        "adding_user": row.adding_user,
+        "thumbnail_url": row.thumbnail_url,
+        "adding_user_username": row.adding_user_username,
+        "pin": None if row.location_id is None else {
+            "location_id": row.location_id,
+            "latitude": float(row.latitude),
+            "longitude": float(row.longitude),
+            "created_at": str(row.pinned_at) if row.pinned_at is not None else None,
+            "condition": row.condition if row.condition and row.condition.strip() else "NORMAL",
+            "region": row.region,
+        },
+        "listing": None if row.listing_id is None else {
+            "listing_id": row.listing_id,
+            "is_active": bool(row.is_active),
+            "vaccinated": row.vaccinated,
+            "sterilized": row.sterilized,
+            "uploader_id": row.uploader_id,
+        },
+        "my_request": None if row.request_id is None else {
+            "request_id": row.request_id,
+            "status": row.request_status,
+        },
+        "activity": activity,
+    })
 
+# ---------- UPDATE CAT ----------
+def _cat_for_edit(db: Session, cat_id: int, current_user_id: int) -> Cat:
     # نجيب الكات من الداتابيس
     cat = db.query(Cat).filter(Cat.cat_id == cat_id).first()
     if not cat:
@@ -89,6 +205,18 @@ def update_cat(
             status_code=403,
             detail="You cannot edit this cat because it is part of adoption and you are not the owner",
         )
+    return cat
+
+
+@router.put("/cat/{cat_id}", response_model=CatOut)
+def update_cat(
+    cat_id: int,
+    payload: CatUpdate,
+    current_user_id: int = Depends(get_current_user_id),
+    db: Session = Depends(get_db),
+):
+
+    cat = _cat_for_edit(db, cat_id, current_user_id)
 
     # إذا وصلنا هنا يعني يا إما الكات ماهي في adoption أو اليوزر هو صاحبها
     if payload.name is not None:
@@ -103,17 +231,214 @@ def update_cat(
     if payload.notes is not None:
         cat.notes = payload.notes
 
-    if payload.image_url is not None:
+    if payload.image_url is not None and payload.image_url != cat.image_url:
         cat.image_url = payload.image_url
+        cat.image_key = None  # a pasted URL replaces the uploaded image and its thumbnails
 
      # Update who modified the cat
     cat.adding_user = current_user_id
 
     db.commit()
+    # Cat fields are also embedded in the map pins and adoption listings
+    publish(CACHE, "cats", "pins", "adoptions")
     db.refresh(cat)
 
     return cat
 
+# ---------- UPLOAD IMAGE ----------
+MULTIPART_OVERHEAD = 64 * 1024  # boundaries, part headers and small fields around the file
+
+
+async def _upload_chunks(form: FormData, upload: UploadFile):
+    try:
+        while chunk := await upload.read(media.CHUNK):
+            yield chunk
+    finally:
+        await form.close()
+
+
+async def _capped(stream, limit: int):
+    # Chunked or unlabelled bodies have no Content-Length to check up front
+    size = 0
+    async for chunk in stream:
+        size += len(chunk)
+        if size > limit:
+            raise _too_large()
+        yield chunk
+
+
+async def _image_chunks(request: Request):
+    """The image in the request: the raw body, or the `file` field of a multipart form."""
+    length = request.headers.get("content-length")
+    if length and length.isdigit() and int(length) > media.MEDIA_MAX_BYTES + MULTIPART_OVERHEAD:
+        raise _too_large()
+
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        # Parsed here rather than with request.form(), which spools a body of any size to disk
+        parser = MultiPartParser(
+            request.headers, _capped(request.stream(), media.MEDIA_MAX_BYTES + MULTIPART_OVERHEAD),
+            max_files=1, max_fields=16,
+        )
+        try:
+            form = await parser.parse()
+        except MultiPartException as e:
+            raise HTTPException(status_code=400, detail=e.message)
+        upload = form.get("file")
+        if not isinstance(upload, UploadFile):
+            await form.close()
+            raise HTTPException(status_code=400, detail="Missing file field")
+        return _upload_chunks(form, upload)
+    return request.stream()
+
+
+def _too_large() -> HTTPException:
+    return HTTPException(status_code=413, detail=f"Image too large (max {media.MEDIA_MAX_BYTES // (1024 * 1024)} MB)")
+
+
+def _unsupported() -> HTTPException:
+    return HTTPException(status_code=415, detail="Unsupported image type, use JPEG, PNG, GIF or WebP")
+
+
+def _check_edit(db: Session, cat_id: int, current_user_id: int) -> None:
+    try:
+        _cat_for_edit(db, cat_id, current_user_id)
+    finally:
+        # End the read transaction: the pooled connection is not held during a slow upload.
+        # _set_image checks again before writing
+        db.rollback()
+
+
+def _set_image(db: Session, cat_id: int, current_user_id: int, key: str, name: str, dhash: int | None) -> None:
+    with unit_of_work(db):
+        cat = _cat_for_edit(db, cat_id, current_user_id)
+        cat.image_key = key
+        cat.image_url = media.url(key, name)
+        if dhash is not None:
+            image_hashes.record(db, key, dhash)
+        # The image also shows in the map pins and adoption listings
+        after_commit(db, publish, CACHE, "cats", "pins", "adoptions")
+
+
+@router.post("/{cat_id}/image", response_model=CatImageOut, status_code=201)
+async def upload_cat_image(
+    cat_id: int,
+    request: Request,
+    current_user_id: int = Depends(get_current_user_id),
+    db: Session = Depends(get_db),
+):
+    """
+    Upload the cat's photo, either as the raw request body (Content-Type
+    image/jpeg, image/png, image/gif or image/webp) or as the `file` field of a
+    multipart form. Same permissions as PUT /cats/cat/{cat_id}.
+
+    The image is streamed to content-addressed storage and becomes the cat's
+    image_url; thumbnails are made in the background and listed in the response.
+    """
+    # Permissions before reading a possibly large body
+    await run_in_threadpool(_check_edit, db, cat_id, current_user_id)
+    try:
+        key, name = await media.store(await _image_chunks(request))
+    except media.UploadTooLarge:
+        raise _too_large()
+    except media.UnsupportedImage:
+        raise _unsupported()
+
+    # For POST /cats/similar; None when the pool is busy (see app/db/image_hashes.py backfill)
+    dhash = await image_hashes.hash_image(key)
+    await run_in_threadpool(_set_image, db, cat_id, current_user_id, key, name, dhash)
+    media.submit_thumbnails(key, "upload")
+    return {
+        "cat_id": cat_id,
+        "image_key": key,
+        "image_url": media.url(key, name),
+        "thumbnail_url": media.url(key, media.thumbnail_name(media.LIST_THUMBNAIL_SIZE, "webp")),
+        "thumbnails": media.thumbnail_urls(key),
+    }
+
+# ---------- SIMILAR CATS ----------
+def _similar_cats(db: Session, found: list[tuple[int, str]], near: tuple[float, float] | None,
+                  radius_m: float, limit: int) -> list[dict]:
+    distances = {}
+    for distance, key in found:
+        distances.setdefault(key, distance)
+    rows = db.execute(CATS_WITH_IMAGES, {"image_keys": list(distances)}).all() if distances else []
+    matches = []
+    for row in rows:
+        distance_m = None
+        if near is not None:
+            if row.location_id is None:
+                continue
+            distance_m = geo.distance_m(near[0], near[1], row.latitude, row.longitude)
+            if distance_m > radius_m:
+                continue
+        matches.append({
+            "cat_id": row.cat_id,
+            "name": row.name,
+            "image_url": row.image_url,
+            "thumbnail_url": row.thumbnail_url,
+            "hamming_distance": distances[row.image_key],
+            "location_id": row.location_id,
+            "latitude": row.latitude,
+            "longitude": row.longitude,
+            "condition": row.condition,
+            "distance_m": None if distance_m is None else round(distance_m, 1),
+        })
+    matches.sort(key=lambda m: (m["hamming_distance"], m["distance_m"] or 0, m["cat_id"]))
+    return matches[:limit]
+
+
+@router.post(
+    "/similar",
+    response_model=List[SimilarCatOut],
+    dependencies=[Depends(rate_limit("image_search", per="user"))],
+)
+async def find_similar_cats(
+    request: Request,
+    max_distance: int = Query(10, ge=0, le=MAX_RADIUS),
+    latitude: float | None = Query(None, ge=-90, le=90),
+    longitude: float | None = Query(None, ge=-180, le=180),
+    radius_m: float = Query(500, gt=0, le=50_000),
+    limit: int = Query(20, ge=1, le=100),
+    current_user_id: int = Depends(get_current_user_id),
+    db: Session = Depends(get_db),
+):
+    """
+    "Is this the same cat?" before pinning a new one. Send a photo (raw body or
+    multipart `file`, like the upload) and get the cats whose uploaded photo is
+    within max_distance bits of it (dHash, 64 bits; about 10 or less is usually
+    the same picture, re-encoded or cropped slightly). With latitude/longitude
+    only cats pinned within radius_m metres are returned.
+    """
+    if (latitude is None) != (longitude is None):
+        raise HTTPException(status_code=400, detail="Give both latitude and longitude, or neither")
+
+    data = bytearray()
+    try:
+        async for chunk in await _image_chunks(request):
+            data += chunk
+            if len(data) > media.MEDIA_MAX_BYTES:
+                raise media.UploadTooLarge()
+    except media.UploadTooLarge:
+        raise _too_large()
+    if media.sniff(bytes(data[:16])) is None:
+        raise _unsupported()
+    if media.Image is None:
+        raise HTTPException(status_code=501, detail="Image search is not available on this server")
+
+    try:
+        dhash = await image_hashes.hash_bytes(bytes(data))
+    except (PoolSaturated, BrokenProcessPool):
+        # Full, or a worker just died (the next submit starts fresh ones): not the image's fault
+        raise HTTPException(
+            status_code=503, detail="Server is busy, please try again shortly", headers={"Retry-After": "2"}
+        )
+    except DECODE_ERRORS:
+        raise _unsupported()
+
+    found = await run_in_threadpool(image_hashes.similar, db, dhash, max_distance)
+    near = None if latitude is None else (latitude, longitude)
+    return FastJSONResponse(await run_in_threadpool(_similar_cats, db, found, near, radius_m, limit))
+
 # ---------- DELETE CAT ----------
 @router.delete("/cat/{cat_id}", status_code=204)
 def delete_cat(
@@ -133,8 +458,14 @@ def delete_cat(
     if adoption_listing and adoption_listing.uploader_id != current_user_id:
         raise HTTPException(status_code=403, detail="Not allowed to delete this cat")
 
+    # The cat's pin goes with it (ON DELETE CASCADE)
+    pin = db.execute(PIN_STATE_FOR_CAT, {"cat_id": cat_id}).first()
+    stats.pin_changed(db, tuple(pin) if pin else None, None)
+    if adoption_listing:
+        stats.listing_changed(db, bool(adoption_listing.is_active), False)
     db.delete(cat)
     db.commit()
+    publish(CACHE, "cats", "pins", "adoptions", f"activity:cat:{cat_id}")
     return
 
 @router.get("/mycats", response_model=List[CatOut])
@@ -142,11 +473,5 @@ def list_my_cats(
     current_user_id: int = Depends(get_current_user_id),
     db: Session = Depends(get_db),
 ):
-    cats = (
-        db.query(Cat)
-        .filter(Cat.adding_user == current_user_id)
-        .order_by(Cat.cat_id.desc())
-        .all()
-    )
-    return cats
+    return FastJSONResponse(trusted_rows(CatOut, db.execute(CATS_BY_USER, {"user_id": current_user_id})))
 
@@ -0,0 +1,186 @@
+# app/api/export.py
+# Full table exports for rescue partners and grant reporting.
+#
+#   GET /export/activity?from=2025-01-01&to=2025-07-01&format=csv
+#   GET /export/pins?format=ndjson              (Accept-Encoding: gzip to compress)
+#
+# Rows are read in keyset batches (primary key > last one sent, EXPORT_BATCH
+# at a time) and written out as each batch arrives, so memory does not grow
+# with the export. The connection goes back to the pool between batches: a
+# slow download never holds one, and no transaction stays open for the whole
+# export. (stream_results would need server side cursors, which the MySQL
+# connector dialect does not have: it would quietly buffer the whole result.)
+# Compression is done on the fly by CompressionMiddleware.
+#
+# Access: X-Export-Token must match EXPORT_API_TOKEN; without a token
+# configured only local callers can export, like /internal.
+import csv
+import io
+import os
+from datetime import date, datetime
+from typing import NamedTuple
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Date, DateTime, bindparam, select
+
+from app.api.internal import require_internal
+from app.core.metrics import REGISTRY
+from app.core.responses import dumps
+from app.db.models import ActivityLog, AdoptionRequest, CatLocation
+from app.db.session import SessionLocal
+
+router = APIRouter(prefix="/export", tags=["export"])
+
+EXPORT_API_TOKEN = os.getenv("EXPORT_API_TOKEN")
+EXPORT_BATCH = int(os.getenv("EXPORT_BATCH", "5000"))
+
+export_rows = REGISTRY.counter("safepaws_export_rows_total", "Rows written by /export", ("dataset", "format"))
+exports_active = REGISTRY.gauge("safepaws_exports_active", "Exports currently streaming", ("dataset",))
+
+
+def require_export(request: Request):
+    if EXPORT_API_TOKEN:
+        if request.headers.get("x-export-token") != EXPORT_API_TOKEN:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not allowed")
+    else:
+        require_internal(request)
+
+
+class Dataset(NamedTuple):
+    key: object  # integer primary key, the keyset cursor
+    time: object  # column filtered by from/to
+    columns: tuple
+
+
+# Adoption requests leave out the applicant's name and free-text answers
+DATASETS = {
+    "activity": Dataset(
+        ActivityLog.log_id,
+        ActivityLog.activity_time,
+        (ActivityLog.log_id, ActivityLog.activity_time, ActivityLog.activity_description,
+         ActivityLog.cat_id, ActivityLog.user_id),
+    ),
+    "adoption_requests": Dataset(
+        AdoptionRequest.request_id,
+        AdoptionRequest.submitted_at,
+        (AdoptionRequest.request_id, AdoptionRequest.listing_id, AdoptionRequest.sender_id,
+         AdoptionRequest.receiver_id, AdoptionRequest.status, AdoptionRequest.submitted_at,
+         AdoptionRequest.city, AdoptionRequest.age, AdoptionRequest.experience_level,
+         AdoptionRequest.has_other_pets),
+    ),
+    "pins": Dataset(
+        CatLocation.location_id,
+        CatLocation.created_at,
+        (CatLocation.location_id, CatLocation.cat_id, CatLocation.latitude, CatLocation.longitude,
+         CatLocation.condition.label("condition"), CatLocation.region, CatLocation.created_at,
+         CatLocation.seen_at),
+    ),
+}
+
+# Precompiled batch queries per dataset: everything (rows without a time
+# included), and within from/to, where an open end is bound to an extreme
+_BATCHES = {
+    name: select(*d.columns).where(d.key > bindparam("after")).order_by(d.key).limit(bindparam("batch"))
+    for name, d in DATASETS.items()
+}
+_BATCHES_IN_RANGE = {
+    name: stmt.where(d.time >= bindparam("t_from"), d.time < bindparam("t_to"))
+    for (name, stmt), d in zip(_BATCHES.items(), DATASETS.values())
+}
+_EARLIEST = datetime(1970, 1, 1)
+_LATEST = datetime(9999, 12, 31)
+
+MEDIA_TYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}  # csv gets charset=utf-8 added
+
+
+def _batches(name: str, t_from: datetime | None, t_to: datetime | None):
+    if t_from is None and t_to is None:
+        stmt, params = _BATCHES[name], {}
+    else:
+        stmt, params = _BATCHES_IN_RANGE[name], {"t_from": t_from or _EARLIEST, "t_to": t_to or _LATEST}
+    db = SessionLocal()
+    try:
+        after = 0
+        while True:
+            rows = db.execute(stmt, {**params, "after": after, "batch": EXPORT_BATCH}).all()
+            db.rollback()  # back to the pool while the client downloads this batch
+            if not rows:
+                return
+            yield rows
+            after = rows[-1][0]
+    finally:
+        db.close()
+
+
+def _as_datetime(value: datetime | date | None) -> datetime | None:
+    if value is None or isinstance(value, datetime):
+        return value
+    return datetime(value.year, value.month, value.day)
+
+
+# Positions of the date/time columns, the only ones CSV needs converted (to ISO 8601 like NDJSON)
+_TEMPORAL = {
+    name: tuple(i for i, c in enumerate(stmt.selected_columns) if isinstance(c.type, (DateTime, Date)))
+    for name, stmt in _BATCHES.items()
+}
+
+
+def _csv_rows(rows, temporal: tuple[int, ...]):
+    for row in rows:
+        row = list(row)
+        for i in temporal:
+            if row[i] is not None:
+                row[i] = row[i].isoformat()
+        yield row
+
+
+def _csv(name: str, t_from: datetime | None, t_to: datetime | None):
+    exports_active.inc(name)
+    try:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow([c.key for c in _BATCHES[name].selected_columns])
+        for rows in _batches(name, t_from, t_to):
+            writer.writerows(_csv_rows(rows, _TEMPORAL[name]))
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+            export_rows.inc(name, "csv", amount=len(rows))
+        if buffer.tell():  # header of an empty export
+            yield buffer.getvalue().encode("utf-8")
+    finally:
+        exports_active.dec(name)
+
+
+def _ndjson(name: str, t_from: datetime | None, t_to: datetime | None):
+    exports_active.inc(name)
+    try:
+        names = [c.key for c in _BATCHES[name].selected_columns]
+        for rows in _batches(name, t_from, t_to):
+            yield b"".join(dumps(dict(zip(names, row))) + b"\n" for row in rows)
+            export_rows.inc(name, "ndjson", amount=len(rows))
+    finally:
+        exports_active.dec(name)
+
+
+@router.get("/{dataset}", dependencies=[Depends(require_export)])
+def export_dataset(
+    dataset: str,
+    t_from: datetime | date | None = Query(None, alias="from", description="Inclusive, e.g. 2025-01-01"),
+    t_to: datetime | date | None = Query(None, alias="to", description="Exclusive, e.g. 2025-07-01T12:00"),
+    fmt: str = Query("csv", alias="format", pattern="^(csv|ndjson)$"),
+):
+    """
+    Every row of activity, adoption_requests or pins (optionally between from
+    and to), oldest first, as CSV with a header row or as one JSON object per line.
+    """
+    if dataset not in DATASETS:
+        raise HTTPException(status_code=404, detail=f"Unknown dataset. Known: {', '.join(DATASETS)}")
+    body = (_csv if fmt == "csv" else _ndjson)(dataset, _as_datetime(t_from), _as_datetime(t_to))
+    filename = f"safepaws-{dataset}-{date.today().isoformat()}.{fmt}"
+    return StreamingResponse(
+        body,
+        media_type=MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"', "Cache-Control": "no-store"},
+    )
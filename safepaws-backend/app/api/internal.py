@@ -0,0 +1,45 @@
+import os
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from app.core import bulkhead
+from app.db import slow_queries, stats
+
+router = APIRouter(prefix="/internal", tags=["internal"])
+
+INTERNAL_API_TOKEN = os.getenv("INTERNAL_API_TOKEN")
+LOCAL_HOSTS = {"127.0.0.1", "::1", "localhost", "testclient"}
+
+
+def require_internal(request: Request):
+    # With a token configured it is required, otherwise only local callers are allowed
+    if INTERNAL_API_TOKEN:
+        if request.headers.get("x-internal-token") != INTERNAL_API_TOKEN:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not allowed")
+    elif not request.client or request.client.host not in LOCAL_HOSTS:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not allowed")
+
+
+@router.get("/slow-queries", dependencies=[Depends(require_internal)])
+def list_slow_queries(limit: int = 20, recent: int = 0):
+    recorder = slow_queries.recorder
+    if recorder is None:
+        return {"enabled": False, "threshold_ms": None, "statements": [], "recent": []}
+    return {
+        "enabled": True,
+        "threshold_ms": slow_queries.SLOW_QUERY_MS,
+        "statements": recorder.report(limit),
+        "recent": recorder.recent(recent) if recent else [],
+    }
+
+
+@router.get("/bulkheads", dependencies=[Depends(require_internal)])
+async def list_bulkheads():
+    return {"enabled": bulkhead.BULKHEADS_ENABLED, "groups": bulkhead.snapshot()}
+
+
+# Recompute the stat counters now instead of waiting for the next scheduled pass
+@router.post("/stats/reconcile", dependencies=[Depends(require_internal)])
+def reconcile_stats():
+    try:
+        return {"drift": stats.reconcile()}
+    except stats.ReconcileBusy:
+        raise HTTPException(status_code=409, detail="A stats reconcile is already running, try again later")
@@ -0,0 +1,106 @@
+# app/api/media.py
+# Serves uploaded images and their thumbnails from MEDIA_ROOT (app/core/media.py).
+#
+#   GET /media/<sha256>/original.jpg
+#   GET /media/<sha256>/320.webp
+#
+# Paths are content addressed, so responses are immutable: a year of
+# Cache-Control, a strong ETag (the key plus the file name) for revalidation
+# and single byte ranges for resumed downloads. A thumbnail that is not on disk
+# yet is made in the thumbnail pool while the request waits; if that is not
+# possible the client is redirected to the original.
+import asyncio
+import os
+import re
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import RedirectResponse, Response, StreamingResponse
+
+from app.core import media
+
+router = APIRouter(prefix="/media", tags=["media"], include_in_schema=False)
+
+KEY = re.compile(r"^[0-9a-f]{64}$")
+NAME = re.compile(r"^(original\.(jpg|png|gif|webp)|(\d+)\.(webp|jpg))$")
+RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+IMMUTABLE = "public, max-age=31536000, immutable"
+ON_DEMAND_TIMEOUT = 10.0
+
+
+def _file_chunks(path, start: int, length: int):
+    with open(path, "rb") as fh:
+        fh.seek(start)
+        while length > 0:
+            chunk = fh.read(min(media.CHUNK, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def _byte_range(header: str | None, size: int) -> tuple[int, int] | None:
+    """(start, end inclusive) of a single satisfiable range, None to send the whole file."""
+    match = RANGE.match(header or "")
+    if not match or not any(match.groups()):
+        return None
+    first, last = match.groups()
+    if not first:  # suffix: the last N bytes
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start > end or start >= size:
+        raise HTTPException(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+    return start, end
+
+
+async def _make_thumbnail(key: str) -> bool:
+    future = media.submit_thumbnails(key, "on_demand")
+    if future is None:
+        return False
+    try:
+        await asyncio.wait_for(asyncio.wrap_future(future), ON_DEMAND_TIMEOUT)
+    except Exception:
+        return False
+    return True
+
+
+@router.get("/{key}/{name}")
+async def get_media(key: str, name: str, request: Request):
+    match = NAME.match(name)
+    if not KEY.match(key) or not match:
+        raise HTTPException(status_code=404, detail="Not found")
+    path = media.directory(key) / name
+
+    if not path.exists():
+        size = match.group(3)
+        if size is None or int(size) not in media.THUMBNAIL_SIZES:
+            raise HTTPException(status_code=404, detail="Not found")
+        original = media.find_original(key)
+        if original is None:
+            raise HTTPException(status_code=404, detail="Not found")
+        if not await _make_thumbnail(key) or not path.exists():
+            # Not cacheable: the thumbnail may exist on the next request
+            return RedirectResponse(media.url(key, original.name), headers={"Cache-Control": "no-cache"})
+
+    etag = f'"{key[:32]}-{name}"'
+    headers = {"ETag": etag, "Cache-Control": IMMUTABLE, "Accept-Ranges": "bytes"}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+
+    size = os.path.getsize(path)
+    content_type = media.CONTENT_TYPES[name.rsplit(".", 1)[1]]
+    byte_range = None
+    # If-Range with another validator means the client's partial copy is stale: send it all
+    if request.headers.get("if-range", etag) == etag:
+        byte_range = _byte_range(request.headers.get("range"), size)
+    if byte_range is None:
+        headers["Content-Length"] = str(size)
+        return StreamingResponse(_file_chunks(path, 0, size), media_type=content_type, headers=headers)
+
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        _file_chunks(path, start, end - start + 1), status_code=206, media_type=content_type, headers=headers
+    )
@@ -5,22 +5,22 @@ from app.db.session import get_db
 from app.db.models import Notification
 from app.db.schemas import NotificationOut
 from app.db.auth import get_current_user_id
+from app.db.statements import NOTIFICATIONS_FOR_USER, UNREAD_COUNT
+from app.core.responses import FastJSONResponse, trusted_rows
+from app.core.singleflight import coalesce
 
 router = APIRouter(prefix="/notifications", tags=["notifications"])
 
 
 @router.get("/", response_model=list[NotificationOut])
+@coalesce("notifications")
 def list_notifications(
     current_user_id: int = Depends(get_current_user_id),
     db: Session = Depends(get_db),
 ):
 
-    return (
-        db.query(Notification)
-        .filter(Notification.user_id == current_user_id)
-        .order_by(Notification.created_at.desc())
-        .all()
-    )
+    rows = db.execute(NOTIFICATIONS_FOR_USER, {"user_id": current_user_id})
+    return FastJSONResponse(trusted_rows(NotificationOut, rows))
 
 
 @router.get("/unread-count", response_model=int)
@@ -29,14 +29,7 @@ def get_unread_count(
     db: Session = Depends(get_db),
 ):
    
-    return (
-        db.query(Notification)
-        .filter(
-            Notification.user_id == current_user_id,
-            Notification.is_read == False,  # noqa: E712
-        )
-        .count()
-    )
+    return db.execute(UNREAD_COUNT, {"user_id": current_user_id}).scalar()
 
 
 @router.post("/mark-all-read", status_code=status.HTTP_204_NO_CONTENT)
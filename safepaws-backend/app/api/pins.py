@@ -1,17 +1,39 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException
-from pydantic import BaseModel, Field
+from typing import List, Union
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from pydantic import BaseModel, Field, create_model
 from sqlalchemy.orm import Session
-from sqlalchemy import select, delete, desc
+from sqlalchemy import select, delete, update
 from app.db.session import get_db
-from app.db.models import Cat, CatLocation, AdoptionListing, User, ActivityLog
+from app.db.models import Cat, CatLocation, AdoptionListing, ActivityLog
 from app.db.auth import get_current_user_id
+from app.db.statements import (
+    PINS_WITH_CAT, PIN_WITH_CAT_BY_ID, PINS_IN_REGION, PINS_IN_REGION_WITH_CONDITION, PINS_WITH_CONDITION,
+    PIN_STATE_BY_ID, DUPLICATE_PAIRS,
+)
+from app.db.uow import unit_of_work, after_commit
+from app.db import regions, sightings, stats
+from app.core.rate_limit import rate_limit
+from app.core.responses import FastJSONResponse
+from app.core.singleflight import coalesce
+from app.core.invalidation import publish, CACHE
+
+try:
+    import msgpack
+except ImportError:  # dev setups only, msgpack is in requirements.txt (Accept: application/x-msgpack on GET /pins/)
+    msgpack = None
+
 router = APIRouter(prefix="/pins", tags=["pins"])
 class PinIn(BaseModel):
     cat_id: int = Field(..., ge=1)
     latitude: float = Field(..., ge=16, le=33)
     longitude: float = Field(..., ge=34, le=56)
 
+class PossibleDuplicateOut(BaseModel):
+    location_id: int
+    cat_id: int
+    distance_m: float
+    seconds_apart: int
+
 class PinOut(BaseModel):
     location_id: int
     cat_id: int
@@ -19,6 +41,9 @@ class PinOut(BaseModel):
     longitude: float
     created_at: str | None = None
     condition: str | None = None
+    region: str | None = None
+    # Other cats pinned within a few metres and minutes of this pin (app/db/sightings.py)
+    possible_duplicates: List[PossibleDuplicateOut] = []
 
 
 class PinWithCatOut(BaseModel):
@@ -33,50 +58,211 @@ class PinWithCatOut(BaseModel):
     age: int | None = None
     gender: str | None = None
     image_url: str | None = None
+    thumbnail_url: str | None = None  # Uploaded images only, see POST /cats/{cat_id}/image
     notes: str | None = None  # Notes from cats table
     adding_user_id: int | None = None  # User ID who added the cat
     adding_user_username: str | None = None  # Username who added the cat
-@router.get("/", response_model=List[PinWithCatOut])
-def list_pins(db: Session = Depends(get_db)):
-    # Query pins with cat and user data using joins
-    results = db.query(
-        CatLocation,
-        Cat,
-        User
-    ).join(
-        Cat, CatLocation.cat_id == Cat.cat_id
-    ).outerjoin(
-        User, Cat.adding_user == User.user_id
-    ).order_by(
-        desc(CatLocation.location_id)
-    ).limit(100).all()
-    
-    # Build response with cat data
-    result = []
-    for location, cat, user in results:
-        # Get condition, default to NORMAL if None or empty
-        condition_value = getattr(location, 'condition', None)
-        if not condition_value or condition_value.strip() == '':
-            condition_value = "NORMAL"
-        
-        location_dict = {
-            "location_id": location.location_id,
-            "cat_id": location.cat_id,
-            "latitude": float(location.latitude),
-            "longitude": float(location.longitude),
-            "created_at": str(location.created_at) if location.created_at is not None else None,
-            "condition": condition_value,
-            "name": cat.name if cat else None,
-            "age": cat.age if cat else None,
-            "gender": cat.gender if cat else None,
-            "image_url": cat.image_url if cat else None,
-            "notes": cat.notes if cat else None,
-            "adding_user_id": cat.adding_user if cat else None,
-            "adding_user_username": user.username if user else None,
+    region: str | None = None  # Region the pin falls in, see app/db/regions.py
+PIN_FIELDS = tuple(PinWithCatOut.model_fields)
+
+# The other shapes of GET /pins/, derived from PinWithCatOut so they follow it.
+# fields=: pin objects with only the fields asked for
+PartialPinOut = create_model(
+    "PartialPinOut",
+    **{name: (info.annotation | None, None) for name, info in PinWithCatOut.model_fields.items()},
+)
+# format=columnar: one array per field, same order, count entries each
+PinColumnsOut = create_model(
+    "PinColumnsOut",
+    count=(int, ...),
+    **{name: (List[info.annotation] | None, None) for name, info in PinWithCatOut.model_fields.items()},
+)
+# What the map needs to draw markers; the rest comes from GET /pins/{location_id} when a popup opens
+MAP_FIELDS = ("location_id", "cat_id", "latitude", "longitude", "condition")
+MSGPACK = "application/x-msgpack"
+
+
+def _pin_dict(row) -> dict:
+    # Get condition, default to NORMAL if None or empty
+    condition_value = row.condition
+    if not condition_value or condition_value.strip() == '':
+        condition_value = "NORMAL"
+
+    return {
+        "location_id": row.location_id,
+        "cat_id": row.cat_id,
+        "latitude": float(row.latitude),
+        "longitude": float(row.longitude),
+        "created_at": str(row.created_at) if row.created_at is not None else None,
+        "condition": condition_value,
+        "name": row.name,
+        "age": row.age,
+        "gender": row.gender,
+        "image_url": row.image_url,
+        "thumbnail_url": row.thumbnail_url,
+        "notes": row.notes,
+        "adding_user_id": row.adding_user_id,
+        "adding_user_username": row.adding_user_username,
+        "region": row.region,
+    }
+
+
+def _parse_fields(fields: str | None, default: tuple[str, ...]) -> tuple[str, ...]:
+    if not fields:
+        return default
+    names = tuple(dict.fromkeys(name.strip() for name in fields.split(",") if name.strip()))
+    unknown = [name for name in names if name not in PIN_FIELDS]
+    if unknown or not names:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(PIN_FIELDS)}",
+        )
+    return names
+
+
+def _negotiated(request: Request, content) -> Response:
+    # Without msgpack (dev setups) the JSON representation is served for every Accept
+    if msgpack is not None and MSGPACK in request.headers.get("accept", ""):
+        return Response(msgpack.packb(content, use_bin_type=True), media_type=MSGPACK, headers={"Vary": "Accept"})
+    return FastJSONResponse(content, headers={"Vary": "Accept"})
+
+
+@router.get(
+    "/",
+    # Documents every shape; the handler builds the body itself, so nothing is validated against it
+    response_model=Union[List[PinWithCatOut], List[PartialPinOut], PinColumnsOut],
+    dependencies=[Depends(rate_limit("public_read"))],
+    responses={200: {"content": {MSGPACK: {}}}},
+)
+@coalesce("pins", vary=("accept",))
+def list_pins(
+    request: Request,
+    layout: str | None = Query(None, alias="format", pattern="^(rows|columnar)$"),
+    fields: str | None = Query(None, description="Comma separated subset of the pin fields"),
+    region: str | None = Query(None, description="Only pins in this region (see GET /pins/regions)"),
+    condition: str | None = Query(None, description="Only pins with this condition"),
+    db: Session = Depends(get_db),
+):
+    """
+    Map pins. Default is a list of pin objects. format=columnar returns parallel
+    arrays ({"count": n, "location_id": [...], "latitude": [...], ...}) with the map
+    fields only unless fields= asks for more. Send Accept: application/x-msgpack
+    for a binary body with the same structure. region= and condition= filter on
+    the stored columns.
+    """
+    if region is not None and region not in regions.names():
+        raise HTTPException(status_code=400, detail=f"Unknown region. Known: {', '.join(regions.names())}")
+
+    # Pins with cat and user data, one precompiled join
+    if region is not None and condition is not None:
+        rows = db.execute(PINS_IN_REGION_WITH_CONDITION, {"region": region, "condition": condition})
+    elif region is not None:
+        rows = db.execute(PINS_IN_REGION, {"region": region})
+    elif condition is not None:
+        rows = db.execute(PINS_WITH_CONDITION, {"condition": condition})
+    else:
+        rows = db.execute(PINS_WITH_CAT)
+    result = [_pin_dict(row) for row in rows]
+
+    if layout == "columnar":
+        names = _parse_fields(fields, MAP_FIELDS)
+        content = {"count": len(result)}
+        for name in names:
+            content[name] = [pin[name] for pin in result]
+    elif fields:
+        names = _parse_fields(fields, PIN_FIELDS)
+        content = [{name: pin[name] for name in names} for pin in result]
+    else:
+        content = result
+    return _negotiated(request, content)
+
+
+class RegionCountOut(BaseModel):
+    region: str
+    total: int
+    by_condition: dict[str, int]
+
+
+@router.get(
+    "/regions",
+    response_model=List[RegionCountOut],
+    dependencies=[Depends(rate_limit("public_read"))],
+)
+def list_region_counts(db: Session = Depends(get_db)):
+    """Pins per region by condition, from the stat_counters running totals."""
+    return FastJSONResponse(stats.region_counts(db))
+
+
+class DuplicatePinOut(BaseModel):
+    location_id: int
+    cat_id: int
+    name: str | None = None
+    latitude: float
+    longitude: float
+    condition: str | None = None
+    seen_at: str | None = None
+    image_url: str | None = None
+
+
+class DuplicatePairOut(BaseModel):
+    pair_id: int
+    distance_m: float
+    seconds_apart: int
+    detected_at: str | None = None
+    pin: DuplicatePinOut
+    other: DuplicatePinOut
+
+
+def _duplicate_side(row, prefix: str) -> dict:
+    seen_at = getattr(row, prefix + "seen_at")
+    return {
+        "location_id": getattr(row, prefix + "location_id"),
+        "cat_id": getattr(row, prefix + "cat_id"),
+        "name": getattr(row, prefix + "name"),
+        "latitude": float(getattr(row, prefix + "latitude")),
+        "longitude": float(getattr(row, prefix + "longitude")),
+        "condition": getattr(row, prefix + "condition"),
+        "seen_at": str(seen_at) if seen_at is not None else None,
+        "image_url": getattr(row, prefix + "image_url"),
+    }
+
+
+@router.get("/duplicates", response_model=List[DuplicatePairOut])
+def list_duplicate_pins(
+    limit: int = Query(100, ge=1, le=500),
+    current_user_id: int = Depends(get_current_user_id),
+    db: Session = Depends(get_db),
+):
+    """
+    Pairs of pins of different cats made within a few metres and minutes of
+    each other (probably one cat entered twice), newest first, for coordinators
+    to merge or dismiss.
+    """
+    rows = db.execute(DUPLICATE_PAIRS, {"limit": limit})
+    return FastJSONResponse([
+        {
+            "pair_id": row.pair_id,
+            "distance_m": row.distance_m,
+            "seconds_apart": row.seconds_apart,
+            "detected_at": str(row.detected_at) if row.detected_at is not None else None,
+            "pin": _duplicate_side(row, ""),
+            "other": _duplicate_side(row, "other_"),
         }
-        result.append(location_dict)
-    
-    return result
+        for row in rows
+    ])
+
+
+@router.get(
+    "/{location_id}",
+    response_model=PinWithCatOut,
+    dependencies=[Depends(rate_limit("public_read"))],
+)
+@coalesce("pin")
+def get_pin(location_id: int, db: Session = Depends(get_db)):
+    row = db.execute(PIN_WITH_CAT_BY_ID, {"location_id": location_id}).first()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Pin not found")
+    return FastJSONResponse(_pin_dict(row))
 @router.post("/", response_model=PinOut, status_code=201)
 def create_pin(payload: PinIn, db: Session = Depends(get_db)):
 
@@ -100,12 +286,30 @@ def create_pin(payload: PinIn, db: Session = Depends(get_db)):
             detail="This cat is currently listed for adoption and cannot receive new location pins"
         )
 
+    # Region from the in-process index, stored so reads filter by equality
+    region = regions.region_for(payload.latitude, payload.longitude)
+
+    seen_at = sightings.now()
+
     if existing_pin:
         # Update instead of creating new
-        existing_pin.latitude = payload.latitude
-        existing_pin.longitude = payload.longitude
-        db.commit()
-        db.refresh(existing_pin)
+        with unit_of_work(db):
+            stats.pin_changed(
+                db, (existing_pin.condition, existing_pin.region), (existing_pin.condition, region)
+            )
+            existing_pin.latitude = payload.latitude
+            existing_pin.longitude = payload.longitude
+            existing_pin.region = region
+            existing_pin.seen_at = seen_at
+            duplicates = sightings.check(
+                db, existing_pin.location_id, payload.cat_id, payload.latitude, payload.longitude, seen_at
+            )
+            sightings.record(db, existing_pin.location_id, duplicates)
+            after_commit(
+                db, sightings.written,
+                existing_pin.location_id, payload.cat_id, payload.latitude, payload.longitude, seen_at,
+            )
+            after_commit(db, publish, CACHE, "pins")
 
         # Get condition from CatLocation (handle if column doesn't exist)
         try:
@@ -120,6 +324,8 @@ def create_pin(payload: PinIn, db: Session = Depends(get_db)):
             longitude=float(existing_pin.longitude),
             created_at=str(existing_pin.created_at) if existing_pin.created_at is not None else None,
             condition=condition,
+            region=existing_pin.region,
+            possible_duplicates=duplicates,
         )
 
     # No existing pin → create new
@@ -127,12 +333,24 @@ def create_pin(payload: PinIn, db: Session = Depends(get_db)):
         cat_id=payload.cat_id,
         latitude=payload.latitude,
         longitude=payload.longitude,
+        region=region,
+        seen_at=seen_at,
     )
 
     try:
-        db.add(new_pin)
-        db.commit()
-        db.refresh(new_pin)
+        with unit_of_work(db):
+            db.add(new_pin)
+            stats.pin_changed(db, None, ("UNKNOWN", region))  # condition column default
+            db.flush()  # location_id for the duplicate pairs
+            duplicates = sightings.check(
+                db, new_pin.location_id, payload.cat_id, payload.latitude, payload.longitude, seen_at
+            )
+            sightings.record(db, new_pin.location_id, duplicates)
+            after_commit(
+                db, sightings.written, new_pin.location_id, payload.cat_id, payload.latitude, payload.longitude, seen_at
+            )
+            after_commit(db, publish, CACHE, "pins")
+        db.refresh(new_pin)  # created_at
         # Get condition from CatLocation (handle if column doesn't exist)
         try:
             condition = getattr(new_pin, 'condition', None) or "NORMAL"
@@ -146,17 +364,22 @@ def create_pin(payload: PinIn, db: Session = Depends(get_db)):
             longitude=float(new_pin.longitude),
             created_at=str(new_pin.created_at) if new_pin.created_at is not None else None,
             condition=condition,
+            region=new_pin.region,
+            possible_duplicates=duplicates,
         )
     except Exception:
-        db.rollback()
         raise HTTPException(status_code=500, detail="Database error")
 @router.delete("/{pin_id}", status_code=204)
 def delete_pin(pin_id: int, db: Session = Depends(get_db)):
+    pin = db.execute(PIN_STATE_BY_ID, {"location_id": pin_id}).first()
     stmt = delete(CatLocation).where(CatLocation.location_id == pin_id)
     result = db.execute(stmt)
     if result.rowcount == 0:
         raise HTTPException(status_code=404, detail="Pin not found")
+    stats.pin_changed(db, tuple(pin) if pin else None, None)
     db.commit()
+    sightings.removed(pin_id)
+    publish(CACHE, "pins")
 
 
 class ConditionUpdate(BaseModel):
@@ -171,19 +394,14 @@ def update_pin_condition(
     current_user_id: int = Depends(get_current_user_id),
     db: Session = Depends(get_db)
 ):
-    # Get the pin
-    pin = db.query(CatLocation).filter(CatLocation.location_id == location_id).first()
-    if not pin:
+    # Pin, cat and the adding user's name in one query
+    row = db.execute(PIN_WITH_CAT_BY_ID, {"location_id": location_id}).first()
+    if not row:
         raise HTTPException(status_code=404, detail="Pin not found")
 
-    # Get the cat
-    cat = db.query(Cat).filter(Cat.cat_id == pin.cat_id).first()
-    if not cat:
-        raise HTTPException(status_code=404, detail="Cat not found")
-
     # Check if user is allowed to change to ADOPTED or PASSED
     if payload.condition in ["ADOPTED", "PASSED"]:
-        if cat.adding_user != current_user_id:
+        if row.adding_user_id != current_user_id:
             raise HTTPException(
                 status_code=403,
                 detail="Only the user who added the cat can mark it as adopted or passed"
@@ -197,57 +415,26 @@ def update_pin_condition(
             detail=f"Invalid condition. Must be one of: {', '.join(valid_conditions)}"
         )
 
-    old_condition = pin.condition or "NORMAL"
-    pin.condition = payload.condition
-    db.commit()
-    db.refresh(pin)
-
-    # If condition changed to URGENT or AT VET, create activity log entry
-    if payload.condition in ["URGENT", "AT VET"] and payload.description:
-        activity_description = f"Condition changed to {payload.condition}: {payload.description}"
-        
-        # Create activity log entry for condition change
-        new_log = ActivityLog(
-            cat_id=pin.cat_id,
-            user_id=current_user_id,
-            activity_description=activity_description,
+    with unit_of_work(db):
+        db.execute(
+            update(CatLocation)
+            .where(CatLocation.location_id == location_id)
+            .values(condition=payload.condition)
         )
-        db.add(new_log)
-        db.commit()
-    
-    # If condition changed to ADOPTED or PASSED, create activity log entry
-    if payload.condition in ["ADOPTED", "PASSED"]:
-        activity_description = f"Cat marked as {payload.condition}"
-        
-        # Create activity log entry for condition change
-        new_log = ActivityLog(
-            cat_id=pin.cat_id,
-            user_id=current_user_id,
-            activity_description=activity_description,
-        )
-        db.add(new_log)
-        db.commit()
+        stats.pin_changed(db, (row.condition, row.region), (payload.condition, row.region))
 
-    # Get user who added the cat
-    adding_user = db.query(User).filter(User.user_id == cat.adding_user).first() if cat.adding_user else None
-    
-    # Get condition, default to NORMAL if None or empty
-    condition_value = getattr(pin, 'condition', None)
-    if not condition_value or condition_value.strip() == '':
-        condition_value = "NORMAL"
+        # If condition changed to URGENT or AT VET, create activity log entry
+        if payload.condition in ["URGENT", "AT VET"] and payload.description:
+            description = f"Condition changed to {payload.condition}: {payload.description}"
+            db.add(ActivityLog(cat_id=row.cat_id, user_id=current_user_id, activity_description=description))
+            stats.activity_added(db, current_user_id, description)
 
-    return {
-        "location_id": pin.location_id,
-        "cat_id": pin.cat_id,
-        "latitude": float(pin.latitude),
-        "longitude": float(pin.longitude),
-        "created_at": str(pin.created_at) if pin.created_at is not None else None,
-        "condition": condition_value,
-        "name": cat.name if cat else None,
-        "age": cat.age if cat else None,
-        "gender": cat.gender if cat else None,
-        "image_url": cat.image_url if cat else None,
-        "notes": cat.notes if cat else None,
-        "adding_user_id": cat.adding_user if cat else None,
-        "adding_user_username": adding_user.username if adding_user else None,
-    }
\ No newline at end of file
+        # If condition changed to ADOPTED or PASSED, create activity log entry
+        if payload.condition in ["ADOPTED", "PASSED"]:
+            description = f"Cat marked as {payload.condition}"
+            db.add(ActivityLog(cat_id=row.cat_id, user_id=current_user_id, activity_description=description))
+            stats.activity_added(db, current_user_id, description)
+
+        after_commit(db, publish, CACHE, "pins", f"activity:cat:{row.cat_id}")
+
+    return {**_pin_dict(row), "condition": payload.condition}
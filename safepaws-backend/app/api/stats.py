@@ -0,0 +1,36 @@
+from fastapi import APIRouter, Depends
+from pydantic import BaseModel
+from sqlalchemy.orm import Session
+from app.db.session import get_db
+from app.db import stats
+from app.core.rate_limit import rate_limit
+from app.core.responses import FastJSONResponse
+
+router = APIRouter(prefix="/stats", tags=["stats"])
+
+
+class VolunteerOut(BaseModel):
+    user_id: int
+    username: str
+    contributions: int
+
+
+class StatsOut(BaseModel):
+    cats_on_map: int
+    cats_by_condition: dict[str, int]
+    active_listings: int
+    adoptions_this_month: int
+    contributions_this_week: int
+    top_volunteers: list[VolunteerOut]
+    month: str  # e.g. "2025-01"
+    week: str  # ISO week, e.g. "2025-W03"
+    generated_at: str
+
+
+@router.get("/", response_model=StatsOut, dependencies=[Depends(rate_limit("public_read"))])
+def get_stats(db: Session = Depends(get_db)):
+    """
+    Headline numbers for the home page, read from the stat_counters running
+    totals (refreshed at most every STATS_TTL seconds), never from the base tables.
+    """
+    return FastJSONResponse(stats.snapshot(db))
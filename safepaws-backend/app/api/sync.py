@@ -0,0 +1,242 @@
+# app/api/sync.py
+# Offline replay for field volunteers: actions queued on the phone while out
+# of coverage go up in one request once it reconnects.
+#
+#   POST /sync
+#   {"actions": [
+#     {"key": "3f0c9a...", "type": "cat", "data": {"name": "Ginger", "gender": "M"}},
+#     {"key": "9a21e4...", "type": "pin", "cat_ref": "3f0c9a...", "data": {"latitude": 24.71, "longitude": 46.67}},
+#     {"key": "b7e410...", "type": "condition", "location_ref": "9a21e4...",
+#      "data": {"condition": "URGENT", "description": "Limping"}},
+#     {"key": "c1d95f...", "type": "contribution", "cat_ref": "3f0c9a...", "data": {"activity_description": "Fed"}}
+#   ]}
+#   -> {"results": [{"key": "3f0c9a...", "status": 201, "result": {"cat_id": 812, ...}, "replayed": false}, ...]}
+#
+# Each action goes through the handler of its own endpoint (POST /cats/,
+# POST /pins/, PUT /pins/{location_id}/condition, POST /activity/), in order,
+# SYNC_CHUNK actions per transaction with a savepoint around each one: an
+# action that is refused (404, 403, invalid data) is undone alone and the
+# others go on. cat_ref / location_ref point at an earlier action (in this
+# request or a previous one) for ids the phone could not know offline; an
+# action whose reference failed gets 424.
+#
+# key is generated by the client once per action and sent again on every
+# retry. What each action got, applied or refused, is stored under
+# (user, key) in sync_keys in the same transaction as the action, and a retry
+# gets that back with "replayed": true instead of applying it twice, so a
+# reconnect that drops halfway just sends the whole queue again. 5xx and 424
+# results are not stored, those actions run again on retry. Keys expire after
+# SYNC_KEY_TTL_HOURS; expired rows are deleted every SYNC_PRUNE_SECONDS, so the
+# table holds at most what the "sync" rate limit lets through in that time.
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, List, Literal
+
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel, Field, ValidationError
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.api.activity import create_activity_log
+from app.api.cat import CatIn, CatOut, create_cat
+from app.api.pins import ConditionUpdate, PinIn, PinWithCatOut, create_pin, update_pin_condition
+from app.core.metrics import REGISTRY
+from app.core.rate_limit import rate_limit
+from app.core.responses import dumps
+from app.db.auth import get_current_user_id
+from app.db.models import SyncKey
+from app.db.schemas import ActivityLogCreate, ActivityLogOut
+from app.db.session import get_db
+from app.db.uow import savepoint, unit_of_work
+
+router = APIRouter(prefix="/sync", tags=["sync"])
+
+SYNC_MAX_ACTIONS = int(os.getenv("SYNC_MAX_ACTIONS", "100"))
+SYNC_CHUNK = int(os.getenv("SYNC_CHUNK", "25"))
+SYNC_KEY_TTL_HOURS = float(os.getenv("SYNC_KEY_TTL_HOURS", "168"))
+SYNC_PRUNE_SECONDS = float(os.getenv("SYNC_PRUNE_SECONDS", "300"))
+
+sync_actions = REGISTRY.counter(
+    "safepaws_sync_actions_total", "Actions received by POST /sync", ("type", "outcome")
+)
+sync_keys_pruned = REGISTRY.counter("safepaws_sync_keys_pruned_total", "Expired idempotency keys deleted")
+
+_pruned_at = 0.0
+_prune_lock = threading.Lock()
+
+
+# ---------- SCHEMAS ----------
+class SyncAction(BaseModel):
+    key: str = Field(..., min_length=1, max_length=64, description="Generated once per action, the same on retries")
+    type: Literal["cat", "pin", "condition", "contribution"]
+    data: dict[str, Any] = {}
+    # key of an earlier action whose cat_id / location_id fills in this one's
+    cat_ref: str | None = Field(None, max_length=64)
+    location_ref: str | None = Field(None, max_length=64)
+
+
+class SyncIn(BaseModel):
+    actions: List[SyncAction] = Field(..., min_length=1, max_length=SYNC_MAX_ACTIONS)
+
+
+class SyncResultOut(BaseModel):
+    key: str
+    status: int  # what the action's own endpoint would have answered
+    result: dict[str, Any] | None = None
+    detail: Any = None
+    replayed: bool = False
+
+
+class SyncOut(BaseModel):
+    results: List[SyncResultOut]
+
+
+class ConditionAction(ConditionUpdate):
+    location_id: int
+
+
+# ---------- ACTIONS ----------
+# (db, user_id, data) -> (status, body), raising HTTPException or ValidationError when refused
+def _cat(db: Session, user_id: int, data: dict) -> tuple[int, dict]:
+    cat = create_cat(CatIn(**data), db, user_id)
+    return 201, CatOut.model_validate(cat, from_attributes=True).model_dump()
+
+
+def _pin(db: Session, user_id: int, data: dict) -> tuple[int, dict]:
+    return 201, create_pin(PinIn(**data), db).model_dump()
+
+
+def _condition(db: Session, user_id: int, data: dict) -> tuple[int, dict]:
+    action = ConditionAction(**data)
+    return 200, PinWithCatOut(**update_pin_condition(action.location_id, action, user_id, db)).model_dump()
+
+
+def _contribution(db: Session, user_id: int, data: dict) -> tuple[int, dict]:
+    return 201, ActivityLogOut(**create_activity_log(ActivityLogCreate(**data), user_id, db)).model_dump()
+
+
+ACTIONS = {"cat": _cat, "pin": _pin, "condition": _condition, "contribution": _contribution}
+
+
+# ---------- HELPERS ----------
+def _prune(db: Session, cutoff: datetime) -> None:
+    """Delete expired keys, at most once per SYNC_PRUNE_SECONDS per worker."""
+    global _pruned_at
+    with _prune_lock:
+        if time.monotonic() - _pruned_at < SYNC_PRUNE_SECONDS:
+            return
+        _pruned_at = time.monotonic()
+    with unit_of_work(db):
+        deleted = db.execute(delete(SyncKey).where(SyncKey.created_at < cutoff)).rowcount
+    if deleted > 0:
+        sync_keys_pruned.inc(amount=deleted)
+
+
+def _stored(db: Session, user_id: int, keys: set[str], cutoff: datetime) -> dict[str, dict]:
+    """Results already stored for these keys. Expired ones are deleted so the keys can be used again."""
+    with unit_of_work(db):
+        db.execute(
+            delete(SyncKey).where(
+                SyncKey.user_id == user_id, SyncKey.idempotency_key.in_(keys), SyncKey.created_at < cutoff
+            )
+        )
+        rows = db.execute(
+            select(SyncKey.idempotency_key, SyncKey.status, SyncKey.result)
+            .where(SyncKey.user_id == user_id, SyncKey.idempotency_key.in_(keys))
+        ).all()
+    return {row.idempotency_key: {"status": row.status, **json.loads(row.result or "{}")} for row in rows}
+
+
+def _resolve(action: SyncAction, done: dict[str, dict]) -> dict:
+    """The action's data with cat_id / location_id filled in from the actions it refers to."""
+    data = dict(action.data)
+    for ref, field in ((action.cat_ref, "cat_id"), (action.location_ref, "location_id")):
+        if ref is None:
+            continue
+        earlier = done.get(ref)
+        if earlier is None:
+            raise HTTPException(status_code=424, detail=f"Unknown {field} reference {ref!r}")
+        if earlier["status"] >= 300 or field not in (earlier.get("result") or {}):
+            raise HTTPException(status_code=424, detail=f"Referenced action {ref!r} failed")
+        data[field] = earlier["result"][field]
+    return data
+
+
+def _apply(db: Session, user_id: int, action: SyncAction, now: datetime, done: dict[str, dict]) -> tuple[dict, bool]:
+    """
+    Run one action inside the current unit of work. Returns its result and
+    whether that was stored under its key (not for 5xx, conflicts or failed
+    references, which may go differently on a retry).
+    """
+    claim = SyncKey(user_id=user_id, idempotency_key=action.key, status=0, created_at=now)
+    try:
+        with savepoint(db):
+            db.add(claim)
+            db.flush()
+    except IntegrityError:
+        # Another request holding the same key committed first: its result shows up on the next retry
+        sync_actions.inc(action.type, "conflict")
+        return {"status": 409, "detail": "This action is being applied by another request, retry"}, False
+
+    try:
+        data = _resolve(action, done)
+        with savepoint(db):
+            status, result = ACTIONS[action.type](db, user_id, data)
+        body = {"result": result}
+    except HTTPException as e:
+        status, body = e.status_code, {"detail": e.detail}
+    except ValidationError as e:
+        status, body = 422, {"detail": e.errors(include_url=False, include_context=False)}
+
+    keep = status < 500 and status != 424
+    if keep:
+        claim.status = status
+        claim.result = dumps(body).decode()
+    else:
+        db.delete(claim)
+    sync_actions.inc(action.type, "applied" if status < 300 else "failed")
+    return {"status": status, **body}, keep
+
+
+# ---------- SYNC ----------
+@router.post("/", response_model=SyncOut, dependencies=[Depends(rate_limit("sync", per="user"))])
+def sync(
+    payload: SyncIn,
+    current_user_id: int = Depends(get_current_user_id),
+    db: Session = Depends(get_db),
+):
+    """
+    Apply queued offline actions in order, each at most once per key. The
+    response has one result per action, in the same order; the request itself
+    succeeds even when some of its actions are refused.
+    """
+    now = datetime.now().replace(microsecond=0)
+    cutoff = now - timedelta(hours=SYNC_KEY_TTL_HOURS)
+    _prune(db, cutoff)
+
+    keys = {a.key for a in payload.actions} | {
+        ref for a in payload.actions for ref in (a.cat_ref, a.location_ref) if ref is not None
+    }
+    done = _stored(db, current_user_id, keys, cutoff)
+
+    results = []
+    actions = payload.actions
+    for start in range(0, len(actions), SYNC_CHUNK):
+        chunk = []
+        with unit_of_work(db):
+            for action in actions[start:start + SYNC_CHUNK]:
+                if action.key in done:
+                    sync_actions.inc(action.type, "replayed")
+                    chunk.append((action.key, done[action.key], True))
+                    continue
+                outcome, kept = _apply(db, current_user_id, action, now, done)
+                if kept:
+                    done[action.key] = outcome
+                chunk.append((action.key, outcome, False))
+        # Committed: only now are these results true
+        results += [{"key": key, **outcome, "replayed": replayed} for key, outcome, replayed in chunk]
+    return {"results": results}
@@ -1,14 +1,18 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy import update
 from sqlalchemy.orm import Session
 from app.db.models import User
 from app.db.schemas import UserCreate, UserLogin, UserUpdate
-from app.db.utils import hash_password, verify_password
+from app.db.utils import hash_password, verify_and_update_password
 from app.db.auth import create_access_token, get_current_user
 from app.db.session import get_db
+from app.core.rate_limit import rate_limit
+from app.core.invalidation import publish, PRINCIPAL
+from app.db.statements import LOGIN_USER, PROFILE
 
 router = APIRouter(prefix="/users", tags=["users"])
 
-@router.post("/register", status_code=201)
+@router.post("/register", status_code=201, dependencies=[Depends(rate_limit("register"))])
 def register(user: UserCreate, db: Session = Depends(get_db)):
 
     existing_user = db.query(User).filter(User.username == user.username).first()
@@ -36,22 +40,31 @@ def register(user: UserCreate, db: Session = Depends(get_db)):
     return {"message": "User registered successfully!"}
 
 
-@router.post("/login")
+@router.post("/login", dependencies=[Depends(rate_limit("login"))])
 def login(user: UserLogin, db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(User.username == user.username).first()
+    db_user = db.execute(LOGIN_USER, {"username": user.username}).first()
     if not db_user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    if not verify_password(user.password, db_user.password_hash):
+    valid, new_hash = verify_and_update_password(user.password, db_user.password_hash)
+    if not valid:
         raise HTTPException(status_code=401, detail="Incorrect password")
 
-    token = create_access_token(data={"sub": db_user.username})
+    # Stored hash uses an old bcrypt cost: keep the fresh one computed during verification
+    if new_hash:
+        db.execute(update(User).where(User.user_id == db_user.user_id).values(password_hash=new_hash))
+        db.commit()
+
+    # ver: tokens issued before the next password change stop being accepted
+    token = create_access_token(
+        data={"sub": db_user.username, "user_id": db_user.user_id, "ver": db_user.token_version}
+    )
     return {"message": "Login successful", "access_token": token, "token_type": "bearer"}
 
 
 @router.get("/profile")
 def profile(current_user: str = Depends(get_current_user), db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.username == current_user).first()
+    user = db.execute(PROFILE, {"username": current_user}).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
@@ -91,11 +104,16 @@ def update_profile(
 
     if updated_data.password:
         user.password_hash = hash_password(updated_data.password)
+        # Revokes every token issued so far, this one included
+        user.token_version = (user.token_version or 0) + 1
 
     db.commit()
     db.refresh(user)
 
-    return {
+    # Cached tokens of this user are checked against the database again on their next request, in every worker
+    publish(PRINCIPAL, username)
+
+    response = {
         "message": "Profile updated successfully",
         "user": {
             "full_name": user.full_name,
@@ -104,4 +122,11 @@ def update_profile(
             "username": user.username,
         }
     }
+    if updated_data.password:
+        # The caller's token was just revoked: hand back one for the new password
+        response["access_token"] = create_access_token(
+            data={"sub": user.username, "user_id": user.user_id, "ver": user.token_version}
+        )
+        response["token_type"] = "bearer"
+    return response
 
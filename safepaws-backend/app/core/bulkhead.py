@@ -0,0 +1,255 @@
+# app/core/bulkhead.py
+# Per route group concurrency limits (bulkheads) with bounded wait queues.
+#
+# A burst of writes can only use the slots of the "write" group, so map polling
+# in the "read" group keeps its own share of the thread and DB pools. Requests
+# that would wait longer than the group timeout are rejected straight away with
+# a 503 instead of timing out on the client after holding a queue slot.
+#
+# Groups are configured as name=max_concurrent:max_queue:timeout_seconds, e.g.
+#   BULKHEADS="write=8:32:5;read=32:128:10"
+import asyncio
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+
+from app.core.metrics import REGISTRY
+
+BULKHEADS_ENABLED = os.getenv("BULKHEADS_ENABLED", "true").lower() not in ("0", "false", "no")
+
+DEFAULT_BULKHEADS = {
+    # bcrypt, already bounded by the hash pool; this keeps waiters off the thread pool
+    "auth": "4:16:5",
+    "write": "8:32:5",
+    "read": "32:128:10",
+    # holds its slot for the whole download
+    "export": "2:4:5",
+}
+
+# Evaluated in order, first match wins. (group, methods or None for any, path prefixes)
+ROUTE_GROUPS = (
+    ("auth", {"POST"}, ("/users/login", "/users/register")),
+    ("export", None, ("/export",)),
+    ("write", {"POST", "PUT", "PATCH", "DELETE"}, ("/",)),
+    ("read", None, ("/",)),
+)
+
+# Never queued: probes, scrapes and the internal endpoints used while debugging an overload
+EXEMPT_PREFIXES = ("/metrics", "/healthz", "/internal")
+
+bulkhead_active = REGISTRY.gauge(
+    "safepaws_bulkhead_active", "Requests currently running per bulkhead", ("group",)
+)
+bulkhead_queued = REGISTRY.gauge(
+    "safepaws_bulkhead_queued", "Requests waiting for a slot per bulkhead", ("group",)
+)
+bulkhead_rejected = REGISTRY.counter(
+    "safepaws_bulkhead_rejected_total", "Requests shed by a bulkhead", ("group", "reason")
+)
+bulkhead_wait = REGISTRY.histogram(
+    "safepaws_bulkhead_wait_seconds", "Time spent waiting for a bulkhead slot", ("group",),
+    buckets=(0.001, 0.005, 0.025, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+
+
+class Rejected(Exception):
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Bulkhead:
+    """
+    Semaphore with a bounded FIFO queue and early rejection.
+
+    Slots are handed over directly from a finishing request to the oldest waiter.
+    State is guarded by a thread lock (never held across an await) because the
+    test client and some deployments run more than one event loop per process.
+    """
+
+    def __init__(self, name: str, max_concurrent: int, max_queue: int, timeout: float):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.active = 0
+        self.rejected = 0
+        # moving average of how long a request holds a slot, used to estimate queue wait
+        self.avg_service = 0.05
+        self._waiters: deque[asyncio.Future] = deque()
+        self._lock = threading.Lock()
+
+    def estimated_wait(self, position: int) -> float:
+        return math.ceil(position / self.max_concurrent) * self.avg_service
+
+    async def acquire(self, timeout: float | None = None) -> float:
+        """Wait for a slot, returns the time spent waiting. Raises Rejected."""
+        timeout = self.timeout if timeout is None else min(timeout, self.timeout)
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self.active < self.max_concurrent and not self._waiters:
+                self.active += 1
+                self._update_gauges()
+                return 0.0
+            if len(self._waiters) >= self.max_queue:
+                self._reject("queue_full")
+            estimate = self.estimated_wait(len(self._waiters) + 1)
+            if estimate > timeout:
+                self._reject("deadline", estimate)
+            waiter = loop.create_future()
+            self._waiters.append(waiter)
+            self._update_gauges()
+
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self._discard(waiter)
+                self._reject("timeout")
+        except asyncio.CancelledError:
+            # Client went away while queued; give back a slot we may have been handed
+            with self._lock:
+                self._discard(waiter)
+            if waiter.done() and not waiter.cancelled():
+                self.release(0.0)
+            raise
+        return time.perf_counter() - start
+
+    def release(self, held: float) -> None:
+        with self._lock:
+            if held:
+                self.avg_service += (held - self.avg_service) * 0.1
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                if not waiter.done():
+                    # Hand the slot over, active stays the same
+                    waiter.get_loop().call_soon_threadsafe(self._wake, waiter)
+                    self._update_gauges()
+                    return
+            self.active -= 1
+            self._update_gauges()
+
+    def _wake(self, waiter: asyncio.Future) -> None:
+        if waiter.done():
+            # Timed out between the hand over and this callback: pass the slot on
+            self.release(0.0)
+        else:
+            waiter.set_result(None)
+
+    def _discard(self, waiter: asyncio.Future) -> None:
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+        self._update_gauges()
+
+    def _reject(self, reason: str, estimate: float | None = None):
+        self.rejected += 1
+        bulkhead_rejected.inc(self.name, reason)
+        retry_after = estimate if estimate is not None else self.estimated_wait(len(self._waiters) + 1)
+        raise Rejected(reason, retry_after)
+
+    def _update_gauges(self) -> None:
+        bulkhead_active.set(self.name, value=self.active)
+        bulkhead_queued.set(self.name, value=len(self._waiters))
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue,
+                "timeout_seconds": self.timeout,
+                "active": self.active,
+                "queued": len(self._waiters),
+                "rejected": self.rejected,
+                "avg_service_ms": round(self.avg_service * 1000, 3),
+            }
+
+
+def _load_bulkheads() -> dict[str, Bulkhead]:
+    config = dict(DEFAULT_BULKHEADS)
+    for item in os.getenv("BULKHEADS", "").split(";"):
+        if "=" in item:
+            name, value = item.split("=", 1)
+            config[name.strip()] = value.strip()
+    bulkheads = {}
+    for name, value in config.items():
+        max_concurrent, max_queue, timeout = value.split(":")
+        bulkheads[name] = Bulkhead(name, int(max_concurrent), int(max_queue), float(timeout))
+    return bulkheads
+
+
+bulkheads = _load_bulkheads()
+
+
+def group_for(method: str, path: str) -> str | None:
+    if path.startswith(EXEMPT_PREFIXES):
+        return None
+    for name, methods, prefixes in ROUTE_GROUPS:
+        if (methods is None or method in methods) and path.startswith(prefixes):
+            return name if name in bulkheads else None
+    return None
+
+
+def snapshot() -> dict:
+    return {name: bulkhead.snapshot() for name, bulkhead in bulkheads.items()}
+
+
+def _client_timeout(scope) -> float | None:
+    # Clients may tell us how long they are willing to wait, in seconds
+    for key, value in scope.get("headers", ()):
+        if key == b"x-client-timeout":
+            try:
+                return float(value)
+            except ValueError:
+                return None
+    return None
+
+
+class BulkheadMiddleware:
+    """Pure ASGI middleware: runs each request inside the bulkhead of its route group."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not BULKHEADS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        name = group_for(scope["method"], scope["path"])
+        if name is None:
+            await self.app(scope, receive, send)
+            return
+
+        bulkhead = bulkheads[name]
+        try:
+            waited = await bulkhead.acquire(_client_timeout(scope))
+        except Rejected as exc:
+            await _send_overloaded(send, name, exc)
+            return
+        bulkhead_wait.observe(name, value=waited)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            bulkhead.release(time.perf_counter() - start)
+
+
+async def _send_overloaded(send, group: str, exc: Rejected) -> None:
+    body = json.dumps({"detail": "Server is busy, please retry shortly", "bulkhead": group}).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": 503,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode("latin-1")),
+            (b"retry-after", str(max(1, math.ceil(exc.retry_after))).encode("latin-1")),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,212 @@
+# app/core/compression.py
+# gzip / brotli response compression.
+#
+# Bodies under COMPRESSION_MIN_SIZE go out as is (the headers would eat the
+# gain). brotli is used when the client accepts it, otherwise gzip. Responses
+# that already carry a Content-Encoding (e.g. precompressed response cache hits)
+# are left alone, so cached bytes are compressed once per encoding, not once
+# per hit. Compression time is the calling thread's CPU time, not the process's,
+# so other requests running meanwhile do not count.
+#
+# Paths under COMPRESSION_EXCLUDE (comma separated prefixes) are never compressed.
+# The default, /media, serves images (already compressed) with byte ranges.
+import gzip
+import os
+import time
+import zlib
+
+from app.core.metrics import REGISTRY
+
+try:
+    import brotli
+except ImportError:  # dev setups only, brotli is in requirements.txt
+    brotli = None
+
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "true").lower() not in ("0", "false", "no")
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+EXCLUDED_PREFIXES = tuple(p for p in os.getenv("COMPRESSION_EXCLUDE", "/media").split(",") if p)
+
+COMPRESSIBLE_TYPES = (
+    b"application/json",
+    b"application/x-msgpack",
+    b"application/x-ndjson",
+    b"text/",
+)
+
+compression_seconds = REGISTRY.histogram(
+    "safepaws_compression_seconds", "CPU time spent compressing response bodies", ("encoding",),
+    buckets=(0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1),
+)
+compression_bytes = REGISTRY.counter(
+    "safepaws_compression_bytes_total", "Response bytes before (in) and after (out) compression",
+    ("encoding", "direction"),
+)
+
+
+def choose_encoding(accept_encoding: str | None) -> str | None:
+    """Best encoding we support from an Accept-Encoding header, honouring q=0."""
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    if brotli is not None and accepted.get("br", 0) > 0:
+        return "br"
+    if accepted.get("gzip", 0) > 0 or ("gzip" not in accepted and accepted.get("*", 0) > 0):
+        return "gzip"
+    return None
+
+
+def is_compressible(content_type: bytes | None) -> bool:
+    return bool(content_type) and content_type.lower().startswith(COMPRESSIBLE_TYPES)
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    start = time.thread_time()
+    if encoding == "br":
+        out = brotli.compress(body, quality=BROTLI_QUALITY)
+    else:
+        out = gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    _record(encoding, start, len(body), len(out))
+    return out
+
+
+def _record(encoding: str, start: float, size_in: int, size_out: int) -> None:
+    compression_seconds.observe(encoding, value=time.thread_time() - start)
+    compression_bytes.inc(encoding, "in", amount=size_in)
+    compression_bytes.inc(encoding, "out", amount=size_out)
+
+
+class _StreamCompressor:
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._obj = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._obj = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        start = time.thread_time()
+        if self.encoding == "br":
+            out = self._obj.process(data)
+            if final:
+                out += self._obj.finish()
+        else:
+            out = self._obj.compress(data)
+            if final:
+                out += self._obj.flush()
+        _record(self.encoding, start, len(data), len(out))
+        return out
+
+
+def _header(headers, name: bytes) -> bytes | None:
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
+
+
+def add_vary(headers: list, value: bytes) -> None:
+    for i, (key, existing) in enumerate(headers):
+        if key.lower() == b"vary":
+            if value.lower() not in existing.lower():
+                headers[i] = (key, existing + b", " + value)
+            return
+    headers.append((b"vary", value))
+
+
+class CompressionMiddleware:
+    """Pure ASGI middleware. Buffers up to COMPRESSION_MIN_SIZE, then compresses (streaming if needed)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or not COMPRESSION_ENABLED
+            or (EXCLUDED_PREFIXES and scope["path"].startswith(EXCLUDED_PREFIXES))
+        ):
+            await self.app(scope, receive, send)
+            return
+        accept = _header(scope.get("headers", ()), b"accept-encoding")
+        encoding = choose_encoding(accept.decode("latin-1") if accept else None)
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive, _CompressingSender(send, encoding).send)
+
+
+class _CompressingSender:
+    def __init__(self, send, encoding: str):
+        self._send = send
+        self.encoding = encoding
+        self.start_message = None
+        self.mode = None  # None until decided, then "identity" or "stream"
+        self.buffer = b""
+        self.compressor = None
+
+    async def send(self, message):
+        if message["type"] == "http.response.start":
+            self.start_message = message
+            return
+        if message["type"] != "http.response.body":
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more = message.get("more_body", False)
+
+        if self.mode == "identity":
+            await self._send(message)
+            return
+        if self.mode == "stream":
+            await self._send({"type": "http.response.body", "body": self.compressor.compress(body, not more), "more_body": more})
+            return
+
+        headers = list(self.start_message.get("headers", []))
+        if (
+            self.start_message["status"] in (204, 304)
+            or _header(headers, b"content-encoding") is not None
+            or not is_compressible(_header(headers, b"content-type"))
+        ):
+            await self._flush_identity(message)
+            return
+
+        self.buffer += body
+        if len(self.buffer) < COMPRESSION_MIN_SIZE:
+            if more:
+                return  # keep buffering until we know whether it is worth it
+            await self._flush_identity({"type": "http.response.body", "body": self.buffer})
+            return
+
+        headers = [(k, v) for k, v in headers if k.lower() != b"content-length"]
+        headers.append((b"content-encoding", self.encoding.encode("latin-1")))
+        add_vary(headers, b"Accept-Encoding")
+        if not more:
+            compressed = compress(self.buffer, self.encoding)
+            headers.append((b"content-length", str(len(compressed)).encode("latin-1")))
+            await self._send({**self.start_message, "headers": headers})
+            await self._send({"type": "http.response.body", "body": compressed})
+            return
+
+        self.mode = "stream"
+        self.compressor = _StreamCompressor(self.encoding)
+        await self._send({**self.start_message, "headers": headers})
+        await self._send({"type": "http.response.body", "body": self.compressor.compress(self.buffer, False), "more_body": True})
+        self.buffer = b""
+
+    async def _flush_identity(self, message):
+        self.mode = "identity"
+        await self._send(self.start_message)
+        await self._send(message)
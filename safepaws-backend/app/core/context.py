@@ -0,0 +1,24 @@
+# app/core/context.py
+from contextvars import ContextVar
+
+# ASGI scope of the request currently being handled. Set by the metrics
+# middleware so code far away from the router (SQL event hooks, caches)
+# can find out which route it is running for.
+current_scope: ContextVar[dict | None] = ContextVar("current_scope", default=None)
+
+
+def route_template(scope: dict | None) -> str:
+    """
+    Route template for a request, e.g. /pins/{location_id}/condition, never the raw path
+    """
+    if scope is None:
+        return "none"
+    route = scope.get("route")
+    if route is not None:
+        return getattr(route, "path", "unmatched")
+    # Responses served before routing (e.g. response cache hits) name their template here
+    return scope.get("route_path", "unmatched")
+
+
+def current_route() -> str:
+    return route_template(current_scope.get())
@@ -0,0 +1,239 @@
+# app/core/geo.py
+# Point-in-polygon lookups over a static set of polygons.
+#
+#   index = PolygonIndex.from_geojson(feature_collection, key="name")
+#   index.locate(46.67, 24.71)      # lon, lat -> "Riyadh" or None
+#
+# Polygons are bulk loaded into an R-tree packed with Sort-Tile-Recursive
+# (STR): leaves are bounding boxes grouped into slices by x then by y, so
+# siblings barely overlap and a point query visits one or two nodes per level.
+# Candidates whose box contains the point then get the exact even-odd ray test
+# against their rings (outer ring in, holes out). The index is immutable, so
+# lookups need no locking.
+#
+# Coordinates follow GeoJSON: [longitude, latitude]. When polygons overlap,
+# the feature that comes first in the file wins.
+#
+# ProximityGrid is the other way round: a mutable spatial hash of recent
+# points, for "what else was seen within a few metres and minutes of here?".
+import math
+from collections import deque
+from typing import Any, Iterable, NamedTuple
+
+NODE_CAPACITY = 16
+EARTH_RADIUS_M = 6_371_000
+
+
+def distance_m(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle (haversine) distance in metres."""
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((p2 - p1) / 2) ** 2
+         + math.cos(p1) * math.cos(p2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+class BBox(NamedTuple):
+    minx: float
+    miny: float
+    maxx: float
+    maxy: float
+
+    def contains(self, x: float, y: float) -> bool:
+        return self.minx <= x <= self.maxx and self.miny <= y <= self.maxy
+
+
+def _union(boxes: Iterable[BBox]) -> BBox:
+    boxes = list(boxes)
+    return BBox(
+        min(b.minx for b in boxes), min(b.miny for b in boxes),
+        max(b.maxx for b in boxes), max(b.maxy for b in boxes),
+    )
+
+
+def _ring_bbox(ring) -> BBox:
+    xs = [p[0] for p in ring]
+    ys = [p[1] for p in ring]
+    return BBox(min(xs), min(ys), max(xs), max(ys))
+
+
+def _in_ring(x: float, y: float, ring) -> bool:
+    inside = False
+    x1, y1 = ring[-1][0], ring[-1][1]
+    for point in ring:
+        x2, y2 = point[0], point[1]
+        if (y1 > y) != (y2 > y) and x < (x2 - x1) * (y - y1) / (y2 - y1) + x1:
+            inside = not inside
+        x1, y1 = x2, y2
+    return inside
+
+
+class Polygon:
+    """One GeoJSON polygon: an outer ring and optional holes."""
+
+    __slots__ = ("rings", "bbox", "value", "order")
+
+    def __init__(self, rings, value: Any, order: int):
+        self.rings = [[(float(p[0]), float(p[1])) for p in ring] for ring in rings]
+        self.bbox = _ring_bbox(self.rings[0])
+        self.value = value
+        self.order = order
+
+    def contains(self, x: float, y: float) -> bool:
+        if not _in_ring(x, y, self.rings[0]):
+            return False
+        return not any(_in_ring(x, y, hole) for hole in self.rings[1:])
+
+
+class _Node(NamedTuple):
+    bbox: BBox
+    children: list  # _Node or Polygon
+    leaf: bool
+
+
+def _str_pack(items: list, boxes: list[BBox], leaf: bool) -> list[_Node]:
+    """One level of STR packing: items -> nodes of at most NODE_CAPACITY children."""
+    n = len(items)
+    pages = math.ceil(n / NODE_CAPACITY)
+    slices = math.ceil(math.sqrt(pages))
+    per_slice = slices * NODE_CAPACITY
+    order = sorted(range(n), key=lambda i: boxes[i].minx + boxes[i].maxx)
+    nodes = []
+    for s in range(0, n, per_slice):
+        column = sorted(order[s:s + per_slice], key=lambda i: boxes[i].miny + boxes[i].maxy)
+        for c in range(0, len(column), NODE_CAPACITY):
+            group = column[c:c + NODE_CAPACITY]
+            nodes.append(_Node(_union(boxes[i] for i in group), [items[i] for i in group], leaf))
+    return nodes
+
+
+class PolygonIndex:
+    def __init__(self, polygons: list[Polygon]):
+        self.size = len(polygons)
+        self.values = list(dict.fromkeys(p.value for p in polygons))
+        self._root = None
+        if not polygons:
+            return
+        nodes = _str_pack(polygons, [p.bbox for p in polygons], leaf=True)
+        while len(nodes) > 1:
+            nodes = _str_pack(nodes, [n.bbox for n in nodes], leaf=False)
+        self._root = nodes[0]
+
+    @classmethod
+    def from_geojson(cls, collection: dict, key: str = "name") -> "PolygonIndex":
+        """
+        Index a FeatureCollection of Polygon/MultiPolygon features by
+        properties[key]. Every polygon of a MultiPolygon gets its own entry so
+        its own (tighter) bounding box is used.
+        """
+        polygons = []
+        for order, feature in enumerate(collection.get("features", ())):
+            geometry = feature.get("geometry") or {}
+            value = (feature.get("properties") or {}).get(key)
+            if value is None:
+                raise ValueError(f"feature {order} has no '{key}' property")
+            if geometry.get("type") == "Polygon":
+                parts = [geometry["coordinates"]]
+            elif geometry.get("type") == "MultiPolygon":
+                parts = geometry["coordinates"]
+            else:
+                raise ValueError(f"feature {order} ({value}) is not a Polygon or MultiPolygon")
+            polygons += [Polygon(rings, value, order) for rings in parts if rings]
+        return cls(polygons)
+
+    def locate(self, x: float, y: float) -> Any | None:
+        """Value of the first polygon (in file order) containing (x, y), or None."""
+        if self._root is None or not self._root.bbox.contains(x, y):
+            return None
+        best = None
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            for child in node.children:
+                if not child.bbox.contains(x, y):
+                    continue
+                if not node.leaf:
+                    stack.append(child)
+                elif (best is None or child.order < best.order) and child.contains(x, y):
+                    best = child
+        return None if best is None else best.value
+
+
+class _Sighting(NamedTuple):
+    key: Any
+    latitude: float
+    longitude: float
+    at: float  # seconds (epoch)
+    value: Any
+    cell: tuple[int, int]
+
+
+class ProximityGrid:
+    """
+    Recent points hashed into square cells of about radius_m, for "anything
+    within radius_m and window seconds of here?" in O(1) expected time: a
+    query reads the 3x3 cells around the point instead of every point.
+
+    Each key (e.g. a pin id) has one current position; adding it again moves
+    it. Points older than window are evicted as newer ones arrive. Not thread
+    safe, callers hold a lock.
+    """
+
+    def __init__(self, radius_m: float, window: float):
+        self.radius_m = radius_m
+        self.window = window
+        self._dlat = math.degrees(radius_m / EARTH_RADIUS_M)
+        self._cells: dict[tuple[int, int], list[_Sighting]] = {}
+        self._by_key: dict[Any, _Sighting] = {}
+        self._order: deque[_Sighting] = deque()  # by arrival, for eviction
+
+    def __len__(self) -> int:
+        return len(self._by_key)
+
+    def _cell(self, latitude: float, longitude: float, row: int | None = None) -> tuple[int, int]:
+        if row is None:
+            row = math.floor(latitude / self._dlat)
+        # Cell width in longitude for this row, so cells stay about radius_m wide at any latitude
+        dlon = self._dlat / max(math.cos(math.radians((row + 0.5) * self._dlat)), 1e-6)
+        return row, math.floor(longitude / dlon)
+
+    def add(self, key, latitude: float, longitude: float, at: float, value=None) -> None:
+        self.discard(key)
+        sighting = _Sighting(key, latitude, longitude, at, value, self._cell(latitude, longitude))
+        self._cells.setdefault(sighting.cell, []).append(sighting)
+        self._by_key[key] = sighting
+        self._order.append(sighting)
+        self.evict(at)
+
+    def discard(self, key) -> None:
+        sighting = self._by_key.pop(key, None)
+        if sighting is not None:
+            cell = self._cells[sighting.cell]
+            cell.remove(sighting)
+            if not cell:
+                del self._cells[sighting.cell]
+
+    def evict(self, now: float) -> None:
+        while self._order and self._order[0].at < now - self.window:
+            old = self._order.popleft()
+            if self._by_key.get(old.key) is old:
+                self.discard(old.key)
+        # Moved keys leave stale entries behind in the deque, trim them too
+        while self._order and self._by_key.get(self._order[0].key) is not self._order[0]:
+            self._order.popleft()
+
+    def near(self, latitude: float, longitude: float, at: float) -> list[tuple[float, Any, float, Any]]:
+        """(distance_m, key, seconds apart, value) of points within radius_m and window, nearest first."""
+        row, _ = self._cell(latitude, longitude)
+        found = []
+        for r in (row - 1, row, row + 1):
+            _, col = self._cell(latitude, longitude, r)
+            for c in (col - 1, col, col + 1):
+                for s in self._cells.get((r, c), ()):
+                    apart = abs(at - s.at)
+                    if apart > self.window:
+                        continue
+                    d = distance_m(latitude, longitude, s.latitude, s.longitude)
+                    if d <= self.radius_m:
+                        found.append((d, s.key, apart, s.value))
+        found.sort(key=lambda f: f[0])
+        return found
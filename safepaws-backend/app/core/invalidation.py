@@ -0,0 +1,204 @@
+# app/core/invalidation.py
+# Cross-worker invalidation bus.
+#
+# Write paths call publish(topic, *keys) after commit. The keys are evicted in
+# this process straight away and sent as a datagram to every other worker on
+# the same host over Unix domain sockets in INVALIDATION_SOCKET_DIR (one socket
+# per worker). Each worker runs a subscriber thread that applies what it receives.
+#
+#   publish(CACHE, "pins", "activity:cat:12")   # response cache tags
+#   publish(PRINCIPAL, "someuser")              # cached tokens of a user
+#
+# Every message carries the publisher's sequence number. A receiver that sees
+# a gap (datagram dropped because its queue was full, worker paused, ...) can
+# not know what it missed, so it flushes all of its caches instead.
+#
+# Without INVALIDATION_SOCKET_DIR the bus is local only (single worker).
+import json
+import logging
+import os
+import socket
+import threading
+import uuid
+from collections import defaultdict
+from typing import Callable, Iterable
+
+from app.core.metrics import REGISTRY
+
+INVALIDATION_SOCKET_DIR = os.getenv("INVALIDATION_SOCKET_DIR")
+MAX_DATAGRAM = 8192
+
+# Topics
+CACHE = "cache"
+PRINCIPAL = "principal"
+
+log = logging.getLogger("safepaws.invalidation")
+
+bus_messages = REGISTRY.counter(
+    "safepaws_invalidation_messages_total", "Invalidation messages by direction", ("direction", "topic")
+)
+bus_gaps = REGISTRY.counter(
+    "safepaws_invalidation_gaps_total", "Sequence gaps detected (each one triggers a full flush)"
+)
+bus_send_errors = REGISTRY.counter(
+    "safepaws_invalidation_send_errors_total", "Datagrams that could not be delivered to a peer"
+)
+
+
+class InvalidationBus:
+    def __init__(self, socket_dir: str | None):
+        self.socket_dir = socket_dir
+        self.node_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._handlers: dict[str, list[Callable[[tuple[str, ...]], None]]] = defaultdict(list)
+        self._flush_handlers: list[Callable[[], None]] = []
+        self._seq = 0
+        self._seq_lock = threading.Lock()
+        # publisher node id -> last sequence number applied
+        self._last_seen: dict[str, int] = {}
+        self._recv_sock: socket.socket | None = None
+        self._send_sock: socket.socket | None = None
+        self._path: str | None = None
+        self._thread: threading.Thread | None = None
+        self._running = False
+
+    # ---------- handlers ----------
+    def subscribe(self, topic: str, handler: Callable[[tuple[str, ...]], None]) -> None:
+        self._handlers[topic].append(handler)
+
+    def on_flush(self, handler: Callable[[], None]) -> None:
+        self._flush_handlers.append(handler)
+
+    def _dispatch(self, topic: str, keys: tuple[str, ...]) -> None:
+        for handler in self._handlers.get(topic, ()):
+            try:
+                handler(keys)
+            except Exception:
+                log.exception("invalidation handler failed for %s", topic)
+
+    def flush(self) -> None:
+        for handler in self._flush_handlers:
+            try:
+                handler()
+            except Exception:
+                log.exception("flush handler failed")
+
+    # ---------- publishing ----------
+    def publish(self, topic: str, *keys: str) -> None:
+        if not keys:
+            return
+        self._dispatch(topic, keys)
+        bus_messages.inc("local", topic)
+        if self._send_sock is None:
+            return
+        for datagram in self._encode(topic, list(keys)):
+            self._broadcast(datagram)
+            bus_messages.inc("sent", topic)
+
+    def _encode(self, topic: str, keys: list[str]) -> Iterable[bytes]:
+        # Split key lists that do not fit one datagram; every part gets its own sequence number
+        batch: list[str] = []
+        size = 0
+        for key in keys:
+            if batch and size + len(key) + 4 > MAX_DATAGRAM - 256:
+                yield self._message(topic, batch)
+                batch, size = [], 0
+            batch.append(key)
+            size += len(key) + 4
+        if batch:
+            yield self._message(topic, batch)
+
+    def _message(self, topic: str, keys: list[str]) -> bytes:
+        with self._seq_lock:
+            self._seq += 1
+            seq = self._seq
+        return json.dumps({"src": self.node_id, "seq": seq, "topic": topic, "keys": keys}).encode("utf-8")
+
+    def _broadcast(self, datagram: bytes) -> None:
+        try:
+            entries = list(os.scandir(self.socket_dir))
+        except OSError:
+            bus_send_errors.inc()
+            return
+        for entry in entries:
+            if not entry.name.endswith(".sock") or entry.path == self._path:
+                continue
+            try:
+                self._send_sock.sendto(datagram, entry.path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Worker is gone, clean up its socket
+                try:
+                    os.unlink(entry.path)
+                except OSError:
+                    pass
+            except OSError:
+                # Peer queue full (non-blocking send): it will see the sequence gap and flush
+                bus_send_errors.inc()
+
+    # ---------- receiving ----------
+    def _handle(self, data: bytes) -> None:
+        try:
+            message = json.loads(data)
+            src, seq, topic, keys = message["src"], int(message["seq"]), message["topic"], message["keys"]
+        except (ValueError, KeyError, TypeError):
+            log.warning("dropping malformed invalidation message")
+            return
+        if src == self.node_id:
+            return
+        bus_messages.inc("received", topic)
+        last = self._last_seen.get(src)
+        self._last_seen[src] = seq
+        if last is not None and seq != last + 1:
+            bus_gaps.inc()
+            log.warning("invalidation gap from %s (%s -> %s), flushing caches", src, last, seq)
+            self.flush()
+            return
+        self._dispatch(topic, tuple(keys))
+
+    def _receive_loop(self) -> None:
+        while self._running:
+            try:
+                data = self._recv_sock.recv(65536)
+            except socket.timeout:
+                continue
+            except OSError:
+                if self._running:
+                    log.exception("invalidation socket failed")
+                return
+            self._handle(data)
+
+    def start(self) -> None:
+        if not self.socket_dir or self._running:
+            return
+        os.makedirs(self.socket_dir, exist_ok=True)
+        self._path = os.path.join(self.socket_dir, f"{self.node_id}.sock")
+        self._recv_sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._recv_sock.bind(self._path)
+        self._recv_sock.settimeout(1.0)
+        self._send_sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._send_sock.setblocking(False)
+        self._running = True
+        self._thread = threading.Thread(target=self._receive_loop, name="invalidation-bus", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if not self._running:
+            return
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+        for sock in (self._recv_sock, self._send_sock):
+            if sock is not None:
+                sock.close()
+        self._recv_sock = self._send_sock = None
+        if self._path:
+            try:
+                os.unlink(self._path)
+            except OSError:
+                pass
+
+
+bus = InvalidationBus(INVALIDATION_SOCKET_DIR)
+
+publish = bus.publish
+subscribe = bus.subscribe
+on_flush = bus.on_flush
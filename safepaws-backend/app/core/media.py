@@ -0,0 +1,226 @@
+# app/core/media.py
+# Content-addressed image storage and thumbnails.
+#
+# An upload is streamed to a temp file while it is hashed, then renamed to
+#
+#   MEDIA_ROOT/ab/abcdef.../original.jpg       (ab = first two hex digits)
+#
+# so the same image uploaded twice is stored once, and every file name is
+# derived from its content: the URLs (MEDIA_BASE_URL/<sha256>/<name>) never
+# change meaning and can be cached forever. Thumbnails sit next to the
+# original as <width>.webp and <width>.jpg, one pair per THUMBNAIL_SIZES entry.
+#
+# Thumbnails are made by Pillow (optional) in a BoundedProcessPool, never in the
+# request thread: the upload submits the job and returns, and the media route
+# makes a missing thumbnail on demand (first request after a restart, a pool
+# that was full at upload time). Without Pillow the route redirects to the original.
+import hashlib
+import logging
+import os
+import tempfile
+import warnings
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import AsyncIterator
+
+from app.core.metrics import REGISTRY
+from app.core.process_pool import BoundedProcessPool, PoolSaturated
+
+try:
+    from PIL import Image
+except ImportError:  # optional, without it only originals are served
+    Image = None
+
+MEDIA_ROOT = Path(os.getenv("MEDIA_ROOT", str(Path(__file__).resolve().parents[2] / "media")))
+# Prefix of the URLs put in API responses, e.g. https://api.example.com/media behind a CDN
+MEDIA_BASE_URL = os.getenv("MEDIA_BASE_URL", "/media").rstrip("/")
+MEDIA_MAX_BYTES = int(os.getenv("MEDIA_MAX_BYTES", str(10 * 1024 * 1024)))
+THUMBNAIL_SIZES = tuple(int(s) for s in os.getenv("THUMBNAIL_SIZES", "160,320,640").split(",") if s)
+# Size used by the list endpoints (thumbnail_url)
+LIST_THUMBNAIL_SIZE = int(os.getenv("LIST_THUMBNAIL_SIZE", "320"))
+THUMBNAIL_FORMATS = ("webp", "jpg")
+THUMBNAIL_QUALITY = int(os.getenv("THUMBNAIL_QUALITY", "80"))
+THUMBNAIL_POOL_WORKERS = int(os.getenv("THUMBNAIL_POOL_WORKERS", "2"))
+THUMBNAIL_POOL_QUEUE = int(os.getenv("THUMBNAIL_POOL_QUEUE", "16"))
+# Largest image decoded, in pixels (40M: e.g. 8000x5000, about 120 MB as RGB).
+# Bigger ones fail with DecompressionBombError instead of exhausting a worker's memory
+MEDIA_MAX_PIXELS = int(os.getenv("MEDIA_MAX_PIXELS", str(40_000_000)))
+
+CHUNK = 64 * 1024
+
+# magic bytes -> (extension, content type)
+IMAGE_TYPES = (
+    (b"\xff\xd8\xff", "jpg", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "png", "image/png"),
+    (b"GIF87a", "gif", "image/gif"),
+    (b"GIF89a", "gif", "image/gif"),
+)
+CONTENT_TYPES = {"jpg": "image/jpeg", "png": "image/png", "gif": "image/gif", "webp": "image/webp"}
+
+log = logging.getLogger("safepaws.media")
+
+media_bytes = REGISTRY.counter(
+    "safepaws_media_bytes_total", "Image bytes received (upload) and stored (new originals)", ("direction",)
+)
+thumbnails = REGISTRY.counter(
+    "safepaws_thumbnails_total", "Thumbnail jobs by trigger (upload, on_demand) and result", ("trigger", "result")
+)
+
+
+def limit_pixels(max_pixels: int) -> None:
+    # Pillow warns above MAX_IMAGE_PIXELS and refuses above twice that; only the refusal matters here
+    if Image is not None:
+        Image.MAX_IMAGE_PIXELS = max_pixels // 2
+        warnings.filterwarnings("ignore", category=Image.DecompressionBombWarning)
+
+
+limit_pixels(MEDIA_MAX_PIXELS)
+
+# Also runs the image hash jobs (app/core/perceptual.py), in workers that may never import
+# this module: the initializer sets the pixel limit in every worker
+thumbnail_pool = BoundedProcessPool(
+    "thumbnails", THUMBNAIL_POOL_WORKERS, THUMBNAIL_POOL_QUEUE, limit_pixels, (MEDIA_MAX_PIXELS,)
+)
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+class UnsupportedImage(Exception):
+    pass
+
+
+def sniff(head: bytes) -> tuple[str, str] | None:
+    """(extension, content type) from the first bytes of a file."""
+    for magic, ext, content_type in IMAGE_TYPES:
+        if head.startswith(magic):
+            return ext, content_type
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp", "image/webp"
+    return None
+
+
+def directory(key: str) -> Path:
+    return MEDIA_ROOT / key[:2] / key
+
+
+def url(key: str, name: str) -> str:
+    return f"{MEDIA_BASE_URL}/{key}/{name}"
+
+
+def thumbnail_name(size: int, fmt: str) -> str:
+    return f"{size}.{fmt}"
+
+
+def thumbnail_urls(key: str) -> dict[int, dict[str, str]]:
+    return {size: {fmt: url(key, thumbnail_name(size, fmt)) for fmt in THUMBNAIL_FORMATS} for size in THUMBNAIL_SIZES}
+
+
+def find_original(key: str) -> Path | None:
+    folder = directory(key)
+    for ext in CONTENT_TYPES:
+        path = folder / f"original.{ext}"
+        if path.exists():
+            return path
+    return None
+
+
+async def store(chunks: AsyncIterator[bytes]) -> tuple[str, str]:
+    """
+    Stream an upload to disk while hashing it. Returns (key, original file name).
+    Raises UploadTooLarge past MEDIA_MAX_BYTES and UnsupportedImage unless the
+    content is JPEG, PNG, GIF or WebP (checked on the bytes, not the declared type).
+    """
+    tmp_dir = MEDIA_ROOT / "tmp"
+    tmp_dir.mkdir(parents=True, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    head = b""
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            async for chunk in chunks:
+                if not chunk:
+                    continue
+                size += len(chunk)
+                if size > MEDIA_MAX_BYTES:
+                    raise UploadTooLarge()
+                if len(head) < 16:
+                    head += chunk[:16]
+                digest.update(chunk)
+                fh.write(chunk)
+        media_bytes.inc("upload", amount=size)
+        kind = sniff(head)
+        if kind is None:
+            raise UnsupportedImage()
+        key = digest.hexdigest()
+        name = f"original.{kind[0]}"
+        target = directory(key) / name
+        if target.exists():
+            os.unlink(tmp_path)  # same bytes already stored
+        else:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(tmp_path, target)
+            media_bytes.inc("stored", amount=size)
+        return key, name
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+# ===================== THUMBNAILS (run in the pool's processes) =====================
+
+def make_thumbnails(original: str, sizes: tuple[int, ...], formats: tuple[str, ...], quality: int) -> list[str]:
+    """Write every missing <size>.<fmt> next to original. Returns the names written."""
+    folder = os.path.dirname(original)
+    written = []
+    with Image.open(original) as img:
+        img.seek(0)  # first frame of animations
+        img = img.convert("RGB")
+        for size in sizes:
+            thumb = img.copy()
+            thumb.thumbnail((size, size), Image.LANCZOS)
+            for fmt in formats:
+                name = f"{size}.{fmt}"
+                path = os.path.join(folder, name)
+                if os.path.exists(path):
+                    continue
+                fd, tmp = tempfile.mkstemp(dir=folder)
+                with os.fdopen(fd, "wb") as fh:
+                    if fmt == "webp":
+                        thumb.save(fh, "WEBP", quality=quality, method=4)
+                    else:
+                        thumb.save(fh, "JPEG", quality=quality, optimize=True, progressive=True)
+                os.replace(tmp, path)  # readers never see a half written file
+                written.append(name)
+    return written
+
+
+def submit_thumbnails(key: str, trigger: str):
+    """
+    Queue thumbnail generation for key. Returns the pool future, or None when
+    Pillow is missing, the original is gone or the pool is full (the media route
+    will make them on demand later).
+    """
+    original = find_original(key)
+    if Image is None or original is None:
+        return None
+    try:
+        future = thumbnail_pool.submit(
+            make_thumbnails, str(original), THUMBNAIL_SIZES, THUMBNAIL_FORMATS, THUMBNAIL_QUALITY
+        )
+    except PoolSaturated:
+        thumbnails.inc(trigger, "saturated")
+        return None
+    except (BrokenProcessPool, RuntimeError):
+        # Broken again right after a restart, or shut down meanwhile: never fail
+        # the request (the upload is committed), the media route makes them later
+        log.warning("thumbnail pool broken, %s queued for on-demand generation", key, exc_info=True)
+        thumbnails.inc(trigger, "error")
+        return None
+    future.add_done_callback(
+        lambda f: thumbnails.inc(trigger, "error" if f.cancelled() or f.exception() else "ok")
+    )
+    return future
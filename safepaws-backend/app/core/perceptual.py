@@ -0,0 +1,128 @@
+# app/core/perceptual.py
+# Perceptual image hashes and a Hamming-distance index over them.
+#
+#   h = dhash_file("photo.jpg")             # 64-bit int, in a pool worker
+#   index = HammingIndex()
+#   index.add(h)
+#   index.search(h2, radius=10)             # [(distance, hash), ...] nearest first
+#
+# dHash: the image is shrunk to 9x8 grey pixels and each bit says whether a
+# pixel is brighter than its right neighbour. Re-encoding, resizing and mild
+# colour changes flip a few bits, a different photo flips about half of them.
+#
+# HammingIndex is multi-index hashing: the 64 bits are cut into CHUNKS
+# substrings with one dict each. Two hashes within distance r agree to within
+# r // CHUNKS bits on at least one substring (pigeonhole), so a search only
+# probes the substrings' near variants and checks the few hashes filed there,
+# instead of walking the collection like a BK-tree does (a BK-tree over 100k
+# clustered hashes visits most of its nodes at radius 10). Exact for any radius;
+# cost grows with the number of variants, so radii are capped at MAX_RADIUS.
+from io import BytesIO
+from itertools import combinations
+
+try:
+    from PIL import Image
+except ImportError:  # optional, hashing is unavailable without it
+    Image = None
+
+BITS = 64
+CHUNKS = 4
+CHUNK_BITS = BITS // CHUNKS
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+MAX_RADIUS = 15  # up to 3 flipped bits per chunk: 697 probes per chunk
+
+# What Pillow raises for data it cannot decode (UnidentifiedImageError is an OSError)
+DECODE_ERRORS = (OSError, ValueError, SyntaxError, EOFError) + ((Image.DecompressionBombError,) if Image else ())
+
+
+def _dhash(img) -> int:
+    img.draft("L", (64, 64))  # JPEG: decode at 1/2..1/8 scale, far cheaper than a full decode
+    img = img.convert("L").resize((9, 8), Image.BILINEAR)
+    px = img.tobytes()
+    value = 0
+    for row in range(8):
+        offset = row * 9
+        for col in range(8):
+            value = (value << 1) | (px[offset + col] > px[offset + col + 1])
+    return value
+
+
+# These run inside the pool's worker processes, so they stay module level
+def dhash_file(path: str) -> int:
+    with Image.open(path) as img:
+        return _dhash(img)
+
+
+def dhash_bytes(data: bytes) -> int:
+    with Image.open(BytesIO(data)) as img:
+        return _dhash(img)
+
+
+def to_signed(value: int) -> int:
+    """64-bit hash as a signed BIGINT for storage."""
+    return value - (1 << BITS) if value >= 1 << (BITS - 1) else value
+
+
+def from_signed(value: int) -> int:
+    return value & ((1 << BITS) - 1)
+
+
+_flips: dict[int, list[int]] = {}
+
+
+def _chunk_flips(radius: int) -> list[int]:
+    """XOR masks of every variant of a chunk within radius bits, the chunk itself first."""
+    if radius not in _flips:
+        masks = [0]
+        for r in range(1, radius + 1):
+            for bits in combinations(range(CHUNK_BITS), r):
+                mask = 0
+                for bit in bits:
+                    mask |= 1 << bit
+                masks.append(mask)
+        _flips[radius] = masks
+    return _flips[radius]
+
+
+class HammingIndex:
+    """
+    Set of 64-bit hashes searchable by Hamming distance. add() is not
+    synchronized with search(): callers that mutate a shared index take a lock.
+    """
+
+    def __init__(self):
+        self._tables: list[dict[int, list[int]]] = [{} for _ in range(CHUNKS)]
+        self._hashes: set[int] = set()
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    def add(self, value: int) -> None:
+        if value in self._hashes:
+            return
+        self._hashes.add(value)
+        for i, table in enumerate(self._tables):
+            table.setdefault((value >> (i * CHUNK_BITS)) & CHUNK_MASK, []).append(value)
+
+    def search(self, value: int, radius: int) -> list[tuple[int, int]]:
+        """(distance, hash) of every stored hash within radius of value, nearest first."""
+        if not 0 <= radius <= MAX_RADIUS:
+            raise ValueError(f"radius must be between 0 and {MAX_RADIUS}")
+        flips = _chunk_flips(radius // CHUNKS)
+        seen = set()
+        found = []
+        for i, table in enumerate(self._tables):
+            chunk = (value >> (i * CHUNK_BITS)) & CHUNK_MASK
+            for mask in flips:
+                bucket = table.get(chunk ^ mask)
+                if bucket is None:
+                    continue
+                for candidate in bucket:
+                    if candidate in seen:
+                        continue
+                    seen.add(candidate)
+                    distance = (candidate ^ value).bit_count()
+                    if distance <= radius:
+                        found.append((distance, candidate))
+        found.sort()
+        return found
@@ -0,0 +1,97 @@
+# app/core/process_pool.py
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from app.core.metrics import REGISTRY
+
+pool_tasks = REGISTRY.gauge(
+    "safepaws_process_pool_tasks", "Tasks running or queued in a process pool", ("pool",)
+)
+pool_rejections = REGISTRY.counter(
+    "safepaws_process_pool_rejections_total", "Tasks refused because the pool queue was full", ("pool",)
+)
+
+
+class PoolSaturated(Exception):
+    """Raised by submit() when the pool is already running and queueing its maximum."""
+
+
+class BoundedProcessPool:
+    """
+    Process pool with admission control: at most workers + max_queue tasks are
+    accepted at a time, anything beyond fails fast with PoolSaturated instead of
+    piling up behind the workers. With workers=0 tasks run inline in the caller.
+    The executor is created on first use so importing never spawns processes.
+    """
+
+    def __init__(self, name: str, workers: int, max_queue: int, initializer=None, initargs: tuple = ()):
+        self.name = name
+        self.workers = workers
+        self.initializer = initializer  # run once in each worker process
+        self.initargs = initargs
+        self.capacity = workers + max_queue if workers > 0 else max(max_queue, 1)
+        self._slots = threading.BoundedSemaphore(self.capacity)
+        self._executor: ProcessPoolExecutor | None = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    # spawn: forking a threaded server process is not safe
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+                        initializer=self.initializer, initargs=self.initargs,
+                    )
+        return self._executor
+
+    def submit(self, fn, *args) -> Future:
+        if not self._slots.acquire(blocking=False):
+            pool_rejections.inc(self.name)
+            raise PoolSaturated(self.name)
+        pool_tasks.inc(self.name)
+        try:
+            if self.workers > 0:
+                future = self._submit(fn, args)
+            else:
+                future = Future()
+                try:
+                    future.set_result(fn(*args))
+                except Exception as exc:
+                    future.set_exception(exc)
+        except Exception:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    def _submit(self, fn, args) -> Future:
+        executor = self._get_executor()
+        try:
+            return executor.submit(fn, *args)
+        except BrokenProcessPool:
+            # A worker died (OOM kill etc.) and the executor refuses everything
+            # from then on: replace it with fresh processes and try once more
+            self._discard(executor)
+            return self._get_executor().submit(fn, *args)
+
+    def run(self, fn, *args, timeout: float | None = None):
+        return self.submit(fn, *args).result(timeout)
+
+    def _release(self, _future) -> None:
+        pool_tasks.dec(self.name)
+        self._slots.release()
+
+    def _discard(self, executor: ProcessPoolExecutor) -> None:
+        with self._lock:
+            if self._executor is executor:  # not one another thread has already put in its place
+                executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
@@ -0,0 +1,257 @@
+# app/core/rate_limit.py
+# Token bucket rate limiting, applied per route as a dependency:
+#
+#   @router.post("/login", dependencies=[Depends(rate_limit("login"))])
+#
+# Limits are "<requests>/<second|minute|hour>" and can be overridden with
+# RATE_LIMITS="login=20/minute;public_read=600/minute".
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+
+from fastapi import Depends, HTTPException, Request, status
+
+from app.core.metrics import REGISTRY
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() not in ("0", "false", "no")
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL", "redis://127.0.0.1:6379/0")
+# Only trust X-Forwarded-For when running behind our own proxy
+TRUST_FORWARDED_FOR = os.getenv("TRUST_FORWARDED_FOR", "false").lower() in ("1", "true", "yes")
+MEMORY_BACKEND_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))
+
+DEFAULT_LIMITS = {
+    # bcrypt on every call
+    "login": "10/minute",
+    "register": "5/minute",
+    # unauthenticated full joins
+    "public_read": "120/minute",
+    # per user, for writes that fan out into notifications
+    "write": "30/minute",
+    # per user, decodes an uploaded photo (POST /cats/similar)
+    "image_search": "20/minute",
+    # per user, each call applies up to SYNC_MAX_ACTIONS queued actions (POST /sync)
+    "sync": "10/minute",
+}
+
+rate_limited = REGISTRY.counter(
+    "safepaws_rate_limited_total", "Requests rejected by the rate limiter", ("limit",)
+)
+rate_limit_backend_errors = REGISTRY.counter(
+    "safepaws_rate_limit_backend_errors_total", "Shared backend failures (requests were let through)"
+)
+
+_PERIODS = {"second": 1, "minute": 60, "hour": 3600}
+
+
+class Limit(NamedTuple):
+    burst: int  # bucket size, also the RateLimit-Limit value
+    period: float  # seconds to refill a full bucket
+
+    @property
+    def rate(self) -> float:
+        return self.burst / self.period
+
+
+def parse_limit(text: str) -> Limit:
+    count, _, period = text.strip().partition("/")
+    seconds = _PERIODS.get(period.strip())
+    if seconds is None:
+        seconds = float(period)
+    return Limit(int(count), float(seconds))
+
+
+def _load_limits() -> dict[str, Limit]:
+    limits = dict(DEFAULT_LIMITS)
+    for item in os.getenv("RATE_LIMITS", "").split(";"):
+        if "=" in item:
+            name, value = item.split("=", 1)
+            limits[name.strip()] = value
+    return {name: parse_limit(value) for name, value in limits.items()}
+
+
+# ===================== BACKENDS =====================
+
+class MemoryBackend:
+    """Per-process buckets. O(1) per call, least recently used keys dropped past max_keys."""
+
+    def __init__(self, max_keys: int = MEMORY_BACKEND_MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, key: str, limit: Limit, cost: int = 1) -> tuple[bool, float]:
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.get(key, (limit.burst, now))
+            tokens = min(limit.burst, tokens + (now - last) * limit.rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, tokens
+
+
+_TOKEN_BUCKET_LUA = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 't', 'ts')
+local tokens = tonumber(state[1]) or burst
+local last = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - last) * rate)
+local allowed = 0
+if tokens >= cost then
+  tokens = tokens - cost
+  allowed = 1
+end
+redis.call('HSET', KEYS[1], 't', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return {allowed, tostring(tokens)}
+"""
+
+
+class RedisBackend:
+    """
+    Buckets shared by every worker. Takes any client with a redis-py style
+    eval(script, numkeys, *keys_and_args), so a local redis-server (or any
+    stand-in implementing eval) works for testing.
+    """
+
+    def __init__(self, client, prefix: str = "safepaws:rl:"):
+        self.client = client
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisBackend":
+        import redis  # optional dependency, only needed with RATE_LIMIT_BACKEND=redis
+
+        return cls(redis.Redis.from_url(url))
+
+    def consume(self, key: str, limit: Limit, cost: int = 1) -> tuple[bool, float]:
+        allowed, tokens = self.client.eval(
+            _TOKEN_BUCKET_LUA, 1, self.prefix + key, limit.rate, limit.burst, time.time(), cost
+        )
+        return bool(int(allowed)), float(tokens)
+
+
+class RateLimiter:
+    def __init__(self, backend, limits: dict[str, Limit], enabled: bool = True):
+        self.backend = backend
+        self.limits = limits
+        self.enabled = enabled
+
+    def check(self, name: str, identity: str) -> tuple[bool, dict[str, str]]:
+        limit = self.limits[name]
+        try:
+            allowed, tokens = self.backend.consume(f"{name}:{identity}", limit)
+        except Exception:
+            # A broken shared backend must not take the API down: fail open
+            rate_limit_backend_errors.inc()
+            return True, {}
+        # seconds until the bucket is full again / until one token is available
+        reset = math.ceil((limit.burst - tokens) / limit.rate)
+        headers = {
+            "RateLimit-Limit": str(limit.burst),
+            "RateLimit-Remaining": str(int(tokens)),
+            "RateLimit-Reset": str(reset),
+            "RateLimit-Policy": f"{limit.burst};w={int(limit.period)}",
+        }
+        if not allowed:
+            headers["Retry-After"] = str(max(1, math.ceil((1 - tokens) / limit.rate)))
+        return allowed, headers
+
+
+def _make_backend():
+    if RATE_LIMIT_BACKEND == "redis":
+        return RedisBackend.from_url(RATE_LIMIT_REDIS_URL)
+    return MemoryBackend()
+
+
+limiter = RateLimiter(_make_backend(), _load_limits(), RATE_LIMIT_ENABLED)
+
+
+# ===================== IDENTITY =====================
+
+def client_ip(request: Request) -> str:
+    if TRUST_FORWARDED_FOR:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",", 1)[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+def client_user(request: Request, principal) -> str:
+    # The account, whichever of its tokens is used; the principal is cached by app.db.auth, no query
+    if principal is not None:
+        return "u:" + principal.username
+    return "ip:" + client_ip(request)
+
+
+# ===================== DEPENDENCY =====================
+
+def rate_limit(name: str, per: str = "ip"):
+    """Dependency factory. per="ip" or per="user" (falls back to the IP when anonymous)."""
+    if name not in limiter.limits:
+        raise KeyError(f"no rate limit named {name!r}")
+
+    def check(request: Request, identity: str) -> None:
+        if not limiter.enabled:
+            return
+        allowed, headers = limiter.check(name, identity)
+        if not allowed:
+            rate_limited.inc(name)
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many requests, please slow down",
+                headers=headers,
+            )
+        # Added to whatever response the handler produces by RateLimitHeadersMiddleware
+        request.scope["rate_limit_headers"] = headers
+
+    if per == "user":
+        from app.db.auth import get_optional_principal  # app.db imports app.core, not the other way round
+
+        def user_dependency(request: Request, principal=Depends(get_optional_principal)):
+            check(request, client_user(request, principal))
+
+        return user_dependency
+
+    def dependency(request: Request):
+        check(request, client_ip(request))
+
+    return dependency
+
+
+class RateLimitHeadersMiddleware:
+    """Copies the RateLimit-* headers set by the dependency onto the response."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = scope.get("rate_limit_headers")
+                if headers:
+                    raw = list(message.get("headers", []))
+                    present = {k.lower() for k, _ in raw}
+                    for name, value in headers.items():
+                        encoded = name.lower().encode("latin-1")
+                        if encoded not in present:
+                            raw.append((encoded, value.encode("latin-1")))
+                    message["headers"] = raw
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
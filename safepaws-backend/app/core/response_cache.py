@@ -0,0 +1,357 @@
+# app/core/response_cache.py
+# Cache for the public read endpoints, storing the serialized response bytes.
+#
+# Only anonymous GETs on the routes in RULES are cached. Keys are the route plus
+# its normalized query parameters plus the current version of each tag the
+# response depends on. Write paths publish the tags they touch on the
+# invalidation bus after commit, and invalidate() bumps the tag versions in
+# every worker: every key built from the old versions becomes unreachable at
+# once and ages out of the LRU. The TTL is only a safety net for writes that
+# bypass the API.
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+from urllib.parse import parse_qsl, urlencode
+
+from app.core import compression, invalidation, singleflight
+from app.core.metrics import REGISTRY
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() not in ("0", "false", "no")
+RESPONSE_CACHE_BACKEND = os.getenv("RESPONSE_CACHE_BACKEND", "memory")
+RESPONSE_CACHE_REDIS_URL = os.getenv("RESPONSE_CACHE_REDIS_URL", "redis://127.0.0.1:6379/0")
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "60"))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+RESPONSE_CACHE_MAX_ENTRY_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRY_BYTES", str(8 * 1024 * 1024)))
+# How long concurrent misses wait for the first one before computing themselves
+COLLAPSE_TIMEOUT = float(os.getenv("RESPONSE_CACHE_COLLAPSE_TIMEOUT", "10"))
+
+
+class CacheRule(NamedTuple):
+    name: str
+    route: str  # route template, used as the metrics label for hits
+    pattern: re.Pattern
+    tags: tuple[str, ...]  # formatted with the path parameters
+    params: tuple[str, ...] = ()  # query parameters that change the response, others are ignored
+    vary: tuple[bytes, ...] = ()  # request headers that change the response (content negotiation)
+
+
+RULES = (
+    CacheRule("pins", "/pins/", re.compile(r"^/pins/$"), ("pins",), ("format", "fields", "region", "condition"), (b"accept",)),
+    CacheRule("pin", "/pins/{location_id}", re.compile(r"^/pins/(?P<location_id>\d+)$"), ("pins",)),
+    CacheRule("adoptions", "/adoptions/", re.compile(r"^/adoptions/$"), ("adoptions",)),
+    CacheRule("cats", "/cats/cats", re.compile(r"^/cats/cats$"), ("cats",)),
+    CacheRule(
+        "cat_detail",
+        "/cats/{cat_id}/detail",
+        re.compile(r"^/cats/(?P<cat_id>\d+)/detail$"),
+        ("cats", "pins", "adoptions", "activity:cat:{cat_id}"),
+        ("activity",),
+    ),
+    CacheRule(
+        "cat_activity",
+        "/activity/cat/{cat_id}/public",
+        re.compile(r"^/activity/cat/(?P<cat_id>\d+)/public$"),
+        ("activity:cat:{cat_id}",),
+    ),
+)
+
+cache_requests = REGISTRY.counter(
+    "safepaws_response_cache_requests_total", "Response cache lookups", ("rule", "result")
+)
+cache_size = REGISTRY.gauge(
+    "safepaws_response_cache_size", "In-process response cache usage", ("unit",)
+)
+
+
+# ===================== BACKENDS =====================
+
+class MemoryBackend:
+    """LRU bounded by the total size of the stored bodies."""
+
+    def __init__(self, max_bytes: int = RESPONSE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._entries: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+        self._versions: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            expires, blob = item
+            if expires < time.monotonic():
+                del self._entries[key]
+                self.bytes -= len(blob)
+                return None
+            self._entries.move_to_end(key)
+            return blob
+
+    def set(self, key: str, blob: bytes, ttl: float) -> None:
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= len(old[1])
+            self._entries[key] = (time.monotonic() + ttl, blob)
+            self.bytes += len(blob)
+            while self.bytes > self.max_bytes and self._entries:
+                _, (_, dropped) = self._entries.popitem(last=False)
+                self.bytes -= len(dropped)
+
+    def versions(self, tags: tuple[str, ...]) -> list[int]:
+        return [self._versions.get(tag, 0) for tag in tags]
+
+    def bump(self, tags) -> None:
+        with self._lock:
+            for tag in tags:
+                self._versions[tag] = self._versions.get(tag, 0) + 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+            # keep the versions moving forward so nothing computed before the clear is stored
+            for tag in self._versions:
+                self._versions[tag] += 1
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class RedisBackend:
+    """Shared between workers; tag versions are plain counters next to the entries."""
+
+    def __init__(self, client, prefix: str = "safepaws:rc:"):
+        self.client = client
+        self.prefix = prefix
+        self.bytes = 0
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisBackend":
+        import redis  # optional dependency, only needed with RESPONSE_CACHE_BACKEND=redis
+
+        return cls(redis.Redis.from_url(url))
+
+    def get(self, key: str) -> bytes | None:
+        return self.client.get(self.prefix + key)
+
+    def set(self, key: str, blob: bytes, ttl: float) -> None:
+        self.client.set(self.prefix + key, blob, ex=max(1, int(ttl)))
+
+    def versions(self, tags: tuple[str, ...]) -> list[int]:
+        values = self.client.mget([self.prefix + "v:" + tag for tag in tags])
+        return [int(v or 0) for v in values]
+
+    def bump(self, tags) -> None:
+        pipe = self.client.pipeline()
+        for tag in tags:
+            pipe.incr(self.prefix + "v:" + tag)
+        pipe.execute()
+
+    def clear(self) -> None:
+        # Entries expire on their own; bumping is not possible without knowing every tag
+        pass
+
+    def __len__(self) -> int:
+        return 0
+
+
+def _make_backend():
+    if RESPONSE_CACHE_BACKEND == "redis":
+        return RedisBackend.from_url(RESPONSE_CACHE_REDIS_URL)
+    return MemoryBackend()
+
+
+backend = _make_backend()
+
+_fills = singleflight.Group("response_cache", COLLAPSE_TIMEOUT)
+
+
+def invalidate(*tags: str) -> None:
+    """Local eviction. Write paths use invalidation.publish(CACHE, *tags) so every worker runs this."""
+    if tags:
+        backend.bump(tags)
+
+
+def clear() -> None:
+    backend.clear()
+
+
+invalidation.subscribe(invalidation.CACHE, lambda tags: invalidate(*tags))
+invalidation.on_flush(clear)
+
+
+def _collect() -> None:
+    cache_size.set("bytes", value=backend.bytes)
+    cache_size.set("entries", value=len(backend))
+
+
+REGISTRY.add_collector(_collect)
+
+
+# ===================== KEYS AND ENTRIES =====================
+
+def match_rule(path: str) -> tuple[CacheRule, dict] | None:
+    for rule in RULES:
+        m = rule.pattern.match(path)
+        if m:
+            return rule, m.groupdict()
+    return None
+
+
+def cache_key(rule: CacheRule, scope, path_params: dict) -> str:
+    query = ""
+    query_string = scope.get("query_string", b"")
+    if rule.params and query_string:
+        pairs = parse_qsl(query_string.decode("latin-1"), keep_blank_values=True)
+        query = urlencode(sorted((k, v) for k, v in pairs if k in rule.params))
+    vary = ""
+    if rule.vary:
+        headers = dict(scope.get("headers", ()))
+        vary = "|".join(headers.get(name, b"").decode("latin-1").strip().lower() for name in rule.vary)
+    tags = tuple(tag.format(**path_params) for tag in rule.tags)
+    versions = ",".join(str(v) for v in backend.versions(tags))
+    return f"{rule.name}:{scope['path']}?{query}|{vary}#{versions}"
+
+
+def _encode(content_type: bytes, body: bytes) -> bytes:
+    return content_type + b"\n" + body
+
+
+def _decode(blob: bytes) -> tuple[bytes, bytes]:
+    content_type, _, body = blob.partition(b"\n")
+    return content_type, body
+
+
+def _has_header(scope, name: bytes) -> bool:
+    return any(key == name for key, _ in scope.get("headers", ()))
+
+
+class ResponseCacheMiddleware:
+    """Pure ASGI middleware serving cached bodies for anonymous GETs before routing."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or scope["method"] != "GET"
+            or not RESPONSE_CACHE_ENABLED
+            or _has_header(scope, b"authorization")
+        ):
+            await self.app(scope, receive, send)
+            return
+        matched = match_rule(scope["path"])
+        if matched is None:
+            await self.app(scope, receive, send)
+            return
+
+        rule, path_params = matched
+        key = cache_key(rule, scope, path_params)
+        blob = backend.get(key)
+        if blob is not None:
+            cache_requests.inc(rule.name, "hit")
+            await _send_cached(scope, send, rule, key, blob)
+            return
+
+        filled = False
+
+        async def fill():
+            nonlocal filled
+            filled = True
+            cache_requests.inc(rule.name, "miss")
+            return await self._fill(scope, receive, send, rule, key)
+
+        # Concurrent misses for one key wait for the first one's bytes
+        try:
+            blob, shared = await _fills.do_async(key, fill)
+        except Exception:
+            if filled:
+                raise
+            blob, shared = None, True
+        if not shared:
+            return  # this request computed the response and has already sent it
+        if blob is not None:
+            cache_requests.inc(rule.name, "collapsed")
+            await _send_cached(scope, send, rule, key, blob)
+            return
+        cache_requests.inc(rule.name, "bypass")
+        await self.app(scope, receive, send)
+
+    async def _fill(self, scope, receive, send, rule: CacheRule, key: str) -> bytes | None:
+        status = 0
+        content_type = b"application/json"
+        chunks: list[bytes] = []
+        size = 0
+
+        async def send_wrapper(message):
+            nonlocal status, content_type, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+                for name, value in headers:
+                    if name.lower() == b"content-type":
+                        content_type = value
+                headers.append((b"x-cache", b"MISS"))
+                message["headers"] = headers
+            elif message["type"] == "http.response.body" and status == 200:
+                body = message.get("body", b"")
+                size += len(body)
+                if size <= RESPONSE_CACHE_MAX_ENTRY_BYTES:
+                    chunks.append(body)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
+        if status != 200 or size > RESPONSE_CACHE_MAX_ENTRY_BYTES:
+            return None
+        blob = _encode(content_type, b"".join(chunks))
+        backend.set(key, blob, RESPONSE_CACHE_TTL)
+        return blob
+
+
+def _encoded_body(scope, key: str, content_type: bytes, body: bytes) -> tuple[bytes | None, bytes]:
+    """
+    Compressed variant of a cached body for this client, made on first use and
+    stored next to the entry so later hits reuse the same bytes.
+    """
+    if (
+        not compression.COMPRESSION_ENABLED
+        or len(body) < compression.COMPRESSION_MIN_SIZE
+        or not compression.is_compressible(content_type)
+    ):
+        return None, body
+    accept = dict(scope.get("headers", ())).get(b"accept-encoding")
+    encoding = compression.choose_encoding(accept.decode("latin-1") if accept else None)
+    if encoding is None:
+        return None, body
+    variant_key = f"{key}~{encoding}"
+    variant = backend.get(variant_key)
+    if variant is None:
+        variant = compression.compress(body, encoding)
+        backend.set(variant_key, variant, RESPONSE_CACHE_TTL)
+    return encoding.encode("latin-1"), variant
+
+
+async def _send_cached(scope, send, rule: CacheRule, key: str, blob: bytes) -> None:
+    # Routing is skipped on a hit, so name the route for the metrics middleware here
+    scope["route_path"] = rule.route
+    content_type, body = _decode(blob)
+    encoding, body = _encoded_body(scope, key, content_type, body)
+    headers = [
+        (b"content-type", content_type),
+        (b"content-length", str(len(body)).encode("latin-1")),
+        (b"x-cache", b"HIT"),
+    ]
+    vary = list(rule.vary)
+    if encoding is not None:
+        headers.append((b"content-encoding", encoding))
+        vary.append(b"accept-encoding")
+    if vary:
+        headers.append((b"vary", b", ".join(vary)))
+    await send({"type": "http.response.start", "status": 200, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,201 @@
+# app/core/singleflight.py
+# Single-flight: concurrent calls with the same key share one computation.
+#
+#   group = Group("pins")
+#   value, shared = group.do(key, load_pins, db)              # sync, any thread
+#   value, shared = await group.do_async(key, render, scope)  # async, any event loop
+#
+# The first caller for a key (the leader) runs the function; callers arriving
+# while it runs wait for its result instead of running it again. A follower that
+# waits longer than the group timeout gives up and runs the function itself, so
+# a stuck leader never blocks everyone else. Exceptions from the leader are
+# raised in every waiting follower; if the leader is cancelled, the followers
+# run the function themselves.
+#
+# In-flight calls are tracked with concurrent.futures.Future so sync callers,
+# async callers and different event loops can share the same key.
+#
+# Route handlers use the coalesce() decorator below, so concurrent identical
+# reads run one query and one serialization.
+import asyncio
+import concurrent.futures
+import copy
+import functools
+import inspect
+import os
+import threading
+from typing import Any, Awaitable, Callable, Hashable
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+from app.core.metrics import REGISTRY
+
+SINGLEFLIGHT_TIMEOUT = float(os.getenv("SINGLEFLIGHT_TIMEOUT", "10"))
+
+# Result handed to followers when the leader was cancelled rather than failed
+_ABANDONED = object()
+
+singleflight_calls = REGISTRY.counter(
+    "safepaws_singleflight_calls_total",
+    "Single-flight calls: leader (computed), coalesced (shared a result), timeout (gave up waiting)",
+    ("group", "result"),
+)
+
+
+class Group:
+    def __init__(self, name: str, timeout: float = SINGLEFLIGHT_TIMEOUT):
+        self.name = name
+        self.timeout = timeout
+        self._calls: dict[Hashable, concurrent.futures.Future] = {}
+        self._lock = threading.Lock()
+
+    def _join(self, key: Hashable) -> tuple[concurrent.futures.Future, bool]:
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                return future, False
+            future = self._calls[key] = concurrent.futures.Future()
+            return future, True
+
+    def _finish(self, key: Hashable, future: concurrent.futures.Future, value=None, error=None) -> None:
+        with self._lock:
+            if self._calls.get(key) is future:
+                del self._calls[key]
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(value)
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args, timeout: float | None = None, **kwargs) -> tuple[Any, bool]:
+        """Returns (value, shared). shared is True when the value came from another caller."""
+        future, leader = self._join(key)
+        if not leader:
+            try:
+                value = future.result(self.timeout if timeout is None else timeout)
+            except concurrent.futures.TimeoutError:
+                singleflight_calls.inc(self.name, "timeout")
+                return fn(*args, **kwargs), False
+            if value is _ABANDONED:
+                return fn(*args, **kwargs), False
+            singleflight_calls.inc(self.name, "coalesced")
+            return value, True
+
+        singleflight_calls.inc(self.name, "leader")
+        try:
+            value = fn(*args, **kwargs)
+        except Exception as exc:
+            self._finish(key, future, error=exc)
+            raise
+        except BaseException:
+            self._finish(key, future, _ABANDONED)
+            raise
+        self._finish(key, future, value)
+        return value, False
+
+    async def do_async(
+        self, key: Hashable, fn: Callable[..., Awaitable[Any]], *args, timeout: float | None = None, **kwargs
+    ) -> tuple[Any, bool]:
+        future, leader = self._join(key)
+        if not leader:
+            try:
+                value = await asyncio.wait_for(
+                    asyncio.shield(asyncio.wrap_future(future)), self.timeout if timeout is None else timeout
+                )
+            except asyncio.TimeoutError:
+                singleflight_calls.inc(self.name, "timeout")
+                return await fn(*args, **kwargs), False
+            if value is _ABANDONED:
+                return await fn(*args, **kwargs), False
+            singleflight_calls.inc(self.name, "coalesced")
+            return value, True
+
+        singleflight_calls.inc(self.name, "leader")
+        try:
+            value = await fn(*args, **kwargs)
+        except Exception as exc:
+            self._finish(key, future, error=exc)
+            raise
+        except BaseException:
+            # Leader cancelled (client went away): let the followers compute for themselves
+            self._finish(key, future, _ABANDONED)
+            raise
+        self._finish(key, future, value)
+        return value, False
+
+
+# ===================== HANDLER COALESCING =====================
+
+COALESCE_ENABLED = os.getenv("COALESCE_ENABLED", "true").lower() not in ("0", "false", "no")
+
+
+def _copy(value):
+    # Each request gets its own Response object: FastAPI attaches the request's background tasks to it
+    if isinstance(value, Response):
+        value = copy.copy(value)
+        value.background = None
+        value.raw_headers = list(value.raw_headers)
+    return value
+
+
+def coalesce(name: str, vary: tuple[str, ...] = (), ignore: tuple[str, ...] = ("db",)):
+    """
+    Route handler decorator, under @router.get: identical concurrent calls share
+    one run of the handler.
+
+        @router.get("/", dependencies=[Depends(rate_limit("public_read"))])
+        @coalesce("pins", vary=("accept",))
+        def list_pins(request: Request, region: str | None = None, db: Session = Depends(get_db)): ...
+
+    FastAPI resolves the dependencies (rate limit, auth) for every request
+    before the handler runs, so each caller is limited and authenticated on its
+    own; only the database and serialization work is shared. The key is the
+    handler's arguments after resolution (so it includes the caller's user id
+    where the handler takes one) minus `ignore`, with a Request argument
+    standing for its `vary` headers. Handlers should return a Response built
+    from plain data, not ORM objects bound to the leader's session.
+    """
+    group = Group(name)
+
+    def decorate(fn):
+        signature = inspect.signature(fn)
+
+        def key_of(args, kwargs) -> Hashable | None:
+            bound = signature.bind(*args, **kwargs)
+            parts = []
+            for arg, value in bound.arguments.items():
+                if arg in ignore:
+                    continue
+                if isinstance(value, Request):
+                    value = tuple(value.headers.get(header, "") for header in vary)
+                parts.append((arg, value))
+            key = tuple(parts)
+            try:
+                hash(key)
+            except TypeError:
+                return None
+            return key
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def run_async(*args, **kwargs):
+                key = key_of(args, kwargs) if COALESCE_ENABLED else None
+                if key is None:
+                    return await fn(*args, **kwargs)
+                value, shared = await group.do_async(key, fn, *args, **kwargs)
+                return _copy(value) if shared else value
+            return run_async
+
+        @functools.wraps(fn)
+        def run(*args, **kwargs):
+            key = key_of(args, kwargs) if COALESCE_ENABLED else None
+            if key is None:
+                return fn(*args, **kwargs)
+            value, shared = group.do(key, fn, *args, **kwargs)
+            return _copy(value) if shared else value
+        return run
+
+    return decorate
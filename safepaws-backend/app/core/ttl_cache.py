@@ -0,0 +1,70 @@
+# app/core/ttl_cache.py
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+_MISSING = object()
+
+
+class TTLCache:
+    """
+    Bounded LRU with per-entry expiry. Every operation is O(1) and thread safe.
+    on_evict(key, value) is called for entries dropped by size, expiry or pop().
+    """
+
+    def __init__(self, maxsize: int, ttl: float, on_evict: Callable[[Hashable, Any], None] | None = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        evicted = None
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                return default
+            expires, value = item
+            if expires < time.monotonic():
+                del self._data[key]
+                evicted = value
+            else:
+                self._data.move_to_end(key)
+                return value
+        self._evicted(key, evicted)
+        return default
+
+    def set(self, key: Hashable, value: Any, ttl: float | None = None) -> None:
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        dropped = []
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                dropped.append(self._data.popitem(last=False))
+        for old_key, (_, old_value) in dropped:
+            self._evicted(old_key, old_value)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.pop(key, _MISSING)
+        if item is _MISSING:
+            return default
+        self._evicted(key, item[1])
+        return item[1]
+
+    def clear(self) -> None:
+        with self._lock:
+            items = list(self._data.items())
+            self._data.clear()
+        for key, (_, value) in items:
+            self._evicted(key, value)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def _evicted(self, key, value) -> None:
+        if self.on_evict is not None:
+            self.on_evict(key, value)
@@ -0,0 +1,409 @@
+# app/db/activity_buffer.py
+# Write-behind buffer for "fed the cat" contributions (POST /activity/), the
+# highest-rate write during community feeding drives.
+#
+# With ACTIVITY_WRITE_BEHIND=true a validated contribution is not inserted by
+# its request. It is appended to a local journal (one JSON line) and queued in
+# memory, and the request returns once the line is fsync'ed. Requests that
+# append meanwhile share that fsync (group commit): it runs outside the buffer
+# lock, and one fsync covers every line written before it. A flusher thread
+# writes the queue to activity_log every ACTIVITY_FLUSH_MS, or as soon as
+# ACTIVITY_FLUSH_ROWS are waiting, as multi-row INSERTs with one commit per
+# journal segment.
+#
+#   buffer.add(cat_id, user_id, "Fed", username)   # Pending entry, or None: insert it yourself
+#   pending_for_cat(12)                            # entries of cat 12 not in activity_log yet
+#
+# Queued entries have a negative log_id. The cat read endpoints merge them in,
+# so volunteers see their own taps straight away on the same worker. Other
+# workers see them after the flush.
+#
+# Durability: the journal is cut into segments, one per flush, each flock'ed
+# by its worker. A segment is deleted once its entries are committed along
+# with a row in activity_flushes naming it. At startup, segments no live
+# worker holds (left by a crash) are inserted, unless their activity_flushes
+# row shows they were committed already. So nothing is lost or inserted twice.
+#
+# Backpressure: with ACTIVITY_BUFFER_MAX entries waiting (database down or too
+# slow), add() refuses and the request inserts synchronously, so callers slow
+# down to the database's pace instead of the queue growing.
+# safepaws_activity_buffer_pending and _oldest_seconds show how far behind the
+# flusher is.
+import json
+import logging
+import os
+import socket
+import threading
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import NamedTuple
+
+from sqlalchemy import delete, insert, select
+
+try:
+    import fcntl
+except ImportError:  # not on Windows: one worker per journal directory there
+    fcntl = None
+
+from app.core.invalidation import publish, CACHE
+from app.core.metrics import REGISTRY
+from app.db import stats
+from app.db.models import ActivityFlush, ActivityLog, Cat, User
+from app.db.session import SessionLocal
+from app.db.uow import unit_of_work
+
+ACTIVITY_WRITE_BEHIND = os.getenv("ACTIVITY_WRITE_BEHIND", "false").lower() in ("1", "true", "yes")
+ACTIVITY_JOURNAL_DIR = Path(
+    os.getenv("ACTIVITY_JOURNAL_DIR", str(Path(__file__).resolve().parents[2] / "journal"))
+)
+ACTIVITY_FLUSH_MS = float(os.getenv("ACTIVITY_FLUSH_MS", "250"))
+ACTIVITY_FLUSH_ROWS = int(os.getenv("ACTIVITY_FLUSH_ROWS", "500"))
+ACTIVITY_BUFFER_MAX = int(os.getenv("ACTIVITY_BUFFER_MAX", "20000"))
+ACTIVITY_JOURNAL_FSYNC = os.getenv("ACTIVITY_JOURNAL_FSYNC", "true").lower() not in ("0", "false", "no")
+MAX_BACKOFF = 5.0  # seconds between attempts while the database keeps failing
+SUFFIX = ".jsonl"
+
+log = logging.getLogger("safepaws.activity_buffer")
+
+buffer_pending = REGISTRY.gauge(
+    "safepaws_activity_buffer_pending", "Contributions accepted but not yet in activity_log"
+)
+buffer_oldest = REGISTRY.gauge(
+    "safepaws_activity_buffer_oldest_seconds", "Age of the oldest contribution not yet in activity_log"
+)
+buffer_flushed = REGISTRY.counter(
+    "safepaws_activity_buffer_flushed_total", "Contributions written to activity_log by the flusher"
+)
+buffer_full = REGISTRY.counter(
+    "safepaws_activity_buffer_full_total", "Contributions inserted synchronously because the buffer was full"
+)
+buffer_dropped = REGISTRY.counter(
+    "safepaws_activity_buffer_dropped_total", "Queued contributions whose cat was deleted before the flush"
+)
+buffer_flush_errors = REGISTRY.counter(
+    "safepaws_activity_buffer_flush_errors_total", "Flushes that failed and will be retried"
+)
+buffer_flush_seconds = REGISTRY.histogram(
+    "safepaws_activity_buffer_flush_seconds", "Time to write one journal segment to activity_log"
+)
+
+
+class Pending(NamedTuple):
+    """A queued contribution, shaped like an ACTIVITY_COLUMNS row."""
+    log_id: int  # negative until written
+    activity_time: datetime
+    activity_description: str
+    cat_id: int
+    user_id: int | None
+    username: str | None
+
+
+class _Segment:
+    def __init__(self, name: str, path: Path, fd: int):
+        self.name = name
+        self.path = path
+        self.fd = fd  # open, and flock'ed, until the file is deleted; -1 after
+        self.entries: list[Pending] = []
+
+
+def _read(path: Path) -> list[Pending]:
+    entries = []
+    with open(path, "rb") as f:
+        for line in f:
+            try:
+                item = json.loads(line)
+            except ValueError:  # torn last line: its request never got an answer
+                continue
+            entries.append(Pending(0, datetime.fromisoformat(item["t"]), item["d"], item["c"], item["u"], None))
+    return entries
+
+
+def _insert(db, segment: str, entries: list[Pending], batch: int) -> set[int]:
+    """The entries of one segment and its activity_flushes row, in the caller's transaction. Returns their cats."""
+    cats = {e.cat_id for e in entries}
+    users = {e.user_id for e in entries if e.user_id is not None}
+    # Cats and users deleted while the entries waited: a direct insert would have been refused / had no user
+    live_cats = set(db.execute(select(Cat.cat_id).where(Cat.cat_id.in_(cats))).scalars())
+    live_users = set(db.execute(select(User.user_id).where(User.user_id.in_(users))).scalars()) if users else set()
+    rows = [
+        {
+            "activity_time": e.activity_time,
+            "activity_description": e.activity_description,
+            "cat_id": e.cat_id,
+            "user_id": e.user_id if e.user_id in live_users else None,
+        }
+        for e in entries
+        if e.cat_id in live_cats
+    ]
+    if len(rows) < len(entries):
+        buffer_dropped.inc(amount=len(entries) - len(rows))
+    for start in range(0, len(rows), batch):
+        db.execute(insert(ActivityLog).values(rows[start:start + batch]))
+    for row in rows:
+        stats.activity_added(db, row["user_id"], row["activity_description"])
+    db.add(ActivityFlush(segment=segment, flushed_at=datetime.now().replace(microsecond=0)))
+    return live_cats
+
+
+class ActivityBuffer:
+    def __init__(self, directory: Path, enabled: bool, flush_ms: float, flush_rows: int, max_pending: int,
+                 fsync: bool = True):
+        self.directory = directory
+        self.enabled = enabled
+        self.interval = flush_ms / 1000
+        self.flush_rows = flush_rows
+        self.max_pending = max_pending
+        self.fsync = fsync
+        self.host = socket.gethostname()
+        self.node = f"{self.host}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()  # one fsync at a time; segment fds are closed under it too
+        self._appended = 0  # lines written to the journal
+        self._synced = 0  # of which fsync'ed
+        self._unsynced: list[_Segment] = []  # segments written to since the last fsync
+        self._current: _Segment | None = None
+        self._sealed: list[_Segment] = []  # oldest first
+        self._by_cat: dict[int, list[Pending]] = {}
+        self._pending = 0
+        self._segments = 0
+        self._ids = 0
+        self._done: list[str] = []  # deleted segments whose activity_flushes rows can go
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    # ---------- requests ----------
+    def add(self, cat_id: int, user_id: int | None, description: str, username: str | None) -> Pending | None:
+        """Queue a validated contribution. None when the buffer is off or full: insert it directly."""
+        now = datetime.now().replace(microsecond=0)
+        line = json.dumps(
+            {"t": now.isoformat(), "c": cat_id, "u": user_id, "d": description}, ensure_ascii=False
+        ).encode("utf-8") + b"\n"
+        with self._lock:
+            if self._thread is None:
+                return None
+            if self._pending >= self.max_pending:
+                buffer_full.inc()
+                return None
+            if self._current is None:
+                self._current = self._open()
+            os.write(self._current.fd, line)
+            self._appended += 1
+            appended = self._appended
+            if not self._unsynced or self._unsynced[-1] is not self._current:
+                self._unsynced.append(self._current)
+            self._ids += 1
+            entry = Pending(-self._ids, now, description, cat_id, user_id, username)
+            self._current.entries.append(entry)
+            self._by_cat.setdefault(cat_id, []).append(entry)
+            self._pending += 1
+            if self._pending >= self.flush_rows:
+                self._wake.set()
+        buffer_pending.inc()
+        if self.fsync:
+            self._sync(appended)
+        return entry
+
+    def _sync(self, appended: int) -> None:
+        """Return once the first `appended` journal lines are on disk, fsync'ing them if no one else has."""
+        with self._sync_lock:
+            if self._synced >= appended:
+                return  # covered by the fsync of a request that got here first
+            with self._lock:
+                target, segments, self._unsynced = self._appended, self._unsynced, []
+            try:
+                for segment in segments:
+                    if segment.fd >= 0:  # closed: its entries are committed already
+                        os.fsync(segment.fd)
+            except OSError:
+                with self._lock:
+                    self._unsynced[:0] = segments
+                raise
+            self._synced = target
+
+    def pending_for_cat(self, cat_id: int) -> list[Pending]:
+        """Entries of a cat not in activity_log yet, oldest first."""
+        with self._lock:
+            return list(self._by_cat.get(cat_id, ()))
+
+    def _open(self) -> _Segment:
+        self._segments += 1
+        name = f"{self.node}-{self._segments:06d}"
+        temporary = self.directory / f"{name}.tmp"
+        fd = os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        path = self.directory / f"{name}{SUFFIX}"
+        os.rename(temporary, path)  # recovery only sees segments that are locked already
+        return _Segment(name, path, fd)
+
+    # ---------- flushing ----------
+    def flush(self) -> int:
+        """Write every queued entry to activity_log. Returns how many; raises if the database fails."""
+        with self._lock:
+            if self._current is not None:
+                self._sealed.append(self._current)
+                self._current = None
+            sealed = list(self._sealed)
+        return sum(self._write(segment) for segment in sealed)
+
+    def _write(self, segment: _Segment) -> int:
+        db = SessionLocal()
+        try:
+            with buffer_flush_seconds.time(), unit_of_work(db):
+                if self._done:
+                    db.execute(delete(ActivityFlush).where(ActivityFlush.segment.in_(self._done)))
+                if db.get(ActivityFlush, segment.name) is not None:
+                    # A previous attempt committed but its answer was lost: only the cleanup is left
+                    cats = {entry.cat_id for entry in segment.entries}
+                else:
+                    cats = _insert(db, segment.name, segment.entries, self.flush_rows)
+        finally:
+            db.close()
+        self._done = []
+
+        written = len(segment.entries)
+        per_cat: dict[int, int] = {}
+        for entry in segment.entries:
+            per_cat[entry.cat_id] = per_cat.get(entry.cat_id, 0) + 1
+        with self._lock:
+            self._sealed.remove(segment)
+            # Segments are written in order, so a cat's entries in this one are the first it has queued
+            for cat_id, count in per_cat.items():
+                queued = self._by_cat[cat_id]
+                del queued[:count]
+                if not queued:
+                    del self._by_cat[cat_id]
+            self._pending -= written
+        buffer_pending.dec(amount=written)
+        buffer_flushed.inc(amount=written)
+        os.unlink(segment.path)
+        with self._sync_lock:
+            os.close(segment.fd)
+            segment.fd = -1
+        self._done.append(segment.name)
+        if cats:
+            publish(CACHE, *(f"activity:cat:{cat_id}" for cat_id in sorted(cats)))
+        return written
+
+    def _oldest(self) -> float:
+        with self._lock:
+            segment = self._sealed[0] if self._sealed else self._current
+            if segment is None or not segment.entries:
+                return 0.0
+            return max(0.0, (datetime.now() - segment.entries[0].activity_time).total_seconds())
+
+    def _run(self) -> None:
+        failures = 0
+        while True:
+            if failures:
+                # Ignore wake-ups while the database is failing, retry with backoff
+                stopping = self._stop.wait(min(MAX_BACKOFF, self.interval * 2 ** failures))
+            else:
+                self._wake.wait(self.interval)
+                self._wake.clear()
+                stopping = self._stop.is_set()
+            try:
+                self.flush()
+                failures = 0
+            except Exception:
+                failures += 1
+                buffer_flush_errors.inc()
+                if failures == 1:
+                    log.exception("activity flush failed, retrying with backoff")
+            buffer_oldest.set(value=self._oldest())
+            if stopping:
+                return
+
+    # ---------- recovery ----------
+    def recover(self) -> int:
+        """Insert what crashed workers left in the journal directory. Returns the number of entries inserted."""
+        recovered = 0
+        for path in sorted(self.directory.glob(f"*{SUFFIX}")):
+            try:
+                fd = os.open(path, os.O_RDONLY)
+            except FileNotFoundError:  # flushed by its worker meanwhile
+                continue
+            try:
+                if fcntl is not None:
+                    try:
+                        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except BlockingIOError:  # a live worker's
+                        continue
+                if os.fstat(fd).st_nlink == 0:  # its worker flushed and deleted it before letting go
+                    continue
+                recovered += self._replay(path.stem, _read(path))
+                path.unlink(missing_ok=True)
+            finally:
+                os.close(fd)
+
+        # Rows of this host's segments that are gone are not needed any more
+        left = {path.stem for path in self.directory.glob(f"*{SUFFIX}")}
+        db = SessionLocal()
+        try:
+            with unit_of_work(db):
+                names = db.execute(
+                    select(ActivityFlush.segment)
+                    .where(ActivityFlush.segment.startswith(f"{self.host}-", autoescape=True))
+                ).scalars().all()
+                gone = [name for name in names if name not in left]
+                if gone:
+                    db.execute(delete(ActivityFlush).where(ActivityFlush.segment.in_(gone)))
+        finally:
+            db.close()
+        if recovered:
+            log.warning("activity journal: %d entries recovered from an unclean shutdown", recovered)
+        return recovered
+
+    def _replay(self, segment: str, entries: list[Pending]) -> int:
+        if not entries:
+            return 0
+        db = SessionLocal()
+        try:
+            with unit_of_work(db):
+                if db.get(ActivityFlush, segment) is not None:
+                    return 0  # committed before the crash, only the delete was missed
+                cats = _insert(db, segment, entries, self.flush_rows)
+        finally:
+            db.close()
+        publish(CACHE, *(f"activity:cat:{cat_id}" for cat_id in sorted(cats)))
+        return len(entries)
+
+    # ---------- lifecycle ----------
+    def start(self) -> None:
+        """Recover what a crash left behind (always), then flush in the background (if enabled)."""
+        if self._thread is not None:
+            return
+        if self.directory.is_dir():
+            self.recover()
+        if not self.enabled:
+            return
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="activity-flush", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop taking entries and write what is queued. What cannot be written stays in the journal."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._stop.set()
+        self._wake.set()
+        thread.join(timeout=10)
+
+
+buffer = ActivityBuffer(
+    ACTIVITY_JOURNAL_DIR,
+    ACTIVITY_WRITE_BEHIND,
+    ACTIVITY_FLUSH_MS,
+    ACTIVITY_FLUSH_ROWS,
+    ACTIVITY_BUFFER_MAX,
+    ACTIVITY_JOURNAL_FSYNC,
+)
+
+
+def pending_for_cat(cat_id: int) -> list[Pending]:
+    return buffer.pending_for_cat(cat_id)
@@ -1,19 +1,83 @@
 # auth.py
 
+import hashlib
+import os
+import threading
+import time
 from datetime import datetime, timedelta
+from typing import NamedTuple
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import jwt, JWTError
 from sqlalchemy.orm import Session
+from app.core import invalidation
+from app.core.ttl_cache import TTLCache
 from app.db.session import get_db
-from app.db.models import User
+from app.db.statements import TOKEN_USER
 # مفتاح التشفير والخوارزمية
 SECRET_KEY = "super-secret-key-change-me"  # تقدرين تغيرينه بعدين
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
 
+# كاش للتوكنات اللي تم التحقق منها عشان ما نفك التشفير ونسأل الداتابيس كل طلب
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "300"))
+
 # هذا اللي يخلق الـ "Authorize" البسيط (بس يطلب توكن)
 security = HTTPBearer()
+# نفسه بس ما يرجع 401 إذا ما فيه توكن (للصفحات العامة اللي تعرض شي زيادة لليوزر المسجل)
+optional_security = HTTPBearer(auto_error=False)
+
+
+class Principal(NamedTuple):
+    key: str  # hash of the token, used as the cache key
+    username: str
+    user_id: int
+    expires_at: float  # token exp as a unix timestamp
+
+
+# username -> cache keys of that user's tokens, so a profile change can drop them all
+_keys_by_user: dict[str, set[str]] = {}
+_index_lock = threading.Lock()
+
+
+def _forget_key(key: str, principal: Principal) -> None:
+    with _index_lock:
+        keys = _keys_by_user.get(principal.username)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del _keys_by_user[principal.username]
+
+
+_principals = TTLCache(PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL, on_evict=_forget_key)
+
+
+def _remember(principal: Principal) -> None:
+    # Never cache past the token's own expiry
+    ttl = principal.expires_at - time.time()
+    if ttl <= 0:
+        return
+    _principals.set(principal.key, principal, ttl)
+    with _index_lock:
+        _keys_by_user.setdefault(principal.username, set()).add(principal.key)
+
+
+def invalidate_user(username: str) -> None:
+    """
+    يمسح كل التوكنات المخزنة لهذا اليوزر من الكاش (بعد تعديل البروفايل أو الباسورد).
+    الطلب الجاي يرجع يتحقق من الداتابيس: لو الباسورد تغير، token_version تغير والتوكن القديم يرجع 401.
+    بدون هذا الاستدعاء، يوزر انحذف يبقى توكنه مقبول لين ينتهي من الكاش (PRINCIPAL_CACHE_TTL)
+    """
+    with _index_lock:
+        keys = list(_keys_by_user.get(username, ()))
+    for key in keys:
+        _principals.pop(key)
+
+
+# Profile changes in any worker are published on the bus
+invalidation.subscribe(invalidation.PRINCIPAL, lambda usernames: [invalidate_user(u) for u in usernames])
+invalidation.on_flush(_principals.clear)
 
 
 def create_access_token(data: dict, expires_delta: timedelta | None = None) -> str:
@@ -27,32 +91,82 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None) -> s
     return encoded_jwt
 
 
-def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> str:
+def get_principal(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: Session = Depends(get_db),
+) -> Principal:
     """
-    يأخذ التوكن من الهيدر، يفك التشفير، ويرجع username من الـ sub
+    يفك التوكن مرة وحدة ويخزن النتيجة، الطلبات اللي بعدها تاخذها من الكاش.
+    أول مرة (أو بعد ما ينمسح من الكاش) نتأكد من الداتابيس إن اليوزر موجود وإن التوكن ما انلغى
     """
     token = credentials.credentials
+    key = hashlib.blake2b(token.encode("utf-8"), digest_size=16).hexdigest()
+    cached = _principals.get(key)
+    if cached is not None:
+        return cached
+
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str | None = payload.get("sub")
-        if username is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid authentication credentials",
-            )
-        return username
     except JWTError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid token",
         )
+    username: str | None = payload.get("sub")
+    if username is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid authentication credentials",
+        )
 
-
-def get_current_user_id(
-    username: str = Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
-    user = db.query(User).filter(User.username == username).first()
-    if not user:
+    user = db.execute(TOKEN_USER, {"username": username}).first()
+    if user is None:
         raise HTTPException(status_code=404, detail="User not found")
-    return user.user_id     
+    # Tokens issued before the password was changed (or before versions existed: 0)
+    if payload.get("ver", 0) != user.token_version:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token revoked, please log in again",
+        )
+
+    principal = Principal(
+        key=key,
+        username=username,
+        user_id=user.user_id,
+        expires_at=float(payload.get("exp", time.time() + PRINCIPAL_CACHE_TTL)),
+    )
+    _remember(principal)
+    return principal
+
+
+def get_optional_principal(
+    credentials: HTTPAuthorizationCredentials | None = Depends(optional_security),
+    db: Session = Depends(get_db),
+) -> Principal | None:
+    """Principal of the token if there is one, None for anonymous callers (per-user rate limits)."""
+    if credentials is None:
+        return None
+    return get_principal(credentials, db)
+
+
+def get_current_user(principal: Principal = Depends(get_principal)) -> str:
+    """
+    يأخذ التوكن من الهيدر، يفك التشفير، ويرجع username من الـ sub
+    """
+    return principal.username
+
+
+def get_current_user_id(principal: Principal = Depends(get_principal)) -> int:
+    return principal.user_id
+
+
+def get_optional_user_id(
+    credentials: HTTPAuthorizationCredentials | None = Depends(optional_security),
+    db: Session = Depends(get_db),
+) -> int | None:
+    """
+    user_id إذا فيه توكن، None للزوار. التوكن الغلط يرجع 401 مثل باقي الـ endpoints
+    """
+    if credentials is None:
+        return None
+    return get_principal(credentials, db).user_id
@@ -0,0 +1,151 @@
+# app/db/image_hashes.py
+# "Is this the same cat?": perceptual hashes of uploaded cat photos.
+#
+# POST /cats/{cat_id}/image stores the dHash of the original in image_hashes.
+# Each process keeps a HammingIndex (app/core/perceptual.py) over those rows.
+# It is loaded from the table at startup, never by re-decoding images, and
+# catches up before each search with an indexed range read on created_at over
+# the last few seconds, so uploads handled by other workers are found too.
+#
+# Images uploaded while the pool was full, or before hashing existed:
+#
+#   python -m app.db.image_hashes backfill
+import argparse
+import asyncio
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+from app.core import media
+from app.core.metrics import REGISTRY
+from app.core.perceptual import HammingIndex, dhash_bytes, dhash_file, from_signed, to_signed
+from app.core.process_pool import PoolSaturated
+from app.db.models import Cat, ImageHash
+
+log = logging.getLogger("safepaws.image_hashes")
+
+image_hash_search = REGISTRY.histogram(
+    "safepaws_image_hash_search_seconds", "Hamming index search time",
+    buckets=(0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05),
+)
+image_hash_missing = REGISTRY.counter(
+    "safepaws_image_hash_missing_total", "Uploads stored without a hash (pool full, undecodable image)"
+)
+
+# Re-read this far behind the newest created_at already held: auto-increment
+# ids are handed out at insert, so a row can commit after one with a higher id
+CATCH_UP_OVERLAP = timedelta(seconds=10)
+
+_index = HammingIndex()
+_keys: dict[int, list[str]] = {}  # hash -> image keys with that exact hash
+_watermark: datetime | None = None
+_lock = threading.Lock()
+
+
+def _catch_up(db) -> None:
+    global _watermark
+    query = select(ImageHash.image_key, ImageHash.dhash, ImageHash.created_at).order_by(ImageHash.hash_id)
+    if _watermark is not None:
+        query = query.where(ImageHash.created_at >= _watermark - CATCH_UP_OVERLAP)
+    rows = db.execute(query).all()
+    with _lock:
+        for row in rows:
+            value = from_signed(row.dhash)
+            _index.add(value)
+            keys = _keys.setdefault(value, [])
+            if row.image_key not in keys:
+                keys.append(row.image_key)
+            if row.created_at is not None and (_watermark is None or row.created_at > _watermark):
+                _watermark = row.created_at
+
+
+def load(db) -> int:
+    """Fill the index from image_hashes (startup). Returns the number of hashes held."""
+    started = time.perf_counter()
+    _catch_up(db)
+    log.info("image hashes: %d loaded in %.2fs", len(_index), time.perf_counter() - started)
+    return len(_index)
+
+
+def record(db, key: str, value: int) -> None:
+    """Store the hash of image key in the caller's transaction (once per key)."""
+    exists = db.execute(select(ImageHash.hash_id).where(ImageHash.image_key == key)).first()
+    if not exists:
+        db.add(ImageHash(image_key=key, dhash=to_signed(value)))
+
+
+async def hash_image(key: str) -> int | None:
+    """dHash of a stored original, computed in the thumbnail pool. None if that is not possible now."""
+    original = media.find_original(key)
+    if media.Image is None or original is None:
+        image_hash_missing.inc()
+        return None
+    try:
+        return await asyncio.wrap_future(media.thumbnail_pool.submit(dhash_file, str(original)))
+    except PoolSaturated:
+        image_hash_missing.inc()
+        return None
+    except Exception:
+        log.warning("image hashes: cannot hash %s", key, exc_info=True)
+        image_hash_missing.inc()
+        return None
+
+
+async def hash_bytes(data: bytes) -> int:
+    """
+    dHash of an image that is not stored (a search). Raises PoolSaturated or
+    BrokenProcessPool when the pool cannot take it, or the decoder's error
+    (perceptual.DECODE_ERRORS).
+    """
+    return await asyncio.wrap_future(media.thumbnail_pool.submit(dhash_bytes, data))
+
+
+def similar(db, value: int, max_distance: int) -> list[tuple[int, str]]:
+    """(distance, image key) of every known image within max_distance of value, nearest first."""
+    _catch_up(db)
+    with _lock, image_hash_search.time():
+        found = _index.search(value, max_distance)
+        return [(distance, key) for distance, found_hash in found for key in _keys[found_hash]]
+
+
+def backfill(db) -> dict[str, int]:
+    """Hash the originals of cats whose image has no hash yet, in this process."""
+    hashed_already = select(ImageHash.hash_id).where(ImageHash.image_key == Cat.image_key).exists()
+    keys = db.execute(
+        select(Cat.image_key).where(Cat.image_key.is_not(None), ~hashed_already).distinct()
+    ).scalars().all()
+    hashed = missing = 0
+    for key in keys:
+        original = media.find_original(key)
+        if original is None:
+            missing += 1
+            continue
+        record(db, key, dhash_file(str(original)))
+        db.commit()
+        hashed += 1
+    return {"hashed": hashed, "missing": missing}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Safepaws image hashes")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("backfill", help="hash uploaded images that have no hash yet")
+    parser.parse_args(argv)
+
+    from app.db.session import SessionLocal
+
+    started = time.perf_counter()
+    db = SessionLocal()
+    try:
+        result = backfill(db)
+    finally:
+        db.close()
+    print(f"✅ {result['hashed']} images hashed, {result['missing']} originals missing "
+          f"in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+# app/db/locks.py
+# Named locks shared by every worker (and every host) through the database, for
+# jobs that must not run in several processes at once: the schema upgrade at
+# startup, the stats reconciler.
+#
+#   with engine.connect() as conn, named_lock(conn, "safepaws.schema", timeout=60) as acquired:
+#       if acquired:
+#           ...
+#
+# try_lock() / release() are the same without the block, for a lock held as
+# long as the process runs (the stats reconciler's).
+#
+# MySQL: GET_LOCK / RELEASE_LOCK, held by the connection, so it goes away with
+# the connection if the process dies. Other databases (SQLite for local runs,
+# one process) have no such lock: it is always acquired.
+from contextlib import contextmanager
+
+from sqlalchemy import text
+
+
+def try_lock(conn, name: str, timeout: float = 0) -> bool:
+    """Take the lock for conn's session, waiting up to timeout seconds. Taking it again while held succeeds."""
+    if conn.dialect.name != "mysql":
+        return True
+    return conn.execute(text("SELECT GET_LOCK(:name, :timeout)"), {"name": name, "timeout": timeout}).scalar() == 1
+
+
+def release(conn, name: str) -> None:
+    if conn.dialect.name == "mysql":
+        conn.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": name})
+
+
+@contextmanager
+def named_lock(conn, name: str, timeout: float = 0):
+    """Yields whether the lock was acquired within timeout seconds (0: do not wait)."""
+    acquired = try_lock(conn, name, timeout)
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            release(conn, name)
@@ -1,5 +1,5 @@
 from sqlalchemy.orm import Mapped, mapped_column
-from sqlalchemy import Integer, Float, TIMESTAMP, func, ForeignKey, String, Column, Boolean, Enum, Text
+from sqlalchemy import Integer, BigInteger, Float, TIMESTAMP, func, ForeignKey, String, Column, Boolean, Enum, Text, Index, UniqueConstraint
 from datetime import datetime
 from app.db.session import Base
 from sqlalchemy.sql import func as sql_func
@@ -15,6 +15,8 @@ class User(Base):
     phone = Column(String(20))
     created_at = Column(TIMESTAMP, server_default=sql_func.now())
     profile_picture_url = Column(String(255))
+    # Carried in the JWT ("ver"); bumping it (password change) revokes every token issued before
+    token_version = Column(Integer, nullable=False, server_default="0")
 
 class Cat(Base):
     __tablename__ = "cats"
@@ -26,6 +28,8 @@ class Cat(Base):
     notes = Column(Text)
     image_url = Column(String(255))
     adding_user = Column(Integer, ForeignKey("users.user_id", ondelete="SET NULL", onupdate="CASCADE"))
+    # sha256 of an image uploaded through POST /cats/{cat_id}/image (app/core/media.py), NULL for pasted URLs
+    image_key = Column(String(64))
     
 class CatLocation(Base):
     __tablename__ = "cat_locations"
@@ -42,6 +46,16 @@ class CatLocation(Base):
     created_at: Mapped[datetime] = mapped_column(
         TIMESTAMP, server_default=func.now(), nullable=False
     )
+    # Set from the coordinates on write (app/db/regions.py), NULL outside every known region
+    region: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    # Last time a volunteer pinned the cat here (create or move), for duplicate detection (app/db/sightings.py)
+    seen_at: Mapped[datetime | None] = mapped_column(TIMESTAMP, nullable=True)
+
+    # "URGENT cats in Riyadh" and per-region counts by condition
+    __table_args__ = (
+        Index("ix_cat_locations_region_condition", "region", "condition_flag"),
+        Index("ix_cat_locations_seen_at", "seen_at"),
+    )
 
 class AdoptionListing(Base):
     __tablename__ = "adoption_listings"
@@ -96,4 +110,79 @@ class ActivityLog(Base):
     activity_time = Column(TIMESTAMP, server_default=sql_func.now())
     activity_description = Column(Text, nullable=False)
     cat_id = Column(Integer, ForeignKey("cats.cat_id"))
-    user_id = Column(Integer, ForeignKey("users.user_id", ondelete="SET NULL"))
\ No newline at end of file
+    user_id = Column(Integer, ForeignKey("users.user_id", ondelete="SET NULL"))
+
+class StatCounter(Base):
+    """
+    Running totals behind GET /stats (see app/db/stats.py). period is "" for
+    all-time counters, "2025-01" for monthly and "2025-W03" for weekly ones;
+    subject splits a counter (condition name, user_id), "" when it is not split.
+    """
+    __tablename__ = "stat_counters"
+
+    name = Column(String(32), primary_key=True)
+    period = Column(String(16), primary_key=True, default="")
+    subject = Column(String(64), primary_key=True, default="")
+    total = Column(Integer, nullable=False, default=0)
+
+
+class PinDuplicate(Base):
+    """
+    Two pins of different cats made within a few metres and minutes of each
+    other (app/db/sightings.py), for coordinators to review. location_id is the
+    lower of the two ids.
+    """
+    __tablename__ = "pin_duplicates"
+
+    pair_id = Column(Integer, primary_key=True, autoincrement=True)
+    location_id = Column(Integer, ForeignKey("cat_locations.location_id", ondelete="CASCADE"), nullable=False)
+    other_location_id = Column(Integer, ForeignKey("cat_locations.location_id", ondelete="CASCADE"), nullable=False)
+    distance_m = Column(Float, nullable=False)
+    seconds_apart = Column(Integer, nullable=False)
+    detected_at = Column(TIMESTAMP, server_default=sql_func.now())
+
+    __table_args__ = (UniqueConstraint("location_id", "other_location_id", name="uq_pin_duplicates_pair"),)
+
+
+class ImageHash(Base):
+    """
+    Perceptual hash (dHash, app/core/perceptual.py) of an uploaded image,
+    keyed like the file itself. Cats reference images through cats.image_key.
+    """
+    __tablename__ = "image_hashes"
+
+    hash_id = Column(Integer, primary_key=True, autoincrement=True)
+    image_key = Column(String(64), unique=True, nullable=False)
+    dhash = Column(BigInteger, nullable=False)  # signed, see perceptual.to_signed
+    created_at = Column(TIMESTAMP, server_default=sql_func.now())
+
+    __table_args__ = (Index("ix_image_hashes_created_at", "created_at"),)
+
+
+class SyncKey(Base):
+    """
+    Idempotency key of an action replayed through POST /sync (app/api/sync.py)
+    and the result it got, so a retried action gets that result back instead of
+    being applied twice. Rows expire after SYNC_KEY_TTL_HOURS.
+    """
+    __tablename__ = "sync_keys"
+
+    user_id = Column(Integer, ForeignKey("users.user_id", ondelete="CASCADE"), primary_key=True)
+    idempotency_key = Column(String(64), primary_key=True)
+    status = Column(Integer, nullable=False)  # HTTP status the action got
+    result = Column(Text)  # its JSON body
+    created_at = Column(TIMESTAMP, nullable=False)  # set in Python, expiry runs on it
+
+    __table_args__ = (Index("ix_sync_keys_created_at", "created_at"),)
+
+
+class ActivityFlush(Base):
+    """
+    Journal segment of the activity write-behind buffer (app/db/activity_buffer.py)
+    whose entries are in activity_log. Written in the same transaction as the
+    entries, so a segment left behind by a crash is never inserted twice.
+    """
+    __tablename__ = "activity_flushes"
+
+    segment = Column(String(128), primary_key=True)
+    flushed_at = Column(TIMESTAMP, nullable=False)
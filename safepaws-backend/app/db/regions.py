@@ -0,0 +1,134 @@
+# app/db/regions.py
+# Region (province / city) of a pin, from boundaries in a local GeoJSON file.
+#
+# The polygons are loaded once per process into an STR-packed R-tree
+# (app/core/geo.py). create_pin stores the region on the row, so filtering and
+# counting by region are plain indexed equality lookups on cat_locations.region;
+# no geometry runs per read request.
+#
+# REGIONS_GEOJSON points at a FeatureCollection of Polygon/MultiPolygon features
+# named by properties[REGIONS_NAME_PROPERTY]. The bundled app/data/regions.geojson
+# is a coarse example (nearest regional capital), not official boundaries.
+#
+# After changing the boundaries, or for rows written before regions existed:
+#
+#   python -m app.db.regions backfill          # rows with no region yet
+#   python -m app.db.regions backfill --all    # re-assign every row
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+from sqlalchemy import bindparam, select, update
+
+from app.core.geo import PolygonIndex
+from app.core.metrics import REGISTRY
+from app.db.models import CatLocation
+
+REGIONS_GEOJSON = os.getenv("REGIONS_GEOJSON", str(Path(__file__).parent.parent / "data" / "regions.geojson"))
+REGIONS_NAME_PROPERTY = os.getenv("REGIONS_NAME_PROPERTY", "name")
+BACKFILL_BATCH = 1000
+
+log = logging.getLogger("safepaws.regions")
+
+region_lookups = REGISTRY.counter(
+    "safepaws_region_lookups_total", "Pin region assignments: hit (inside a region) or miss", ("result",)
+)
+
+_index: PolygonIndex | None = None
+_lock = threading.Lock()
+
+
+def index() -> PolygonIndex:
+    """The region index, loaded on first use. A missing file gives an empty index."""
+    global _index
+    if _index is None:
+        with _lock:
+            if _index is None:
+                try:
+                    with open(REGIONS_GEOJSON, encoding="utf-8") as fh:
+                        loaded = PolygonIndex.from_geojson(json.load(fh), REGIONS_NAME_PROPERTY)
+                except FileNotFoundError:
+                    log.warning("regions: %s not found, pins will have no region", REGIONS_GEOJSON)
+                    loaded = PolygonIndex([])
+                _index = loaded
+    return _index
+
+
+def names() -> list[str]:
+    return index().values
+
+
+def region_for(latitude: float, longitude: float) -> str | None:
+    region = index().locate(float(longitude), float(latitude))
+    region_lookups.inc("hit" if region is not None else "miss")
+    return region
+
+
+def backfill(db, everything: bool = False, batch: int = BACKFILL_BATCH) -> dict[str, int]:
+    """
+    Assign regions in batches of `batch` rows, walking location_id upwards and
+    committing per batch so no long transaction holds locks on cat_locations.
+    Only rows without a region unless everything=True.
+    """
+    stmt = (
+        update(CatLocation)
+        .where(CatLocation.location_id == bindparam("b_location_id"))
+        .values(region=bindparam("b_region"))
+    )
+    scanned = changed = 0
+    last_id = 0
+    while True:
+        query = (
+            select(CatLocation.location_id, CatLocation.latitude, CatLocation.longitude, CatLocation.region)
+            .where(CatLocation.location_id > last_id)
+            .order_by(CatLocation.location_id)
+            .limit(batch)
+        )
+        if not everything:
+            query = query.where(CatLocation.region.is_(None))
+        rows = db.execute(query).all()
+        if not rows:
+            break
+        last_id = rows[-1].location_id
+        scanned += len(rows)
+        updates = []
+        for row in rows:
+            region = region_for(row.latitude, row.longitude)
+            if region != row.region:
+                updates.append({"b_location_id": row.location_id, "b_region": region})
+        if updates:
+            db.connection().execute(stmt, updates)
+            changed += len(updates)
+        db.commit()
+    return {"scanned": scanned, "changed": changed}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Safepaws pin regions")
+    sub = parser.add_subparsers(dest="command", required=True)
+    fill = sub.add_parser("backfill", help="assign regions to existing pins")
+    fill.add_argument("--all", action="store_true", help="re-assign every pin, not only those without a region")
+    fill.add_argument("--batch", type=int, default=BACKFILL_BATCH)
+    args = parser.parse_args(argv)
+
+    from app.db import stats
+    from app.db.session import SessionLocal
+
+    started = time.perf_counter()
+    db = SessionLocal()
+    try:
+        result = backfill(db, everything=args.all, batch=args.batch)
+    finally:
+        db.close()
+    # Region counts live in stat_counters; recompute them from the new assignments
+    stats.reconcile()
+    print(f"✅ {result['changed']} of {result['scanned']} pins updated "
+          f"({len(names())} regions) in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# app/db/schema.py
+# Brings an existing database up to the models at startup.
+#
+# There are no migrations in this project: the core tables were created by
+# hand. New tables, columns and indexes added to app/db/models.py are created
+# here instead, so a deploy does not need a manual ALTER. Only additive changes
+# are made; nothing is dropped or altered. A NOT NULL column without a server
+# default cannot be added to a table that has rows and is skipped with a
+# warning. Workers take a database lock (app/db/locks.py) so only one of them
+# runs the DDL.
+#
+# SCHEMA_AUTO_UPGRADE=false turns it off (e.g. when the app user has no DDL rights).
+import logging
+import os
+
+from sqlalchemy import inspect
+from sqlalchemy.schema import CreateColumn
+
+from app.db import models  # noqa: F401  registers every model on the metadata
+from app.db.locks import named_lock
+from app.db.session import Base
+
+SCHEMA_AUTO_UPGRADE = os.getenv("SCHEMA_AUTO_UPGRADE", "true").lower() not in ("0", "false", "no")
+SCHEMA_LOCK = "safepaws.schema"
+# How long a worker waits for another one's upgrade before starting without it
+SCHEMA_LOCK_TIMEOUT = float(os.getenv("SCHEMA_LOCK_TIMEOUT", "60"))
+
+log = logging.getLogger("safepaws.schema")
+
+
+def ensure_schema(engine, metadata=None) -> list[str]:
+    """Create missing tables, columns and indexes. Returns what was created, e.g. ["table stat_counters"]."""
+    if not SCHEMA_AUTO_UPGRADE:
+        return []
+    # Every worker runs this at startup: one upgrades, the others wait and then find nothing to do
+    with engine.connect() as lock_conn, named_lock(lock_conn, SCHEMA_LOCK, SCHEMA_LOCK_TIMEOUT) as acquired:
+        if not acquired:
+            log.warning("schema: another process is still upgrading after %ss, skipped", SCHEMA_LOCK_TIMEOUT)
+            return []
+        return _upgrade(engine, metadata or Base.metadata)
+
+
+def _covered(columns: tuple[str, ...], existing: list[tuple[str, ...]]) -> bool:
+    # An index is redundant if an existing one (or the primary key) starts with the same columns
+    return any(have[:len(columns)] == columns for have in existing)
+
+
+def _upgrade(engine, metadata) -> list[str]:
+    inspector = inspect(engine)
+    existing = set(inspector.get_table_names())
+    created = []
+
+    missing = [table for table in metadata.sorted_tables if table.name not in existing]
+    if missing:
+        metadata.create_all(engine, tables=missing)
+        created += [f"table {table.name}" for table in missing]
+
+    quote = engine.dialect.identifier_preparer.quote
+    with engine.begin() as conn:
+        for table in metadata.sorted_tables:
+            if table.name not in existing:
+                continue
+            present = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in present:
+                    continue
+                if not column.nullable and column.server_default is None:
+                    log.warning("schema: cannot add NOT NULL column %s.%s without a server default",
+                                table.name, column.name)
+                    continue
+                ddl = CreateColumn(column).compile(dialect=engine.dialect)
+                conn.exec_driver_sql(f"ALTER TABLE {quote(table.name)} ADD COLUMN {ddl}")
+                created.append(f"column {table.name}.{column.name}")
+                present.add(column.name)
+
+            # Indexes separately: one can be added to columns that exist already
+            indexes = inspector.get_indexes(table.name)
+            names = {index["name"] for index in indexes}
+            covering = [tuple(index["column_names"]) for index in indexes]
+            covering.append(tuple(inspector.get_pk_constraint(table.name).get("constrained_columns") or ()))
+            for index in table.indexes:
+                columns = tuple(column.name for column in index.columns)
+                if index.name in names or _covered(columns, covering) or not set(columns) <= present:
+                    continue
+                index.create(conn)
+                created.append(f"index {index.name}")
+
+    for item in created:
+        log.warning("schema: created %s", item)
+    return created
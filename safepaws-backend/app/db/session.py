@@ -21,16 +21,21 @@ DB_NAME = os.getenv("DB_NAME", "safepaws")
 
 PWD = quote_plus(DB_PASSWORD or "")
 
-DATABASE_URL = (
+# DATABASE_URL overrides the MySQL settings above (e.g. sqlite:///bench.db for local benchmarks)
+DATABASE_URL = os.getenv("DATABASE_URL") or (
     f"mysql+mysqlconnector://{DB_USER}:{PWD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
     "?charset=utf8mb4"
 )
 
+# SQLite connections are shared across the request thread pool
+connect_args = {"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
+
 engine = create_engine(
     DATABASE_URL,
     pool_pre_ping=True,
     pool_recycle=3600,
     future=True,
+    connect_args=connect_args,
 )
 
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
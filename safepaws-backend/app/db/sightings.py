@@ -0,0 +1,117 @@
+# app/db/sightings.py
+# Near-duplicate pins: two different cats pinned within DUPLICATE_RADIUS_M
+# metres and DUPLICATE_WINDOW_MINUTES of each other are most likely the same
+# cat entered twice.
+#
+# Every pin write stamps cat_locations.seen_at. Each process keeps the recent
+# ones in a ProximityGrid (app/core/geo.py), so checking a new pin reads the
+# 3x3 grid cells around it instead of comparing it with every pin. Before a
+# check the grid catches up with pins other workers wrote, using an indexed
+# range read on seen_at over the last few seconds.
+#
+# create_pin returns what it found as possible_duplicates and stores each
+# pair in pin_duplicates; GET /pins/duplicates lists them for coordinators.
+import os
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, tuple_
+
+from app.core.geo import ProximityGrid
+from app.core.metrics import REGISTRY
+from app.db.models import CatLocation, PinDuplicate
+
+DUPLICATE_RADIUS_M = float(os.getenv("DUPLICATE_RADIUS_M", "25"))
+DUPLICATE_WINDOW_MINUTES = float(os.getenv("DUPLICATE_WINDOW_MINUTES", "30"))
+# Re-read this far behind the newest seen_at already held: a pin stamped just
+# before another worker's catch-up may only be committed just after it
+CATCH_UP_OVERLAP = timedelta(seconds=10)
+
+duplicates_flagged = REGISTRY.counter(
+    "safepaws_pin_duplicates_flagged_total", "Possible duplicate pins found when a pin was written"
+)
+
+_grid = ProximityGrid(DUPLICATE_RADIUS_M, DUPLICATE_WINDOW_MINUTES * 60)
+_watermark: datetime | None = None
+_lock = threading.Lock()
+
+
+def now() -> datetime:
+    # Whole seconds, like the TIMESTAMP column stores them
+    return datetime.now().replace(microsecond=0)
+
+
+def _catch_up(db, at: datetime) -> None:
+    """Read pins written since the watermark, then add them to the grid under _lock."""
+    global _watermark
+    window_start = at - timedelta(minutes=DUPLICATE_WINDOW_MINUTES)
+    since = window_start if _watermark is None else max(window_start, _watermark - CATCH_UP_OVERLAP)
+    rows = db.execute(
+        select(CatLocation.location_id, CatLocation.cat_id, CatLocation.latitude, CatLocation.longitude,
+               CatLocation.seen_at)
+        .where(CatLocation.seen_at >= since)
+        .order_by(CatLocation.seen_at)
+    ).all()
+    with _lock:
+        for row in rows:
+            _grid.add(row.location_id, row.latitude, row.longitude, row.seen_at.timestamp(), row.cat_id)
+        if rows and (_watermark is None or rows[-1].seen_at > _watermark):
+            _watermark = rows[-1].seen_at
+
+
+def check(db, location_id: int, cat_id: int, latitude: float, longitude: float, seen_at: datetime) -> list[dict]:
+    """Pins of other cats seen within the radius and window of this one, nearest first."""
+    _catch_up(db, seen_at)
+    with _lock:
+        found = [
+            f for f in _grid.near(latitude, longitude, seen_at.timestamp())
+            if f[1] != location_id and f[3] != cat_id
+        ]
+    if found:
+        # Pins deleted by another worker stay in this grid until they age out
+        live = set(db.execute(
+            select(CatLocation.location_id).where(CatLocation.location_id.in_([f[1] for f in found]))
+        ).scalars())
+        found = [f for f in found if f[1] in live]
+    return [
+        {
+            "location_id": key,
+            "cat_id": other_cat_id,
+            "distance_m": round(distance, 1),
+            "seconds_apart": int(apart),
+        }
+        for distance, key, apart, other_cat_id in found
+    ]
+
+
+def record(db, location_id: int, duplicates: list[dict]) -> None:
+    """Store the pairs in the caller's transaction; pairs seen before are kept as they are."""
+    if not duplicates:
+        return
+    duplicates_flagged.inc(amount=len(duplicates))
+    pairs = {
+        (min(location_id, d["location_id"]), max(location_id, d["location_id"])): d for d in duplicates
+    }
+    known = set(db.execute(
+        select(PinDuplicate.location_id, PinDuplicate.other_location_id)
+        .where(tuple_(PinDuplicate.location_id, PinDuplicate.other_location_id).in_(list(pairs)))
+    ).all())
+    for (low, high), d in pairs.items():
+        if (low, high) not in known:
+            db.add(PinDuplicate(
+                location_id=low,
+                other_location_id=high,
+                distance_m=d["distance_m"],
+                seconds_apart=d["seconds_apart"],
+            ))
+
+
+def written(location_id: int, cat_id: int, latitude: float, longitude: float, seen_at: datetime) -> None:
+    """After commit: make this process's own write visible to its next check straight away."""
+    with _lock:
+        _grid.add(location_id, latitude, longitude, seen_at.timestamp(), cat_id)
+
+
+def removed(location_id: int) -> None:
+    with _lock:
+        _grid.discard(location_id)
@@ -0,0 +1,258 @@
+# app/db/slow_queries.py
+# Opt-in slow query recorder. Enable with SLOW_QUERY_MS=<threshold in ms>.
+#
+#   python -m app.db.slow_queries [slow_queries.log] [limit]
+#
+# prints statements from the rotating log ranked by total time.
+import hashlib
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from logging.handlers import RotatingFileHandler
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.core.context import current_route
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "0") or 0)
+SLOW_QUERY_LOG = os.getenv("SLOW_QUERY_LOG", "slow_queries.log")
+SLOW_QUERY_LOG_BYTES = int(os.getenv("SLOW_QUERY_LOG_BYTES", str(10 * 1024 * 1024)))
+SLOW_QUERY_RING_SIZE = int(os.getenv("SLOW_QUERY_RING_SIZE", "500"))
+# Fraction of slow SELECTs that are considered for EXPLAIN
+EXPLAIN_SAMPLE_RATE = float(os.getenv("SLOW_QUERY_EXPLAIN_RATE", "0.2"))
+# Never EXPLAIN the same statement more often than this (seconds)
+EXPLAIN_INTERVAL = float(os.getenv("SLOW_QUERY_EXPLAIN_INTERVAL", "300"))
+# Global cap on EXPLAINs per second, across all statements
+EXPLAIN_PER_SECOND = float(os.getenv("SLOW_QUERY_EXPLAIN_PER_SECOND", "1"))
+MAX_FINGERPRINTS = 1000
+
+_SKIP = "slow_query_skip"
+
+_STRING_RE = re.compile(r"'(?:[^'\\]|\\.)*'")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PARAM_RE = re.compile(r"%\([^)]+\)s|%s|:\w+|\?")
+_IN_LIST_RE = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_SPACE_RE = re.compile(r"\s+")
+
+
+def normalize_sql(statement: str) -> str:
+    sql = _STRING_RE.sub("?", statement)
+    sql = _PARAM_RE.sub("?", sql)
+    sql = _NUMBER_RE.sub("?", sql)
+    sql = _IN_LIST_RE.sub("(?...)", sql)
+    return _SPACE_RE.sub(" ", sql).strip()
+
+
+def param_shape(parameters, executemany: bool = False):
+    if executemany and parameters:
+        return {"rows": len(parameters), "row": param_shape(parameters[0])}
+    if isinstance(parameters, dict):
+        return {k: type(v).__name__ for k, v in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [type(v).__name__ for v in parameters]
+    return None
+
+
+class SlowQueryRecorder:
+    def __init__(self, threshold_ms: float, log_path: str | None = SLOW_QUERY_LOG):
+        self.threshold = threshold_ms / 1000.0
+        self.ring: deque = deque(maxlen=SLOW_QUERY_RING_SIZE)
+        self.stats: OrderedDict[str, dict] = OrderedDict()
+        self._lock = threading.Lock()
+        self._explain_queue: queue.Queue = queue.Queue(maxsize=16)
+        self._last_explain: dict[str, float] = {}
+        self._explain_allowance = EXPLAIN_PER_SECOND
+        self._explain_checked = time.monotonic()
+        self._engine: Engine | None = None
+
+        self.log = logging.getLogger("safepaws.slow_queries")
+        self.log.propagate = False
+        if log_path and not self.log.handlers:
+            handler = RotatingFileHandler(log_path, maxBytes=SLOW_QUERY_LOG_BYTES, backupCount=3)
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            self.log.addHandler(handler)
+            self.log.setLevel(logging.INFO)
+
+    # ---------- engine hooks ----------
+    def install(self, engine: Engine) -> None:
+        self._engine = engine
+        event.listen(engine, "before_cursor_execute", self._before)
+        event.listen(engine, "after_cursor_execute", self._after)
+        event.listen(engine, "handle_error", self._error)
+        threading.Thread(target=self._explain_worker, name="slow-query-explain", daemon=True).start()
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("slow_query_start", []).append(time.perf_counter())
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("slow_query_start")
+        if not starts:
+            return
+        elapsed = time.perf_counter() - starts.pop()
+        if elapsed < self.threshold or conn.info.get(_SKIP):
+            return
+        self.record(statement, parameters, elapsed, executemany)
+
+    def _error(self, context):
+        # The statement failed, so _after never runs: drop the start _before pushed
+        if context.connection is None or context.execution_context is None:
+            return
+        starts = context.connection.info.get("slow_query_start")
+        if starts:
+            starts.pop()
+
+    # ---------- recording ----------
+    def record(self, statement: str, parameters, elapsed: float, executemany: bool = False) -> None:
+        sql = normalize_sql(statement)
+        fingerprint = hashlib.sha1(sql.encode("utf-8")).hexdigest()[:12]
+        route = current_route()
+        entry = {
+            "type": "query",
+            "fingerprint": fingerprint,
+            "sql": sql,
+            "params": param_shape(parameters, executemany),
+            "duration_ms": round(elapsed * 1000, 3),
+            "route": route,
+            "at": time.time(),
+        }
+        with self._lock:
+            self.ring.append(entry)
+            stat = self.stats.get(fingerprint)
+            if stat is None:
+                stat = {"fingerprint": fingerprint, "sql": sql, "count": 0, "total_ms": 0.0,
+                        "max_ms": 0.0, "routes": {}, "explain": None}
+                self.stats[fingerprint] = stat
+                if len(self.stats) > MAX_FINGERPRINTS:
+                    self.stats.popitem(last=False)
+            else:
+                self.stats.move_to_end(fingerprint)
+            stat["count"] += 1
+            stat["total_ms"] += entry["duration_ms"]
+            stat["max_ms"] = max(stat["max_ms"], entry["duration_ms"])
+            stat["routes"][route] = stat["routes"].get(route, 0) + 1
+        self.log.info(json.dumps(entry, default=str))
+
+        if not executemany and sql.upper().startswith("SELECT") and self._should_explain(fingerprint):
+            try:
+                self._explain_queue.put_nowait((fingerprint, statement, parameters))
+            except queue.Full:
+                pass
+
+    def _should_explain(self, fingerprint: str) -> bool:
+        if random.random() >= EXPLAIN_SAMPLE_RATE:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_explain.get(fingerprint, float("-inf")) < EXPLAIN_INTERVAL:
+                return False
+            # token bucket shared by every statement
+            self._explain_allowance = min(
+                EXPLAIN_PER_SECOND,
+                self._explain_allowance + (now - self._explain_checked) * EXPLAIN_PER_SECOND,
+            )
+            self._explain_checked = now
+            if self._explain_allowance < 1:
+                return False
+            self._explain_allowance -= 1
+            self._last_explain[fingerprint] = now
+            return True
+
+    def _explain_worker(self) -> None:
+        while True:
+            fingerprint, statement, parameters = self._explain_queue.get()
+            try:
+                with self._engine.connect() as conn:
+                    conn.info[_SKIP] = True
+                    try:
+                        prefix = "EXPLAIN QUERY PLAN " if conn.dialect.name == "sqlite" else "EXPLAIN "
+                        result = conn.exec_driver_sql(prefix + statement, parameters)
+                        plan = [dict(row._mapping) for row in result]
+                    finally:
+                        conn.info.pop(_SKIP, None)
+            except Exception as exc:
+                plan = [{"error": str(exc)}]
+            with self._lock:
+                if fingerprint in self.stats:
+                    self.stats[fingerprint]["explain"] = plan
+            self.log.info(json.dumps({"type": "explain", "fingerprint": fingerprint, "plan": plan}, default=str))
+
+    # ---------- reporting ----------
+    def report(self, limit: int = 20) -> list[dict]:
+        with self._lock:
+            stats = [dict(s, routes=dict(s["routes"])) for s in self.stats.values()]
+        return rank(stats, limit)
+
+    def recent(self, limit: int = 50) -> list[dict]:
+        with self._lock:
+            return list(self.ring)[-limit:]
+
+
+def rank(stats: list[dict], limit: int) -> list[dict]:
+    for stat in stats:
+        stat["total_ms"] = round(stat["total_ms"], 3)
+        stat["avg_ms"] = round(stat["total_ms"] / stat["count"], 3) if stat["count"] else 0.0
+    stats.sort(key=lambda s: s["total_ms"], reverse=True)
+    return stats[:limit]
+
+
+recorder: SlowQueryRecorder | None = None
+
+
+def install(engine: Engine) -> SlowQueryRecorder | None:
+    """Attach the recorder to the engine when SLOW_QUERY_MS is set."""
+    global recorder
+    if recorder is None and SLOW_QUERY_MS > 0:
+        recorder = SlowQueryRecorder(SLOW_QUERY_MS)
+        recorder.install(engine)
+    return recorder
+
+
+def report_from_log(path: str, limit: int = 20) -> list[dict]:
+    """Rank statements from a log file and its rotated backups."""
+    stats: dict[str, dict] = {}
+    paths = [f"{path}.{i}" for i in range(3, 0, -1)] + [path]
+    for p in paths:
+        if not os.path.exists(p):
+            continue
+        with open(p, encoding="utf-8") as fh:
+            for line in fh:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                fp = entry.get("fingerprint")
+                if entry.get("type") == "explain":
+                    if fp in stats:
+                        stats[fp]["explain"] = entry.get("plan")
+                    continue
+                stat = stats.setdefault(fp, {"fingerprint": fp, "sql": entry["sql"], "count": 0,
+                                             "total_ms": 0.0, "max_ms": 0.0, "routes": {}, "explain": None})
+                stat["count"] += 1
+                stat["total_ms"] += entry["duration_ms"]
+                stat["max_ms"] = max(stat["max_ms"], entry["duration_ms"])
+                stat["routes"][entry["route"]] = stat["routes"].get(entry["route"], 0) + 1
+    return rank(list(stats.values()), limit)
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else SLOW_QUERY_LOG
+    limit = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    for stat in report_from_log(path, limit):
+        routes = ", ".join(f"{r} x{n}" for r, n in stat["routes"].items())
+        print(f"{stat['total_ms']:>12.1f} ms  {stat['count']:>6}x  avg {stat['avg_ms']:.1f}  max {stat['max_ms']:.1f}")
+        print(f"    {stat['sql'][:200]}")
+        print(f"    routes: {routes}")
+        if stat["explain"]:
+            print(f"    explain: {json.dumps(stat['explain'], default=str)[:300]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,390 @@
+# app/db/statements.py
+# Precompiled statements for the hot queries.
+#
+# Each statement is built once at import time with bindparam() placeholders,
+# so per request there is no Query construction and SQLAlchemy serves the SQL
+# string from its compiled cache. They select plain columns, and execute()
+# returns lightweight Row tuples without ORM identity tracking.
+#
+#   row = db.execute(USER_ID_BY_USERNAME, {"username": username}).scalar()
+from sqlalchemy import String, bindparam, desc, exists, func, literal, select
+from sqlalchemy.orm import aliased
+
+from app.core.media import LIST_THUMBNAIL_SIZE, MEDIA_BASE_URL
+from app.db.models import (
+    User, Cat, CatLocation, AdoptionListing, AdoptionRequest, Notification, ActivityLog, PinDuplicate,
+)
+
+# ---------- users ----------
+USER_ID_BY_USERNAME = select(User.user_id).where(User.username == bindparam("username"))
+
+USERNAME_BY_ID = select(User.username).where(User.user_id == bindparam("user_id"))
+
+LOGIN_USER = select(User.user_id, User.username, User.password_hash, User.token_version).where(
+    User.username == bindparam("username")
+)
+
+# Checked when a token is first seen (not cached yet): the user still exists, the token is not revoked
+TOKEN_USER = select(User.user_id, User.token_version).where(User.username == bindparam("username"))
+
+PROFILE = select(
+    User.user_id, User.username, User.email, User.phone, User.full_name, User.profile_picture_url
+).where(User.username == bindparam("username"))
+
+# ---------- cats ----------
+# List-size thumbnail of an uploaded image; NULL for cats with no upload (image_url only)
+THUMBNAIL_URL = (
+    literal(f"{MEDIA_BASE_URL}/", String) + Cat.image_key + literal(f"/{LIST_THUMBNAIL_SIZE}.webp", String)
+).label("thumbnail_url")
+
+CAT_COLUMNS = (
+    Cat.cat_id, Cat.name, Cat.gender, Cat.age, Cat.notes, Cat.image_url, Cat.adding_user, THUMBNAIL_URL
+)
+
+CAT_EXISTS = select(Cat.cat_id).where(Cat.cat_id == bindparam("cat_id"))
+
+# NOT EXISTS instead of NOT IN (subquery): lets MySQL use an anti-join on the listing's cat_id
+CATS_NOT_LISTED = (
+    select(*CAT_COLUMNS)
+    .where(~exists().where(AdoptionListing.cat_id == Cat.cat_id))
+    .order_by(Cat.cat_id.desc())
+)
+
+CATS_BY_USER = (
+    select(*CAT_COLUMNS)
+    .where(Cat.adding_user == bindparam("user_id"))
+    .order_by(Cat.cat_id.desc())
+)
+
+# Cats showing one of the given images, with their pin if they have one (POST /cats/similar)
+CATS_WITH_IMAGES = (
+    select(
+        Cat.cat_id,
+        Cat.name,
+        Cat.image_key,
+        Cat.image_url,
+        THUMBNAIL_URL,
+        CatLocation.location_id,
+        CatLocation.latitude,
+        CatLocation.longitude,
+        CatLocation.condition,
+    )
+    .outerjoin(CatLocation, CatLocation.cat_id == Cat.cat_id)
+    .where(Cat.image_key.in_(bindparam("image_keys", expanding=True)))
+)
+
+LISTING_UPLOADER_FOR_CAT = select(AdoptionListing.uploader_id).where(
+    AdoptionListing.cat_id == bindparam("cat_id")
+).limit(1)
+
+# Map popup: the cat, its pin, its listing (active one first), who added it and
+# the caller's request for that listing. One row; user_id NULL for anonymous callers.
+_pin = aliased(CatLocation)
+_listing = aliased(AdoptionListing)
+_detail_pin = (
+    select(func.max(_pin.location_id)).where(_pin.cat_id == Cat.cat_id).correlate(Cat).scalar_subquery()
+)
+_detail_listing = (
+    select(_listing.listing_id)
+    .where(_listing.cat_id == Cat.cat_id)
+    .order_by(_listing.is_active.desc(), _listing.listing_id.desc())
+    .limit(1)
+    .correlate(Cat)
+    .scalar_subquery()
+)
+CAT_DETAIL = (
+    select(
+        *CAT_COLUMNS,
+        User.username.label("adding_user_username"),
+        CatLocation.location_id,
+        CatLocation.latitude,
+        CatLocation.longitude,
+        CatLocation.created_at.label("pinned_at"),
+        CatLocation.condition,
+        CatLocation.region,
+        AdoptionListing.listing_id,
+        AdoptionListing.is_active,
+        AdoptionListing.vaccinated,
+        AdoptionListing.sterilized,
+        AdoptionListing.uploader_id,
+        AdoptionRequest.request_id,
+        AdoptionRequest.status.label("request_status"),
+    )
+    .outerjoin(User, Cat.adding_user == User.user_id)
+    .outerjoin(CatLocation, CatLocation.location_id == _detail_pin)
+    .outerjoin(AdoptionListing, AdoptionListing.listing_id == _detail_listing)
+    .outerjoin(
+        AdoptionRequest,
+        (AdoptionRequest.listing_id == AdoptionListing.listing_id)
+        & (AdoptionRequest.sender_id == bindparam("user_id")),
+    )
+    .where(Cat.cat_id == bindparam("cat_id"))
+)
+
+# ---------- pins ----------
+PIN_COLUMNS = (
+    CatLocation.location_id,
+    CatLocation.cat_id,
+    CatLocation.latitude,
+    CatLocation.longitude,
+    CatLocation.created_at,
+    CatLocation.condition,
+    CatLocation.region,
+)
+
+_PINS_WITH_CAT = (
+    select(
+        *PIN_COLUMNS,
+        Cat.name,
+        Cat.age,
+        Cat.gender,
+        Cat.image_url,
+        THUMBNAIL_URL,
+        Cat.notes,
+        Cat.adding_user.label("adding_user_id"),
+        User.username.label("adding_user_username"),
+    )
+    .join(Cat, CatLocation.cat_id == Cat.cat_id)
+    .outerjoin(User, Cat.adding_user == User.user_id)
+)
+
+PINS_WITH_CAT = _PINS_WITH_CAT.order_by(desc(CatLocation.location_id)).limit(100)
+
+PIN_WITH_CAT_BY_ID = _PINS_WITH_CAT.where(CatLocation.location_id == bindparam("location_id"))
+
+# Filtered map views, served by ix_cat_locations_region_condition
+PINS_IN_REGION = (
+    _PINS_WITH_CAT.where(CatLocation.region == bindparam("region"))
+    .order_by(desc(CatLocation.location_id)).limit(100)
+)
+PINS_IN_REGION_WITH_CONDITION = (
+    _PINS_WITH_CAT.where(CatLocation.region == bindparam("region"), CatLocation.condition == bindparam("condition"))
+    .order_by(desc(CatLocation.location_id)).limit(100)
+)
+PINS_WITH_CONDITION = (
+    _PINS_WITH_CAT.where(CatLocation.condition == bindparam("condition"))
+    .order_by(desc(CatLocation.location_id)).limit(100)
+)
+
+PIN_STATE = select(CatLocation.condition, CatLocation.region)
+PIN_STATE_BY_ID = PIN_STATE.where(CatLocation.location_id == bindparam("location_id"))
+PIN_STATE_FOR_CAT = PIN_STATE.where(CatLocation.cat_id == bindparam("cat_id")).limit(1)
+
+# Possible duplicate pairs for coordinators, newest first. Pairs whose pins
+# were deleted, or that now point at the same cat, drop out through the joins.
+_dup_pin = aliased(CatLocation)
+_dup_other = aliased(CatLocation)
+_dup_cat = aliased(Cat)
+_dup_other_cat = aliased(Cat)
+_DUPLICATE_SIDES = (
+    (_dup_pin, _dup_cat, ""),
+    (_dup_other, _dup_other_cat, "other_"),
+)
+DUPLICATE_PAIRS = (
+    select(
+        PinDuplicate.pair_id,
+        PinDuplicate.distance_m,
+        PinDuplicate.seconds_apart,
+        PinDuplicate.detected_at,
+        *(
+            column.label(prefix + name)
+            for pin, cat, prefix in _DUPLICATE_SIDES
+            for name, column in (
+                ("location_id", pin.location_id),
+                ("cat_id", pin.cat_id),
+                ("name", cat.name),
+                ("latitude", pin.latitude),
+                ("longitude", pin.longitude),
+                ("condition", pin.condition),
+                ("seen_at", pin.seen_at),
+                ("image_url", cat.image_url),
+            )
+        ),
+    )
+    .join(_dup_pin, _dup_pin.location_id == PinDuplicate.location_id)
+    .join(_dup_other, _dup_other.location_id == PinDuplicate.other_location_id)
+    .join(_dup_cat, _dup_cat.cat_id == _dup_pin.cat_id)
+    .join(_dup_other_cat, _dup_other_cat.cat_id == _dup_other.cat_id)
+    .where(_dup_pin.cat_id != _dup_other.cat_id)
+    .order_by(PinDuplicate.pair_id.desc())
+    .limit(bindparam("limit"))
+)
+
+PIN_CONDITION_FOR_CAT = select(CatLocation.condition).where(
+    CatLocation.cat_id == bindparam("cat_id")
+).limit(1)
+
+# POST /activity/ in one read: the cat, its pin's condition (None without a pin) and the contributor's name
+CONTRIBUTION_TARGET = (
+    select(
+        Cat.cat_id,
+        CatLocation.condition.label("condition"),
+        select(User.username).where(User.user_id == bindparam("user_id")).scalar_subquery().label("username"),
+    )
+    .outerjoin(CatLocation, CatLocation.cat_id == Cat.cat_id)
+    .where(Cat.cat_id == bindparam("cat_id"))
+    .limit(1)
+)
+
+# ---------- adoptions ----------
+ADOPTIONS_WITH_CAT = (
+    select(
+        AdoptionListing.listing_id,
+        AdoptionListing.cat_id,
+        AdoptionListing.vaccinated,
+        AdoptionListing.sterilized,
+        AdoptionListing.is_active,
+        AdoptionListing.notes,
+        AdoptionListing.created_at,
+        AdoptionListing.uploader_id,
+        Cat.name,
+        Cat.gender,
+        Cat.age,
+        Cat.image_url,
+        THUMBNAIL_URL,
+        Cat.notes.label("cat_notes"),
+    )
+    .join(Cat, AdoptionListing.cat_id == Cat.cat_id)
+    .order_by(AdoptionListing.listing_id.desc())
+)
+
+# ---------- adoption requests ----------
+_sender = aliased(User)
+_receiver = aliased(User)
+
+REQUEST_COLUMNS = (
+    AdoptionRequest.request_id,
+    AdoptionRequest.listing_id,
+    AdoptionRequest.sender_id,
+    AdoptionRequest.receiver_id,
+    AdoptionRequest.city,
+    AdoptionRequest.age,
+    AdoptionRequest.full_name,
+    AdoptionRequest.reason_for_adoption,
+    AdoptionRequest.living_situation,
+    AdoptionRequest.experience_level,
+    AdoptionRequest.has_other_pets,
+    AdoptionRequest.status,
+    AdoptionRequest.submitted_at,
+)
+
+# One join for the sender name instead of one User lookup per request
+_INCOMING = (
+    select(
+        *REQUEST_COLUMNS,
+        func.coalesce(func.nullif(_sender.full_name, ""), _sender.username).label("sender_name"),
+    )
+    .outerjoin(_sender, AdoptionRequest.sender_id == _sender.user_id)
+    .where(AdoptionRequest.receiver_id == bindparam("user_id"))
+)
+
+INCOMING_PENDING = _INCOMING.where(AdoptionRequest.status == "Pending")
+
+INCOMING_ALL = _INCOMING.order_by(AdoptionRequest.submitted_at.desc())
+
+SENT_REQUESTS = select(*REQUEST_COLUMNS).where(AdoptionRequest.sender_id == bindparam("user_id"))
+
+SENT_ACCEPTED_WITH_CONTACT = (
+    select(
+        AdoptionRequest.request_id,
+        AdoptionRequest.listing_id,
+        Cat.name.label("cat_name"),
+        AdoptionRequest.receiver_id,
+        func.coalesce(func.nullif(_receiver.full_name, ""), _receiver.username).label("receiver_name"),
+        _receiver.email.label("receiver_email"),
+        _receiver.phone.label("receiver_phone"),
+        AdoptionRequest.submitted_at,
+    )
+    .outerjoin(_receiver, AdoptionRequest.receiver_id == _receiver.user_id)
+    .outerjoin(AdoptionListing, AdoptionRequest.listing_id == AdoptionListing.listing_id)
+    .outerjoin(Cat, AdoptionListing.cat_id == Cat.cat_id)
+    .where(AdoptionRequest.sender_id == bindparam("user_id"), AdoptionRequest.status == "Accepted")
+    .order_by(AdoptionRequest.submitted_at.desc())
+)
+
+# Everything create_adoption_request checks and writes into its notifications, in one round trip
+ADOPTION_REQUEST_CONTEXT = (
+    select(
+        AdoptionListing.uploader_id,
+        Cat.name.label("cat_name"),
+        Cat.adding_user,
+        func.coalesce(func.nullif(_sender.full_name, ""), _sender.username).label("sender_name"),
+        exists()
+        .where(
+            AdoptionRequest.listing_id == AdoptionListing.listing_id,
+            AdoptionRequest.sender_id == bindparam("sender_id"),
+        )
+        .label("duplicate"),
+    )
+    .join(Cat, AdoptionListing.cat_id == Cat.cat_id)
+    .outerjoin(_sender, _sender.user_id == bindparam("sender_id"))
+    .where(AdoptionListing.listing_id == bindparam("listing_id"), AdoptionListing.is_active == True)  # noqa: E712
+)
+
+# The request being accepted/rejected with the names its notifications mention
+REQUEST_ACTION_CONTEXT = (
+    select(
+        AdoptionRequest.status,
+        AdoptionRequest.sender_id,
+        Cat.name.label("cat_name"),
+        func.coalesce(func.nullif(_sender.full_name, ""), _sender.username).label("sender_name"),
+    )
+    .outerjoin(AdoptionListing, AdoptionRequest.listing_id == AdoptionListing.listing_id)
+    .outerjoin(Cat, AdoptionListing.cat_id == Cat.cat_id)
+    .outerjoin(_sender, AdoptionRequest.sender_id == _sender.user_id)
+    .where(
+        AdoptionRequest.request_id == bindparam("request_id"),
+        AdoptionRequest.receiver_id == bindparam("receiver_id"),
+    )
+)
+
+# ---------- notifications ----------
+NOTIFICATIONS_FOR_USER = (
+    select(
+        Notification.notification_id,
+        Notification.message,
+        Notification.is_read,
+        Notification.created_at,
+        Notification.user_id,
+    )
+    .where(Notification.user_id == bindparam("user_id"))
+    .order_by(Notification.created_at.desc())
+)
+
+UNREAD_COUNT = select(func.count(Notification.notification_id)).where(
+    Notification.user_id == bindparam("user_id"),
+    Notification.is_read == False,  # noqa: E712
+)
+
+# ---------- activity ----------
+ACTIVITY_COLUMNS = (
+    ActivityLog.log_id,
+    ActivityLog.activity_time,
+    ActivityLog.activity_description,
+    ActivityLog.cat_id,
+    ActivityLog.user_id,
+    User.username,
+)
+
+ACTIVITY_FOR_USER = (
+    select(*ACTIVITY_COLUMNS)
+    .outerjoin(User, ActivityLog.user_id == User.user_id)
+    .where(ActivityLog.user_id == bindparam("user_id"))
+    .order_by(ActivityLog.activity_time.desc())
+)
+
+_ACTIVITY_FOR_CAT = (
+    select(*ACTIVITY_COLUMNS)
+    .outerjoin(User, ActivityLog.user_id == User.user_id)
+    .where(ActivityLog.cat_id == bindparam("cat_id"))
+)
+
+ACTIVITY_FOR_CAT_NEWEST = _ACTIVITY_FOR_CAT.order_by(ActivityLog.activity_time.desc())
+
+# Ascending for the public timeline
+ACTIVITY_FOR_CAT_OLDEST = _ACTIVITY_FOR_CAT.order_by(ActivityLog.activity_time.asc())
+
+ACTIVITY_FOR_CAT_LATEST = (
+    _ACTIVITY_FOR_CAT.order_by(ActivityLog.activity_time.desc(), ActivityLog.log_id.desc())
+    .limit(bindparam("limit"))
+)
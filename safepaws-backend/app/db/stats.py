@@ -0,0 +1,429 @@
+# app/db/stats.py
+# Community statistics kept as running totals in stat_counters.
+#
+# Write paths record what they changed in the same transaction as the change:
+#
+#   stats.pin_changed(db, ("NORMAL", "Riyadh"), ("URGENT", "Riyadh"))
+#   stats.activity_added(db, user_id)
+#   db.commit()     # the counters are upserted right before this commit
+#
+# Bumps are collected on the session and written as one multi-row upsert in
+# before_commit (sorted by key so concurrent writers lock rows in the same
+# order), and dropped on rollback. GET /stats reads the current rows once per
+# STATS_TTL seconds per worker, so a visit never scans the base tables.
+#
+# Counters can drift (deletes by FK cascade, writes outside the API). A
+# background thread recomputes them from the base tables every
+# STATS_RECONCILE_SECONDS and adds the difference it finds to the rows
+# (total = total + (actual - stored), both read from one snapshot, so bumps
+# committed meanwhile are kept); it is exported as safepaws_stats_drift_total.
+# Only one process runs the scheduled passes: the first to take a database
+# lock (app/db/locks.py) keeps it, the others try again every interval.
+#
+# What is counted:
+#   pins            cats on the map, by condition (subject)
+#   region_pins     cats on the map per region and condition (subject "Riyadh|URGENT")
+#   listings_active active adoption listings
+#   adoptions       cats marked ADOPTED ("Cat marked as ADOPTED" log entries), per month
+#   contributions   activity log entries, per ISO week
+#   volunteer       activity log entries per user (subject = user_id), per ISO week
+import logging
+import os
+import threading
+import time
+from collections import Counter as Tally
+from datetime import datetime, timedelta
+
+from sqlalchemy import Integer, cast, delete, event, func, insert, or_, select, update
+from sqlalchemy.orm import Session
+
+from app.core.metrics import REGISTRY
+from app.core.singleflight import Group
+from app.core.ttl_cache import TTLCache
+from app.db.models import ActivityLog, AdoptionListing, CatLocation, StatCounter, User
+from app.db.locks import named_lock, try_lock
+from app.db.session import SessionLocal, engine
+
+STATS_TTL = float(os.getenv("STATS_TTL", "30"))
+STATS_RECONCILE_SECONDS = float(os.getenv("STATS_RECONCILE_SECONDS", "600"))
+STATS_TOP_VOLUNTEERS = int(os.getenv("STATS_TOP_VOLUNTEERS", "5"))
+# How long reconcile() waits for a pass running in another process
+STATS_RECONCILE_WAIT = float(os.getenv("STATS_RECONCILE_WAIT", "30"))
+RECONCILE_LOCK = "safepaws.stats.reconcile"  # held during a pass
+RECONCILER_LOCK = "safepaws.stats.reconciler"  # held by the process running the scheduled passes
+
+ADOPTED_DESCRIPTION = "Cat marked as ADOPTED"
+ALL_TIME = ("pins", "region_pins", "listings_active")
+MONTHLY = ("adoptions",)
+WEEKLY = ("contributions", "volunteer")
+
+_BUMPS = "stat_bumps"
+
+log = logging.getLogger("safepaws.stats")
+
+stats_drift = REGISTRY.counter(
+    "safepaws_stats_drift_total", "Absolute difference corrected by the stats reconciler", ("counter",)
+)
+stats_reconcile_seconds = REGISTRY.histogram(
+    "safepaws_stats_reconcile_seconds", "Time to recompute the stat counters from the base tables"
+)
+
+
+# ===================== PERIODS =====================
+
+def month_period(now: datetime | None = None) -> str:
+    return (now or datetime.now()).strftime("%Y-%m")
+
+
+def week_period(now: datetime | None = None) -> str:
+    year, week, _ = (now or datetime.now()).isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+def _period_starts(now: datetime) -> tuple[datetime, datetime]:
+    month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    week_start = (now - timedelta(days=now.weekday())).replace(hour=0, minute=0, second=0, microsecond=0)
+    return month_start, week_start
+
+
+# ===================== INCREMENTAL UPDATES =====================
+
+def bump(db: Session, name: str, amount: int = 1, subject: str = "", period: str = "") -> None:
+    """Add amount to a counter when db commits."""
+    bumps = db.info.setdefault(_BUMPS, Tally())
+    bumps[(name, period, str(subject))] += amount
+
+
+def _region_subject(condition: str, region: str) -> str:
+    return f"{region}|{condition}"
+
+
+def pin_changed(db: Session, old: tuple[str, str | None] | None, new: tuple[str, str | None] | None) -> None:
+    """
+    A pin was added (old None), removed (new None), changed condition or moved.
+    old and new are (condition, region) pairs.
+    """
+    if old == new:
+        return
+    for state, amount in ((old, -1), (new, 1)):
+        if state is None:
+            continue
+        condition, region = state
+        bump(db, "pins", amount, subject=condition)
+        if region:
+            bump(db, "region_pins", amount, subject=_region_subject(condition, region))
+
+
+def listing_changed(db: Session, was_active: bool, is_active: bool) -> None:
+    if was_active != is_active:
+        bump(db, "listings_active", 1 if is_active else -1)
+
+
+def activity_added(db: Session, user_id: int | None, description: str = "", count: int = 1) -> None:
+    now = datetime.now()
+    week = week_period(now)
+    bump(db, "contributions", count, period=week)
+    if user_id is not None:
+        bump(db, "volunteer", count, subject=user_id, period=week)
+    if description == ADOPTED_DESCRIPTION:
+        bump(db, "adoptions", count, period=month_period(now))
+
+
+def _upsert(db: Session, rows: list[dict]) -> None:
+    dialect = db.get_bind().dialect.name
+    if dialect == "mysql":
+        from sqlalchemy.dialects.mysql import insert as mysql_insert
+
+        stmt = mysql_insert(StatCounter).values(rows)
+        db.execute(stmt.on_duplicate_key_update(total=StatCounter.total + stmt.inserted["total"]))
+        return
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as conflict_insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as conflict_insert
+
+        stmt = conflict_insert(StatCounter).values(rows)
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=["name", "period", "subject"],
+            set_={"total": StatCounter.total + stmt.excluded["total"]},
+        ))
+        return
+    for row in rows:
+        result = db.execute(
+            update(StatCounter)
+            .where(StatCounter.name == row["name"], StatCounter.period == row["period"],
+                   StatCounter.subject == row["subject"])
+            .values(total=StatCounter.total + row["total"])
+        )
+        if result.rowcount == 0:
+            db.execute(insert(StatCounter).values(row))
+
+
+@event.listens_for(SessionLocal, "before_commit")
+def _write_bumps(db: Session) -> None:
+    bumps = db.info.pop(_BUMPS, None)
+    if not bumps:
+        return
+    rows = [
+        {"name": name, "period": period, "subject": subject, "total": amount}
+        for (name, period, subject), amount in sorted(bumps.items())
+        if amount
+    ]
+    if rows:
+        _upsert(db, rows)
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _drop_bumps(db: Session) -> None:
+    db.info.pop(_BUMPS, None)
+
+
+# ===================== READ =====================
+
+_cache = TTLCache(4, STATS_TTL)
+_loads = Group("stats")
+
+
+def _build(db: Session) -> dict:
+    now = datetime.now()
+    month, week = month_period(now), week_period(now)
+    rows = db.execute(
+        select(StatCounter.name, StatCounter.subject, StatCounter.total).where(
+            or_(
+                StatCounter.name.in_(("pins", "listings_active")),
+                (StatCounter.name == "adoptions") & (StatCounter.period == month),
+                (StatCounter.name == "contributions") & (StatCounter.period == week),
+            )
+        )
+    ).all()
+    by_condition = {row.subject: row.total for row in rows if row.name == "pins" and row.total > 0}
+    totals = {row.name: row.total for row in rows if row.name != "pins"}
+
+    volunteers = db.execute(
+        select(User.user_id, User.username, StatCounter.total)
+        .select_from(StatCounter)
+        .join(User, User.user_id == cast(StatCounter.subject, Integer))
+        .where(StatCounter.name == "volunteer", StatCounter.period == week, StatCounter.total > 0)
+        .order_by(StatCounter.total.desc(), User.user_id)
+        .limit(STATS_TOP_VOLUNTEERS)
+    ).all()
+
+    return {
+        "cats_on_map": sum(by_condition.values()),
+        "cats_by_condition": dict(sorted(by_condition.items())),
+        "active_listings": totals.get("listings_active", 0),
+        "adoptions_this_month": totals.get("adoptions", 0),
+        "contributions_this_week": totals.get("contributions", 0),
+        "top_volunteers": [
+            {"user_id": v.user_id, "username": v.username, "contributions": v.total} for v in volunteers
+        ],
+        "month": month,
+        "week": week,
+        "generated_at": now.replace(microsecond=0).isoformat(),
+    }
+
+
+def _build_regions(db: Session) -> list[dict]:
+    regions: dict[str, dict] = {}
+    for subject, total in db.execute(
+        select(StatCounter.subject, StatCounter.total).where(
+            StatCounter.name == "region_pins", StatCounter.period == "", StatCounter.total > 0
+        )
+    ):
+        region, _, condition = subject.rpartition("|")
+        entry = regions.setdefault(region, {"region": region, "total": 0, "by_condition": {}})
+        entry["total"] += total
+        entry["by_condition"][condition] = total
+    for entry in regions.values():
+        entry["by_condition"] = dict(sorted(entry["by_condition"].items()))
+    return sorted(regions.values(), key=lambda e: (-e["total"], e["region"]))
+
+
+def _cached(key: str, build, db: Session):
+    cached = _cache.get(key)
+    if cached is not None:
+        return cached
+    value, _ = _loads.do(key, build, db)
+    _cache.set(key, value)
+    return value
+
+
+def snapshot(db: Session) -> dict:
+    """Current stats, rebuilt from stat_counters at most once per STATS_TTL per worker."""
+    return _cached("stats", _build, db)
+
+
+def region_counts(db: Session) -> list[dict]:
+    """Pins per region with a breakdown by condition, largest region first. Same caching as snapshot()."""
+    return _cached("regions", _build_regions, db)
+
+
+# ===================== RECONCILE =====================
+
+def _actual(db: Session, now: datetime) -> dict[tuple[str, str, str], int]:
+    month_start, week_start = _period_starts(now)
+    month, week = month_period(now), week_period(now)
+    actual: dict[tuple[str, str, str], int] = {}
+
+    for condition, region, total in db.execute(
+        select(CatLocation.condition, CatLocation.region, func.count())
+        .group_by(CatLocation.region, CatLocation.condition)
+    ):
+        actual[("pins", "", condition)] = actual.get(("pins", "", condition), 0) + total
+        if region:
+            actual[("region_pins", "", _region_subject(condition, region))] = total
+    actual[("listings_active", "", "")] = db.execute(
+        select(func.count()).select_from(AdoptionListing).where(AdoptionListing.is_active == True)  # noqa: E712
+    ).scalar()
+    actual[("adoptions", month, "")] = db.execute(
+        select(func.count()).select_from(ActivityLog).where(
+            ActivityLog.activity_description == ADOPTED_DESCRIPTION, ActivityLog.activity_time >= month_start
+        )
+    ).scalar()
+    actual[("contributions", week, "")] = db.execute(
+        select(func.count()).select_from(ActivityLog).where(ActivityLog.activity_time >= week_start)
+    ).scalar()
+    for user_id, total in db.execute(
+        select(ActivityLog.user_id, func.count())
+        .where(ActivityLog.activity_time >= week_start, ActivityLog.user_id.is_not(None))
+        .group_by(ActivityLog.user_id)
+    ):
+        actual[("volunteer", week, str(user_id))] = total
+    return actual
+
+
+def _reconcile(db: Session) -> dict[str, int]:
+    try:
+        now = datetime.now()
+        month, week = month_period(now), week_period(now)
+        keep = {month, week, month_period(now.replace(day=1) - timedelta(days=1)),
+                week_period(now - timedelta(weeks=1))}
+        # stored and actual come from the same snapshot: the correction is their difference, applied to
+        # the current rows, so bumps committed since the snapshot are kept
+        actual = _actual(db, now)
+
+        current = or_(
+            StatCounter.name.in_(ALL_TIME),
+            StatCounter.name.in_(MONTHLY) & (StatCounter.period == month),
+            StatCounter.name.in_(WEEKLY) & (StatCounter.period == week),
+        )
+        stored = {
+            (row.name, row.period, row.subject): row.total
+            for row in db.execute(
+                select(StatCounter.name, StatCounter.period, StatCounter.subject, StatCounter.total).where(current)
+            )
+        }
+        drift: dict[str, int] = {}
+        corrections = []
+        for key in sorted(stored.keys() | actual.keys()):
+            diff = actual.get(key, 0) - stored.get(key, 0)
+            if diff:
+                drift[key[0]] = drift.get(key[0], 0) + abs(diff)
+                name, period, subject = key
+                corrections.append({"name": name, "period": period, "subject": subject, "total": diff})
+
+        if corrections:
+            _upsert(db, corrections)
+        db.execute(delete(StatCounter).where(current, StatCounter.total == 0))
+        db.execute(delete(StatCounter).where(
+            StatCounter.name.in_(MONTHLY + WEEKLY), StatCounter.period.not_in(keep)
+        ))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return drift
+
+
+class ReconcileBusy(Exception):
+    """Another process is reconciling and did not finish within STATS_RECONCILE_WAIT."""
+
+
+def reconcile(db: Session | None = None) -> dict[str, int]:
+    """
+    Recompute every current counter from the base tables and correct the rows
+    by the difference. Rows for periods before the previous month/week are
+    deleted. Returns the absolute drift corrected per counter name. One pass at
+    a time across processes: raises ReconcileBusy if another one does not end
+    in time.
+    """
+    own = db is None
+    db = db or SessionLocal()
+    try:
+        with engine.connect() as lock_conn, named_lock(lock_conn, RECONCILE_LOCK, STATS_RECONCILE_WAIT) as acquired:
+            if not acquired:
+                raise ReconcileBusy()
+            with stats_reconcile_seconds.time():
+                drift = _reconcile(db)
+    finally:
+        if own:
+            db.close()
+
+    for name, diff in drift.items():
+        stats_drift.inc(name, amount=diff)
+    _cache.clear()
+    return drift
+
+
+class _Reconciler:
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._conn = None  # holds RECONCILER_LOCK while this process runs the passes
+
+    def start(self) -> None:
+        if self.interval <= 0 or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="stats-reconcile", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _lead(self) -> bool:
+        """Whether this process runs the scheduled passes. Asked again before each one, in case the connection died."""
+        try:
+            if self._conn is None:
+                self._conn = engine.connect()
+            leading = try_lock(self._conn, RECONCILER_LOCK)
+            self._conn.commit()  # the lock belongs to the session, not to the transaction
+        except Exception:
+            log.warning("stats reconcile: cannot check the reconciler lock", exc_info=True)
+            leading = False
+        if not leading:
+            self._release()
+        return leading
+
+    def _release(self) -> None:
+        if self._conn is not None:
+            try:
+                self._conn.close()  # the lock goes with the connection
+            except Exception:
+                pass
+            self._conn = None
+
+    def _run(self) -> None:
+        # First pass right away so a fresh table is filled at startup
+        try:
+            while True:
+                started = time.monotonic()
+                if self._lead():
+                    try:
+                        drift = reconcile()
+                        if drift:
+                            log.warning("stats reconcile corrected drift: %s", drift)
+                    except Exception:
+                        log.exception("stats reconcile failed")
+                if self._stop.wait(max(0.0, self.interval - (time.monotonic() - started))):
+                    return
+        finally:
+            self._release()
+
+
+reconciler = _Reconciler(STATS_RECONCILE_SECONDS)
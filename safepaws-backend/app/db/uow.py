@@ -0,0 +1,92 @@
+# app/db/uow.py
+# Unit of work: all writes of a request go out in one flush and one commit.
+#
+#   with unit_of_work(db):
+#       db.add(request)
+#       db.flush()          # when a generated id is needed before the end
+#       db.add(notification)
+#       after_commit(db, publish, CACHE, "pins")
+#   # committed here, once, then publish() runs
+#
+# Nested blocks join the outermost one, so helpers can open their own without
+# causing extra commits. Objects are not expired by the commit: handlers build
+# their response from what they already have in memory instead of reloading it
+# (server side defaults such as created_at must be set in Python to be available).
+#
+# Work that must only happen once the data is committed (cache invalidation,
+# in-process indexes) goes through after_commit(), so a handler called inside
+# a bigger unit of work (POST /sync) does not announce writes that are not
+# committed yet, or that roll back. Within a unit of work, savepoint() lets one
+# step fail on its own:
+#
+#   with unit_of_work(db):
+#       for action in actions:
+#           try:
+#               with savepoint(db):
+#                   apply(action)
+#           except HTTPException:
+#               ...             # this action is undone, the others are kept
+from contextlib import contextmanager
+from copy import copy
+
+from sqlalchemy.orm import Session
+
+_DEPTH = "uow_depth"
+_AFTER_COMMIT = "uow_after_commit"
+
+
+@contextmanager
+def unit_of_work(db: Session):
+    depth = db.info.get(_DEPTH, 0)
+    db.info[_DEPTH] = depth + 1
+    try:
+        yield db
+        if depth == 0:
+            expire = db.expire_on_commit
+            db.expire_on_commit = False
+            try:
+                db.commit()
+            finally:
+                db.expire_on_commit = expire
+    except BaseException:
+        if depth == 0:
+            db.info.pop(_AFTER_COMMIT, None)
+            db.rollback()
+        raise
+    finally:
+        db.info[_DEPTH] = depth
+    if depth == 0:
+        for fn, args in db.info.pop(_AFTER_COMMIT, ()):
+            fn(*args)
+
+
+def in_unit_of_work(db: Session) -> bool:
+    return bool(db.info.get(_DEPTH))
+
+
+def after_commit(db: Session, fn, *args) -> None:
+    """Call fn(*args) once the outermost unit of work has committed; never if it rolls back."""
+    if not in_unit_of_work(db):
+        fn(*args)
+        return
+    db.info.setdefault(_AFTER_COMMIT, []).append((fn, args))
+
+
+@contextmanager
+def savepoint(db: Session):
+    """
+    Part of a unit of work that can fail alone: if it raises, its writes are
+    rolled back to a SAVEPOINT and whatever it staged on the session (after
+    commit calls, stat bumps) is forgotten. The exception propagates.
+    """
+    if not in_unit_of_work(db):
+        raise RuntimeError("savepoint() must be used inside unit_of_work()")
+    staged = {key: copy(value) for key, value in db.info.items() if key != _DEPTH}
+    try:
+        with db.begin_nested():
+            yield db
+    except BaseException:
+        for key in [key for key in db.info if key != _DEPTH]:
+            del db.info[key]
+        db.info.update(staged)
+        raise
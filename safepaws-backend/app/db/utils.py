@@ -1,9 +1,59 @@
+import os
+from fastapi import HTTPException, status
 from passlib.context import CryptContext
+from app.core.metrics import password_hash_seconds
+from app.core.process_pool import BoundedProcessPool, PoolSaturated
 
-pwd_context = CryptContext(schemes=["bcrypt_sha256"], deprecated="auto")
+# bcrypt cost. Hashes made with a different cost are flagged for update and
+# rehashed transparently on the next successful login.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
 
-def hash_password(password: str):
+# Hashing runs in its own processes so a burst of logins does not hold the GIL
+# in the API process. HASH_POOL_WORKERS=0 hashes inline (tests, benchmarks).
+HASH_POOL_WORKERS = int(os.getenv("HASH_POOL_WORKERS", "2"))
+HASH_POOL_QUEUE = int(os.getenv("HASH_POOL_QUEUE", "8"))
+HASH_RETRY_AFTER = os.getenv("HASH_RETRY_AFTER", "2")
+
+pwd_context = CryptContext(
+    schemes=["bcrypt_sha256"],
+    deprecated="auto",
+    bcrypt_sha256__default_rounds=BCRYPT_ROUNDS,
+    bcrypt_sha256__min_rounds=BCRYPT_ROUNDS,
+    bcrypt_sha256__max_rounds=BCRYPT_ROUNDS,
+)
+
+_hash_pool = BoundedProcessPool("password_hash", HASH_POOL_WORKERS, HASH_POOL_QUEUE)
+
+
+# These run inside the pool's worker processes, so they stay module level
+def _hash(password: str) -> str:
     return pwd_context.hash(password)
-def verify_password(plain_password: str, hashed_password: str) -> bool:
+
+
+def _verify(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
+
+def _verify_and_update(plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+
+def _run(operation: str, fn, *args):
+    try:
+        with password_hash_seconds.time(operation):
+            return _hash_pool.run(fn, *args)
+    except PoolSaturated:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server is busy, please try again shortly",
+            headers={"Retry-After": HASH_RETRY_AFTER},
+        )
+
+
+def hash_password(password: str):
+    return _run("hash", _hash, password)
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return _run("verify", _verify, plain_password, hashed_password)
+def verify_and_update_password(plain_password: str, hashed_password: str) -> tuple[bool, str | None]:
+    """Returns (valid, new_hash); new_hash is set when the stored hash uses an outdated cost."""
+    return _run("verify", _verify_and_update, plain_password, hashed_password)
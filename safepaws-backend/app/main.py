@@ -3,9 +3,17 @@ import os
 from pathlib import Path
 from fastapi import FastAPI, Request, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from fastapi.exceptions import RequestValidationError
-from app.db.session import ping_db
+from app.db.session import ping_db, engine, SessionLocal
+from app.db import slow_queries, stats, image_hashes, activity_buffer
+from app.db.schema import ensure_schema
+from app.core.metrics import MetricsMiddleware, REGISTRY, CONTENT_TYPE
+from app.core.rate_limit import RateLimitHeadersMiddleware
+from app.core.bulkhead import BulkheadMiddleware
+from app.core.response_cache import ResponseCacheMiddleware
+from app.core.compression import CompressionMiddleware
+from app.core import invalidation
 from app.api.pins import router as pins_router
 from app.api.users import router as users_router
 from app.api.cat import router as cat_router
@@ -13,6 +21,11 @@ from app.api.adoptions import router as adoptions_router
 from app.api.adoptionsRequest import router as adoptionsRequest_router
 from app.api.notifications import router as notifications_router
 from app.api.activity import router as activity_router
+from app.api.internal import router as internal_router
+from app.api.stats import router as stats_router
+from app.api.media import router as media_router
+from app.api.export import router as export_router
+from app.api.sync import router as sync_router
 from dotenv import load_dotenv
 
 # Load .env from the app folder
@@ -21,6 +34,19 @@ load_dotenv(dotenv_path=env_path)
 
 app = FastAPI(title="Safepaws API", version="1.0.0")
 
+# Per route group concurrency limits. Added before CORS so that 503s from
+# load shedding still carry the CORS headers the frontend needs to read them
+app.add_middleware(BulkheadMiddleware)
+
+# Public read cache, outside the bulkheads so hits never wait for a slot
+app.add_middleware(ResponseCacheMiddleware)
+
+# gzip/brotli, outside the cache: hits arrive precompressed and are passed through
+app.add_middleware(CompressionMiddleware)
+
+# Slow query log (no-op unless SLOW_QUERY_MS is set)
+slow_queries.install(engine)
+
 # CORS configuration - allows frontend to make requests
 # Get allowed origins from environment variable, or use default for development
 allowed_origins = os.getenv(
@@ -36,6 +62,12 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
+# RateLimit-* headers from the rate_limit() dependency, on every response type
+app.add_middleware(RateLimitHeadersMiddleware)
+
+# Request metrics - added last so it wraps everything and sees the final status
+app.add_middleware(MetricsMiddleware)
+
 # Exception handler to ensure CORS headers are included in error responses
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
@@ -68,10 +100,61 @@ def healthz():
     ping_db()  
     return {"ok": True}
 
+# Prometheus text format. async so the thread pool collector runs on the event loop
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE)
+
+# Cross-worker cache invalidation (no-op unless INVALIDATION_SOCKET_DIR is set).
+# Started here rather than at import so each forked worker gets its own socket
+@app.on_event("startup")
+def start_invalidation_bus():
+    invalidation.bus.start()
+
+@app.on_event("shutdown")
+def stop_invalidation_bus():
+    invalidation.bus.stop()
+
+# New tables/columns/indexes from the models (e.g. stat_counters), one worker
+# at a time, then the stats reconciler, whose first pass fills the counters
+# (only the worker holding its database lock runs the passes)
+@app.on_event("startup")
+def upgrade_schema_and_start_stats():
+    ensure_schema(engine)
+    stats.reconciler.start()
+
+@app.on_event("shutdown")
+def stop_stats():
+    stats.reconciler.stop()
+
+# Activity write-behind: inserts journal segments a crash left behind, then
+# flushes queued contributions (only with ACTIVITY_WRITE_BEHIND=true)
+@app.on_event("startup")
+def start_activity_buffer():
+    activity_buffer.buffer.start()
+
+@app.on_event("shutdown")
+def stop_activity_buffer():
+    activity_buffer.buffer.stop()
+
+# Hamming index for POST /cats/similar, from the stored hashes
+@app.on_event("startup")
+def load_image_hashes():
+    db = SessionLocal()
+    try:
+        image_hashes.load(db)
+    finally:
+        db.close()
+
 app.include_router(users_router)
 app.include_router(pins_router)
 app.include_router(cat_router)
 app.include_router(adoptions_router)
 app.include_router(adoptionsRequest_router)
 app.include_router(notifications_router)
-app.include_router(activity_router)
\ No newline at end of file
+app.include_router(activity_router)
+app.include_router(internal_router)
+app.include_router(stats_router)
+app.include_router(media_router)
+app.include_router(export_router)
+app.include_router(sync_router)
\ No newline at end of file
@@ -0,0 +1,40 @@
+# app/scrape_metrics.py
+# Minimal scraper stub: fetches /metrics, checks every line parses as
+# Prometheus text format and prints request counts per route.
+import re
+import sys
+import urllib.request
+
+SAMPLE_RE = re.compile(
+    r'^(?P<name>[a-zA-Z_:][a-zA-Z0-9_:]*)'
+    r'(?:\{(?P<labels>(?:[a-zA-Z_][a-zA-Z0-9_]*="(?:[^"\\]|\\.)*",?)*)\})?'
+    r' (?P<value>[-+]?(?:[0-9.]+(?:[eE][-+]?[0-9]+)?|Inf|NaN))$'
+)
+LABEL_RE = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)"')
+
+
+def parse(text: str) -> list[tuple[str, dict, float]]:
+    samples = []
+    for lineno, line in enumerate(text.splitlines(), 1):
+        if not line or line.startswith("# HELP") or line.startswith("# TYPE"):
+            continue
+        match = SAMPLE_RE.match(line)
+        if not match:
+            raise ValueError(f"line {lineno} is not valid exposition format: {line!r}")
+        labels = dict(LABEL_RE.findall(match.group("labels") or ""))
+        samples.append((match.group("name"), labels, float(match.group("value"))))
+    return samples
+
+
+def main():
+    url = sys.argv[1] if len(sys.argv) > 1 else "http://127.0.0.1:8000/metrics"
+    with urllib.request.urlopen(url) as resp:
+        samples = parse(resp.read().decode("utf-8"))
+    print(f"✅ {len(samples)} samples parsed from {url}")
+    for name, labels, value in samples:
+        if name == "safepaws_http_requests_total":
+            print(f"  {labels['method']:6} {labels['route']:45} {labels['status']} {int(value)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+# benchmarks/compare.py
+#   python -m benchmarks.compare before.json after.json
+import json
+import sys
+
+FIELDS = ("p50_ms", "p95_ms", "p99_ms", "statements_per_request")
+
+
+def _delta(old: float, new: float) -> str:
+    if not old:
+        return "   n/a"
+    return f"{(new - old) / old * 100:+6.1f}%"
+
+
+def main():
+    if len(sys.argv) != 3:
+        print("usage: python -m benchmarks.compare BEFORE.json AFTER.json")
+        sys.exit(2)
+    with open(sys.argv[1]) as fh:
+        before = json.load(fh)
+    with open(sys.argv[2]) as fh:
+        after = json.load(fh)
+
+    print(f"commits: {before['meta'].get('commit')} -> {after['meta'].get('commit')}")
+    print(f"throughput: {before['throughput_rps']} -> {after['throughput_rps']} rps "
+          f"({_delta(before['throughput_rps'], after['throughput_rps'])})")
+    for route in sorted(set(before["routes"]) | set(after["routes"])):
+        old, new = before["routes"].get(route), after["routes"].get(route)
+        if not old or not new:
+            print(f"{route:50} only in {'after' if new else 'before'}")
+            continue
+        cols = "  ".join(f"{f[:-3] if f.endswith('_ms') else 'stmts'} {new[f]:>8} ({_delta(old[f], new[f])})" for f in FIELDS)
+        print(f"{route:50} {cols}")
+
+
+if __name__ == "__main__":
+    main()
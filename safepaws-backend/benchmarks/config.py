@@ -0,0 +1,13 @@
+# benchmarks/config.py
+# No app imports here: DATABASE_URL has to be set before app.db.session loads.
+BENCH_PASSWORD = "benchpass1"
+
+DEFAULT_SIZES = {
+    "users": 200,
+    "cats": 2000,
+    "pins": 1500,
+    "listings": 300,
+    "requests": 600,
+    "notifications": 5000,
+    "activity": 8000,
+}
@@ -0,0 +1,372 @@
+# benchmarks/dataset.py
+# Deterministic dataset generator and snapshot save/restore for perf environments.
+#
+#   python -m benchmarks.dataset generate --db sqlite:///perf.db --n-cats 200000 --n-activity 1000000
+#   python -m benchmarks.dataset snapshot --db sqlite:///perf.db --file world.snap
+#   python -m benchmarks.dataset restore  --db mysql+mysqlconnector://... --file world.snap
+#
+# Rows are produced table by table from formulas plus a per-table RNG, so any
+# table can be streamed without keeping the others in memory and the same seed
+# always yields the same world. Inserts go straight to the DBAPI executemany
+# (multi-row INSERTs on mysql-connector), or LOAD DATA LOCAL INFILE with
+# --method infile on MySQL.
+import argparse
+import csv
+import io
+import json
+import os
+import random
+import tempfile
+import time
+import zipfile
+from datetime import datetime, timedelta
+from typing import Callable, Iterator
+
+from benchmarks.config import BENCH_PASSWORD, DEFAULT_SIZES
+
+CHUNK = 10_000
+NULL = "\\N"
+BASE_TIME = datetime(2025, 1, 1)
+CONDITIONS = ("NORMAL", "NORMAL", "NORMAL", "URGENT", "AT VET", "UNKNOWN")
+GENDERS = ("M", "F", "UNKNOWN")
+EXPERIENCE = ("None", "Minimal", "Fairly experienced", "Good with cats")
+STATUSES = ("Pending", "Pending", "Accepted", "Rejected")
+
+
+# ===================== SIZES =====================
+
+def resolve_sizes(sizes: dict | None) -> dict:
+    """Clamp requested sizes to what keeps the world referentially consistent."""
+    sizes = {**DEFAULT_SIZES, **(sizes or {})}
+    sizes["users"] = max(sizes["users"], 2)
+    # pinned cats and listed cats are disjoint, the API enforces the same rule
+    sizes["pins"] = min(sizes["pins"], sizes["cats"])
+    sizes["listings"] = min(sizes["listings"], sizes["cats"] - sizes["pins"])
+    # each (listing, sender) pair at most once, and never the uploader
+    sizes["requests"] = min(sizes["requests"], sizes["listings"] * (sizes["users"] - 1))
+    return sizes
+
+
+def _adding_user(cat_id: int, n_users: int) -> int:
+    return (cat_id * 7919) % n_users + 1
+
+
+# ===================== ROW GENERATORS =====================
+# Each generator yields tuples in the column order returned by columns(table).
+
+def _users(s, rng, password_hash):
+    for i in range(1, s["users"] + 1):
+        yield (i, f"user{i}", f"Bench User {i}", password_hash, f"user{i}@bench.local",
+               f"05{i:08d}", BASE_TIME, None)
+
+
+def _cats(s, rng, _):
+    for i in range(1, s["cats"] + 1):
+        yield (i, f"Cat {i}", GENDERS[rng.randrange(3)], rng.randrange(16),
+               "synthetic cat " * (1 + rng.randrange(20)),
+               f"https://img.bench.local/cats/{i}.jpg", _adding_user(i, s["users"]), None)
+
+
+def _pins(s, rng, _):
+    from app.db.regions import region_for
+
+    for i in range(1, s["pins"] + 1):
+        latitude, longitude = 16 + rng.random() * 17, 34 + rng.random() * 22
+        created_at = BASE_TIME + timedelta(minutes=i)
+        yield (i, i, latitude, longitude, CONDITIONS[rng.randrange(len(CONDITIONS))],
+               created_at, region_for(latitude, longitude), created_at)
+
+
+def _listings(s, rng, _):
+    for i in range(1, s["listings"] + 1):
+        cat_id = s["pins"] + i
+        yield (i, rng.random() < 0.5, rng.random() < 0.5, rng.random() < 0.9, "friendly",
+               BASE_TIME + timedelta(hours=i), _adding_user(cat_id, s["users"]), cat_id)
+
+
+def _requests(s, rng, _):
+    n_listings, n_users = s["listings"], s["users"]
+    for i in range(s["requests"]):
+        listing_id = i % n_listings + 1
+        uploader = _adding_user(s["pins"] + listing_id, n_users)
+        # k-th request for a listing comes from the k-th user after the uploader
+        sender = (uploader + i // n_listings) % n_users + 1
+        yield (i + 1, listing_id, sender, uploader, "Riyadh", 18 + rng.randrange(42),
+               f"Bench User {sender}", "I love cats", "Apartment",
+               EXPERIENCE[rng.randrange(4)], rng.random() < 0.3,
+               STATUSES[rng.randrange(4)], BASE_TIME + timedelta(minutes=i))
+
+
+def _notifications(s, rng, _):
+    n_users = s["users"]
+    for i in range(1, s["notifications"] + 1):
+        yield (i, f"Notification {i}", rng.random() < 0.7,
+               BASE_TIME + timedelta(seconds=i), rng.randrange(n_users) + 1)
+
+
+def _activity(s, rng, _):
+    n_users, n_pins = s["users"], s["pins"]
+    for i in range(1, s["activity"] + 1):
+        yield (i, BASE_TIME + timedelta(seconds=i * 7), "Fed the cat",
+               rng.randrange(n_pins) + 1 if n_pins else None, rng.randrange(n_users) + 1)
+
+
+# table name -> generator; order matters for foreign keys
+GENERATORS: dict[str, Callable] = {
+    "users": _users,
+    "cats": _cats,
+    "cat_locations": _pins,
+    "adoption_listings": _listings,
+    "adoption_requests": _requests,
+    "notifications": _notifications,
+    "activity_log": _activity,
+}
+
+
+def columns(table) -> list[str]:
+    return [c.name for c in table.columns]
+
+
+def _metadata():
+    import app.db.models  # noqa: F401  registers every model on the metadata
+    from app.db.session import Base
+
+    return Base.metadata
+
+
+def _tables():
+    return [t for t in _metadata().sorted_tables if t.name in GENERATORS]
+
+
+def _recreate_schema(engine) -> None:
+    metadata = _metadata()
+    metadata.drop_all(engine)
+    metadata.create_all(engine)
+
+
+# ===================== LOADERS =====================
+
+def _placeholders(dialect, n: int) -> str:
+    style = dialect.paramstyle
+    mark = "?" if style == "qmark" else "%s"
+    return ", ".join([mark] * n)
+
+
+class _Loader:
+    """Bulk loads tuples into tables on one raw connection with checks relaxed."""
+
+    def __init__(self, engine, method: str = "insert"):
+        if method == "infile" and engine.dialect.name != "mysql":
+            raise ValueError("--method infile needs MySQL")
+        self.engine = engine
+        self.method = method
+        self.dialect = engine.dialect
+
+    def __enter__(self):
+        self.conn = self.engine.connect()
+        if self.dialect.name == "mysql":
+            self.conn.exec_driver_sql("SET FOREIGN_KEY_CHECKS=0")
+            self.conn.exec_driver_sql("SET UNIQUE_CHECKS=0")
+        elif self.dialect.name == "sqlite":
+            self.conn.exec_driver_sql("PRAGMA synchronous=OFF")
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        try:
+            if exc_type is None:
+                self.conn.commit()
+            if self.dialect.name == "mysql":
+                self.conn.exec_driver_sql("SET FOREIGN_KEY_CHECKS=1")
+                self.conn.exec_driver_sql("SET UNIQUE_CHECKS=1")
+        finally:
+            self.conn.close()
+        return False
+
+    def load(self, table, rows: Iterator[tuple]) -> int:
+        cols = columns(table)
+        if self.method == "infile":
+            return self._load_infile(table, cols, rows)
+        quote = self.dialect.identifier_preparer.quote
+        sql = (f"INSERT INTO {quote(table.name)} ({', '.join(quote(c) for c in cols)}) "
+               f"VALUES ({_placeholders(self.dialect, len(cols))})")
+        count = 0
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= CHUNK:
+                self.conn.exec_driver_sql(sql, batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            self.conn.exec_driver_sql(sql, batch)
+            count += len(batch)
+        return count
+
+    def _load_infile(self, table, cols, rows) -> int:
+        with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False, newline="", encoding="utf-8") as fh:
+            count = write_csv(fh, rows)
+            path = fh.name
+        try:
+            quote = self.dialect.identifier_preparer.quote
+            self.conn.exec_driver_sql(
+                f"LOAD DATA LOCAL INFILE '{path}' INTO TABLE {quote(table.name)} "
+                "CHARACTER SET utf8mb4 FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' "
+                "ESCAPED BY '\\\\' LINES TERMINATED BY '\\n' "
+                f"({', '.join(quote(c) for c in cols)})"
+            )
+        finally:
+            os.unlink(path)
+        return count
+
+
+def _infile_engine(url: str):
+    from sqlalchemy import create_engine
+
+    return create_engine(url, connect_args={"allow_local_infile": True})
+
+
+# ===================== CSV ENCODING =====================
+
+def _encode(value):
+    if value is None:
+        return NULL
+    if isinstance(value, bool):
+        return 1 if value else 0
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    return value
+
+
+def write_csv(fh, rows: Iterator[tuple]) -> int:
+    writer = csv.writer(fh, lineterminator="\n", escapechar="\\", doublequote=False)
+    count = 0
+    for row in rows:
+        writer.writerow([_encode(v) for v in row])
+        count += 1
+    return count
+
+
+def _decoder(column) -> Callable[[str], object]:
+    from sqlalchemy import Boolean, Float, Integer, TIMESTAMP, DateTime
+
+    kind = column.type
+    if isinstance(kind, Boolean):
+        return lambda v: v == "1"
+    if isinstance(kind, Integer):
+        return int
+    if isinstance(kind, Float):
+        return float
+    if isinstance(kind, (TIMESTAMP, DateTime)):
+        return datetime.fromisoformat
+    return str
+
+
+def read_csv(fh, table) -> Iterator[tuple]:
+    decoders = [_decoder(c) for c in table.columns]
+    for record in csv.reader(fh, escapechar="\\", doublequote=False):
+        yield tuple(None if v == NULL else dec(v) for dec, v in zip(decoders, record))
+
+
+# ===================== COMMANDS =====================
+
+def generate(engine, sizes: dict | None = None, seed: int = 42, method: str = "insert") -> dict:
+    """Drop, recreate and fill every table. Returns the sizes actually used."""
+    from app.db.utils import pwd_context
+
+    sizes = resolve_sizes(sizes)
+    _recreate_schema(engine)
+
+    # one hash shared by every user, hashing them one by one would dominate the run
+    password_hash = pwd_context.hash(BENCH_PASSWORD)
+    with _Loader(engine, method) as loader:
+        for table in _tables():
+            rng = random.Random(f"{seed}:{table.name}")
+            loader.load(table, GENERATORS[table.name](sizes, rng, password_hash))
+    return sizes
+
+
+def snapshot(engine, path: str, meta: dict | None = None) -> dict:
+    """Dump every table to a zip of compressed CSV members plus a manifest."""
+    manifest = {"created_at": datetime.utcnow().isoformat(), "tables": {}, **(meta or {})}
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=6) as zf:
+        with engine.connect() as conn:
+            for table in _tables():
+                cols = columns(table)
+                result = conn.execution_options(stream_results=True, yield_per=CHUNK).execute(
+                    table.select().order_by(*table.primary_key.columns)
+                )
+                with zf.open(f"{table.name}.csv", "w", force_zip64=True) as raw:
+                    fh = io.TextIOWrapper(raw, encoding="utf-8", newline="")
+                    count = write_csv(fh, (tuple(r) for r in result))
+                    fh.flush()
+                    fh.detach()
+                manifest["tables"][table.name] = {"rows": count, "columns": cols}
+        zf.writestr("manifest.json", json.dumps(manifest, indent=2))
+    return manifest
+
+
+def restore(engine, path: str, method: str = "insert") -> dict:
+    """Recreate the schema and load a snapshot written by snapshot()."""
+    _recreate_schema(engine)
+    with zipfile.ZipFile(path) as zf:
+        manifest = json.loads(zf.read("manifest.json"))
+        with _Loader(engine, method) as loader:
+            for table in _tables():
+                info = manifest["tables"].get(table.name)
+                if info is None:
+                    continue
+                if info["columns"] != columns(table):
+                    raise ValueError(f"snapshot columns for {table.name} do not match the models")
+                with zf.open(f"{table.name}.csv") as raw:
+                    fh = io.TextIOWrapper(raw, encoding="utf-8", newline="")
+                    loader.load(table, read_csv(fh, table))
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Safepaws perf dataset tool")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    gen = sub.add_parser("generate", help="generate a deterministic world")
+    gen.add_argument("--seed", type=int, default=42)
+    for name, default in DEFAULT_SIZES.items():
+        gen.add_argument(f"--n-{name}", dest=f"n_{name}", type=int, default=default)
+    gen.add_argument("--snapshot", help="also write a snapshot of the generated world here")
+
+    snap = sub.add_parser("snapshot", help="save the database to a compressed snapshot")
+    snap.add_argument("--file", required=True)
+
+    rest = sub.add_parser("restore", help="load a snapshot into the database")
+    rest.add_argument("--file", required=True)
+
+    for p in (gen, snap, rest):
+        p.add_argument("--db", default=os.getenv("DATABASE_URL", "sqlite:///perf.db"))
+        p.add_argument("--method", choices=["insert", "infile"], default="insert")
+    args = parser.parse_args(argv)
+
+    os.environ["DATABASE_URL"] = args.db
+    if args.method == "infile":
+        engine = _infile_engine(args.db)
+    else:
+        from app.db.session import engine
+
+    started = time.perf_counter()
+    if args.command == "generate":
+        sizes = {name: getattr(args, f"n_{name}") for name in DEFAULT_SIZES}
+        sizes = generate(engine, sizes, args.seed, args.method)
+        print(f"✅ generated {sum(sizes.values())} rows in {time.perf_counter() - started:.1f}s: {sizes}")
+        if args.snapshot:
+            snapshot(engine, args.snapshot, {"seed": args.seed, "sizes": sizes})
+            print(f"📦 snapshot written to {args.snapshot}")
+    elif args.command == "snapshot":
+        manifest = snapshot(engine, args.file)
+        rows = sum(t["rows"] for t in manifest["tables"].values())
+        print(f"📦 {rows} rows saved to {args.file} in {time.perf_counter() - started:.1f}s")
+    else:
+        manifest = restore(engine, args.file, args.method)
+        rows = sum(t["rows"] for t in manifest["tables"].values())
+        print(f"✅ {rows} rows restored from {args.file} in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+# benchmarks/run.py
+# Offline load test against the FastAPI app, in-process.
+#
+#   python -m benchmarks.run --db sqlite:///bench.db --requests 5000 --out results.json
+#   python -m benchmarks.compare before.json after.json
+#
+# DATABASE_URL must be set before the app is imported, so app imports happen
+# inside main().
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.config import DEFAULT_SIZES, BENCH_PASSWORD
+
+
+class Scenario:
+    def __init__(self, name: str, weight: int, method: str, route: str, build):
+        self.name = name
+        self.weight = weight
+        self.method = method
+        # route template, same label the /metrics endpoint uses
+        self.route = route
+        # build(rng, world) -> (path, kwargs for the client call)
+        self.build = build
+
+
+def _auth(world, rng):
+    user_id = rng.randint(1, world["users"])
+    return user_id, {"Authorization": f"Bearer {world['tokens'][user_id]}"}
+
+
+def _scenarios() -> list[Scenario]:
+    def pins(rng, w):
+        return "/pins/", {}
+
+    def adoptions(rng, w):
+        return "/adoptions/", {}
+
+    def cats(rng, w):
+        return "/cats/cats", {}
+
+    def my_cats(rng, w):
+        return "/cats/mycats", {"headers": _auth(w, rng)[1]}
+
+    def unread(rng, w):
+        return "/notifications/unread-count", {"headers": _auth(w, rng)[1]}
+
+    def inbox(rng, w):
+        return "/notifications/", {"headers": _auth(w, rng)[1]}
+
+    def incoming_all(rng, w):
+        return "/adoption-requests/incoming/all", {"headers": _auth(w, rng)[1]}
+
+    def incoming(rng, w):
+        return "/adoption-requests/incoming", {"headers": _auth(w, rng)[1]}
+
+    def sent(rng, w):
+        return "/adoption-requests/sent", {"headers": _auth(w, rng)[1]}
+
+    def sent_accepted(rng, w):
+        return "/adoption-requests/sent/accepted", {"headers": _auth(w, rng)[1]}
+
+    def activity_public(rng, w):
+        return f"/activity/cat/{rng.randint(1, max(w['pins'], 1))}/public", {}
+
+    def activity_my(rng, w):
+        return "/activity/my", {"headers": _auth(w, rng)[1]}
+
+    def profile(rng, w):
+        return "/users/profile", {"headers": _auth(w, rng)[1]}
+
+    def feed(rng, w):
+        body = {"cat_id": rng.randint(1, max(w["pins"], 1)), "activity_description": "Fed the cat"}
+        return "/activity/", {"headers": _auth(w, rng)[1], "json": body}
+
+    def condition(rng, w):
+        body = {"condition": rng.choice(["NORMAL", "URGENT"]), "description": "bench"}
+        return f"/pins/{rng.randint(1, max(w['pins'], 1))}/condition", {"headers": _auth(w, rng)[1], "json": body}
+
+    def new_cat(rng, w):
+        return "/cats/", {"headers": _auth(w, rng)[1], "json": {"name": "Bench cat", "gender": "F"}}
+
+    def adoption_request(rng, w):
+        body = {
+            "listing_id": rng.randint(1, max(w["listings"], 1)), "city": "Riyadh", "age": 30,
+            "full_name": "Bench", "reason_for_adoption": "bench", "living_situation": "bench",
+            "experience_level": "Minimal", "has_other_pets": False,
+        }
+        return "/adoption-requests/", {"headers": _auth(w, rng)[1], "json": body}
+
+    def login(rng, w):
+        return "/users/login", {"json": {"username": f"user{rng.randint(1, w['users'])}", "password": BENCH_PASSWORD}}
+
+    return [
+        # map polling
+        Scenario("map_pins", 30, "GET", "/pins/", pins),
+        Scenario("map_activity", 8, "GET", "/activity/cat/{cat_id}/public", activity_public),
+        # badge polling and inbox views
+        Scenario("badge_unread", 25, "GET", "/notifications/unread-count", unread),
+        Scenario("inbox", 6, "GET", "/notifications/", inbox),
+        Scenario("incoming_all", 4, "GET", "/adoption-requests/incoming/all", incoming_all),
+        Scenario("incoming", 2, "GET", "/adoption-requests/incoming", incoming),
+        Scenario("sent", 2, "GET", "/adoption-requests/sent", sent),
+        Scenario("sent_accepted", 1, "GET", "/adoption-requests/sent/accepted", sent_accepted),
+        # browsing
+        Scenario("adoptions", 8, "GET", "/adoptions/", adoptions),
+        Scenario("cats", 2, "GET", "/cats/cats", cats),
+        Scenario("my_cats", 1, "GET", "/cats/mycats", my_cats),
+        Scenario("my_activity", 1, "GET", "/activity/my", activity_my),
+        Scenario("profile", 1, "GET", "/users/profile", profile),
+        # writes
+        Scenario("feed", 5, "POST", "/activity/", feed),
+        Scenario("condition", 2, "PUT", "/pins/{location_id}/condition", condition),
+        Scenario("new_cat", 1, "POST", "/cats/", new_cat),
+        Scenario("adoption_request", 1, "POST", "/adoption-requests/", adoption_request),
+        Scenario("login", 1, "POST", "/users/login", login),
+    ]
+
+
+def _percentile(sorted_values: list[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * pct / 100
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except Exception:
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Safepaws API benchmark")
+    parser.add_argument("--db", default="sqlite:///bench.db", help="database URL (SQLite file or local MySQL)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--requests", type=int, default=3000)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--warmup", type=int, default=100)
+    parser.add_argument("--no-seed", action="store_true",
+                        help="reuse the data already in --db, e.g. after benchmarks.dataset restore")
+    parser.add_argument("--out", help="write the JSON report here instead of stdout")
+    for name, default in DEFAULT_SIZES.items():
+        parser.add_argument(f"--n-{name}", dest=f"n_{name}", type=int, default=default,
+                            help=f"number of {name} to seed")
+    args = parser.parse_args(argv)
+
+    os.environ["DATABASE_URL"] = args.db
+    # every bench request comes from the same client address
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+    from fastapi.testclient import TestClient
+    from sqlalchemy import event
+    from app.core.context import current_route
+    from app.db.session import engine
+    from app.main import app
+    from benchmarks.dataset import generate, resolve_sizes
+
+    sizes = {name: getattr(args, f"n_{name}") for name in DEFAULT_SIZES}
+    if args.no_seed:
+        sizes = resolve_sizes(sizes)
+    else:
+        sizes = generate(engine, sizes, args.seed)
+
+    # SQL statements per route template
+    statements: dict[str, int] = defaultdict(int)
+    stmt_lock = threading.Lock()
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _count(conn, cursor, statement, parameters, context, executemany):
+        route = current_route()
+        with stmt_lock:
+            statements[route] += 1
+
+    world = dict(sizes)
+    with TestClient(app) as client:
+        world["tokens"] = {}
+        for user_id in range(1, sizes["users"] + 1):
+            resp = client.post("/users/login", json={"username": f"user{user_id}", "password": BENCH_PASSWORD})
+            resp.raise_for_status()
+            world["tokens"][user_id] = resp.json()["access_token"]
+
+    scenarios = _scenarios()
+    weights = [s.weight for s in scenarios]
+    rng = random.Random(args.seed)
+    plan = [rng.choices(scenarios, weights)[0] for _ in range(args.warmup + args.requests)]
+    # per-request rng seeds keep request bodies deterministic regardless of thread interleaving
+    seeds = [rng.randrange(1 << 30) for _ in plan]
+
+    latencies: dict[str, list[float]] = defaultdict(list)
+    errors: dict[str, int] = defaultdict(int)
+    result_lock = threading.Lock()
+    local = threading.local()
+
+    def run_one(i):
+        scenario = plan[i]
+        client = getattr(local, "client", None)
+        if client is None:
+            client = local.client = TestClient(app)
+        path, kwargs = scenario.build(random.Random(seeds[i]), world)
+        start = time.perf_counter()
+        resp = client.request(scenario.method, path, **kwargs)
+        elapsed = time.perf_counter() - start
+        if i < args.warmup:
+            return
+        with result_lock:
+            latencies[scenario.route].append(elapsed)
+            if resp.status_code >= 500:
+                errors[scenario.route] += 1
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(run_one, range(args.warmup)))
+        with stmt_lock:
+            statements.clear()
+        started = time.perf_counter()
+        list(pool.map(run_one, range(args.warmup, len(plan))))
+        wall = time.perf_counter() - started
+
+    routes = {}
+    for scenario in scenarios:
+        values = sorted(latencies.get(scenario.route, []))
+        if not values:
+            continue
+        key = f"{scenario.method} {scenario.route}"
+        routes[key] = {
+            "count": len(values),
+            "errors": errors.get(scenario.route, 0),
+            "mean_ms": round(sum(values) / len(values) * 1000, 3),
+            "p50_ms": round(_percentile(values, 50) * 1000, 3),
+            "p95_ms": round(_percentile(values, 95) * 1000, 3),
+            "p99_ms": round(_percentile(values, 99) * 1000, 3),
+            "statements_per_request": round(statements.get(scenario.route, 0) / len(values), 2),
+        }
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "db": engine.dialect.name,
+            "seed": args.seed,
+            "sizes": sizes,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "python": sys.version.split()[0],
+        },
+        "throughput_rps": round(args.requests / wall, 2) if wall else 0.0,
+        "wall_seconds": round(wall, 3),
+        "routes": routes,
+    }
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as fh:
+            fh.write(text + "\n")
+    else:
+        print(text)
+    return report
+
+
+if __name__ == "__main__":
+    main()